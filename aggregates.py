@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+
+# Abreviaturas de mes usadas en las etiquetas 'Mes_Año' (equivalente a '%b-%Y')
+MONTH_ABBR = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def period_label(period):
+    """
+    Etiqueta de visualización de un periodo entero, p.ej. 'Jan-2025'
+    """
+    year, month = divmod(int(period) - 1, 12)
+    return f"{MONTH_ABBR[month]}-{year}"
+
+
+# Los importes se guardan como enteros en céntimos: las sumas son exactas y solo
+# se pasa a euros (float) una vez, al construir el cubo y las series por fecha
+CENTS = 100
+
+
+def to_cents(values):
+    """
+    Importes en euros a céntimos enteros (int64), redondeados al céntimo
+    """
+    return values.mul(CENTS).round().astype('int64')
+
+
+def from_cents(values):
+    """
+    Céntimos (enteros o sumas de céntimos) a euros
+    """
+    return values / CENTS
+
+
+AGGREGATE_KEYS = ['Periodo', 'Tipo', 'Categoria']
+AGGREGATE_MEASURES = ['ingresos', 'gastos', 'importe', 'count']
+
+
+def combine_aggregates(frames):
+    """
+    Suma celdas agregadas de transacciones (de varios trozos o fuentes)
+    """
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=AGGREGATE_KEYS + AGGREGATE_MEASURES)
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(AGGREGATE_KEYS, as_index=False, dropna=False, sort=False, observed=True)[AGGREGATE_MEASURES]
+        .sum()
+    )
+
+
+class TransactionsCube:
+    """
+    Agregado denso mes × Tipo × Categoria de las transacciones.
+    Cada celda guarda ingresos (importes > 0), gastos (|importes < 0|),
+    importe neto (en euros) y número de movimientos. Los totales se devuelven como
+    escalares numpy para que las divisiones entre cero den inf/nan como antes
+    """
+
+    def __init__(self, periods, tipos, categorias, ingresos, gastos, importe, count):
+        self.periods = periods
+        self.tipos = tipos
+        self.categorias = categorias
+        self.ingresos = ingresos
+        self.gastos = gastos
+        self.importe = importe
+        self.count = count
+
+    @classmethod
+    def from_transactions(cls, df):
+        """
+        Construye el cubo con un único bincount sobre los códigos de cada dimensión
+        """
+        importe = df['Importe'].to_numpy(dtype=np.float64)
+        return cls._from_cells(df, {
+            'ingresos': np.where(importe > 0, importe, 0.0),
+            'gastos': np.where(importe < 0, -importe, 0.0),
+            'importe': importe,
+            'count': None,
+        })
+
+    @classmethod
+    def from_aggregates(cls, agg):
+        """
+        Construye el cubo a partir de celdas ya agregadas (ver aggregate)
+        """
+        return cls._from_cells(agg, {measure: agg[measure].to_numpy(dtype=np.float64)
+                                     for measure in AGGREGATE_MEASURES})
+
+    @classmethod
+    def _from_cells(cls, df, weights):
+        tipo_col = df['Tipo'] if 'Tipo' in df.columns else pd.Series('', index=df.index)
+        tipo_codes, tipos = pd.factorize(tipo_col, sort=True, use_na_sentinel=False)
+        cat_codes, categorias = pd.factorize(df['Categoria'], sort=True, use_na_sentinel=False)
+        return cls.from_codes(df['Periodo'].to_numpy(), tipo_codes, tipos, cat_codes, categorias, weights)
+
+    @classmethod
+    def from_codes(cls, periods_col, tipo_codes, tipos, cat_codes, categorias, weights):
+        """
+        Construye el cubo a partir de columnas ya codificadas (códigos de Tipo y
+        Categoria sobre sus etiquetas). Los pesos de importe van en céntimos;
+        weights['count'] a None cuenta una por fila
+        """
+        first, last = periods_col.min(), periods_col.max()
+        periods = np.arange(first, last + 1, dtype=np.int64)
+
+        shape = (len(periods), len(tipos), len(categorias))
+        flat = np.ravel_multi_index((periods_col - first, tipo_codes, cat_codes), shape)
+        size = int(np.prod(shape))
+
+        def cube(values):
+            return np.bincount(flat, weights=values, minlength=size).reshape(shape)
+
+        return cls(
+            periods=periods,
+            tipos=np.asarray(tipos, dtype=object),
+            categorias=np.asarray(categorias, dtype=object),
+            ingresos=from_cents(cube(weights['ingresos'])),
+            gastos=from_cents(cube(weights['gastos'])),
+            importe=from_cents(cube(weights['importe'])),
+            count=cube(weights['count']).astype(np.int64),
+        )
+
+    @staticmethod
+    def aggregate(df):
+        """
+        Agrega transacciones por (Periodo, Tipo, Categoria). El resultado ocupa
+        meses × tipos × categorías filas, sin importar cuántas transacciones haya.
+        Las medidas de importe quedan en céntimos enteros
+        """
+        importe = df['Importe']
+        cells = pd.DataFrame({
+            'Periodo': df['Periodo'],
+            'Tipo': df['Tipo'] if 'Tipo' in df.columns else '',
+            'Categoria': df['Categoria'],
+            'ingresos': importe.where(importe > 0, 0),
+            'gastos': (-importe).where(importe < 0, 0),
+            'importe': importe,
+            'count': 1,
+        })
+        return combine_aggregates([cells])
+
+    @property
+    def nbytes(self):
+        arrays = (self.periods, self.ingresos, self.gastos, self.importe, self.count)
+        return sum(a.nbytes for a in arrays)
+
+    @property
+    def last_period(self):
+        return int(self.periods[-1])
+
+    def period_index(self, period):
+        """
+        Posición de un periodo en el cubo, o None si queda fuera del rango
+        """
+        idx = int(period) - int(self.periods[0])
+        if 0 <= idx < len(self.periods):
+            return idx
+        return None
+
+    def _period_slice(self, values, period):
+        idx = self.period_index(period)
+        if idx is None:
+            return np.zeros(values.shape[1:])
+        return values[idx]
+
+    def ingresos_total(self, period):
+        return self._period_slice(self.ingresos, period).sum()
+
+    def gastos_total(self, period):
+        return self._period_slice(self.gastos, period).sum()
+
+    def by_period_tipo(self):
+        """
+        Importe neto por periodo y Tipo, solo para combinaciones con movimientos
+        """
+        importe = self.importe.sum(axis=2)
+        present = self.count.sum(axis=2) > 0
+        p_idx, t_idx = np.nonzero(present)
+        return pd.DataFrame({
+            'Periodo': self.periods[p_idx],
+            'Tipo': self.tipos[t_idx],
+            'Importe': importe[p_idx, t_idx],
+        })
+
+    def last_period_for_tipo(self, tipo):
+        t_idx = np.flatnonzero(self.tipos == tipo)
+        if len(t_idx) == 0:
+            return None
+        active = np.flatnonzero(self.count[:, t_idx[0], :].sum(axis=1) > 0)
+        return int(self.periods[active[-1]]) if len(active) else None
+
+    def by_categoria(self, period, tipo=None):
+        """
+        Importe neto por Categoria en un periodo, opcionalmente de un único Tipo
+        """
+        idx = self.period_index(period)
+        if idx is None:
+            return pd.DataFrame({'Categoria': [], 'Importe': []})
+        importe, count = self.importe[idx], self.count[idx]
+        if tipo is not None:
+            t_mask = self.tipos == tipo
+            importe, count = importe[t_mask], count[t_mask]
+        present = count.sum(axis=0) > 0
+        return pd.DataFrame({
+            'Categoria': self.categorias[present],
+            'Importe': importe.sum(axis=0)[present],
+        })
+
+    def gastos_by_categoria(self, period):
+        """
+        Gastos (importes negativos en valor absoluto) por Categoria en un periodo
+        """
+        idx = self.period_index(period)
+        if idx is None:
+            return pd.DataFrame({'Categoria': [], 'Importe': []})
+        gastos = self.gastos[idx].sum(axis=0)
+        present = gastos > 0
+        return pd.DataFrame({'Categoria': self.categorias[present], 'Importe': gastos[present]})
+
+
+class DateSeries:
+    """
+    Series de totales por fecha (ordenadas) de una tabla en formato largo,
+    con el desglose por categoría de la primera medida. Las medidas de la tabla
+    van en céntimos y los totales se guardan en euros
+    """
+
+    def __init__(self, dates, periods, totals, category_labels=None, category_totals=None):
+        self.dates = dates
+        self.periods = periods
+        self.totals = totals
+        self.category_labels = category_labels if category_labels is not None else np.array([], dtype=object)
+        self.category_totals = category_totals if category_totals is not None else np.zeros((0, len(dates)))
+        self._period_index = {int(p): i for i, p in enumerate(periods)}
+        self._category_index = {label: i for i, label in enumerate(self.category_labels)}
+
+    @classmethod
+    def from_frame(cls, df, measures, category=None):
+        date_codes, dates = pd.factorize(df['Fecha'], sort=True)
+        n_dates = len(dates)
+        totals = {
+            measure: from_cents(np.bincount(date_codes, weights=df[measure].to_numpy(dtype=np.float64),
+                                            minlength=n_dates))
+            for measure in measures
+        }
+
+        category_labels = category_totals = None
+        if category is not None and category in df.columns:
+            cat_codes, category_labels = pd.factorize(df[category], sort=True, use_na_sentinel=False)
+            flat = cat_codes * n_dates + date_codes
+            category_totals = from_cents(np.bincount(
+                flat, weights=df[measures[0]].to_numpy(dtype=np.float64),
+                minlength=len(category_labels) * n_dates
+            ).reshape(len(category_labels), n_dates))
+            category_labels = np.asarray(category_labels, dtype=object)
+
+        dates = pd.DatetimeIndex(dates)
+        periods = (dates.year * 12 + dates.month).to_numpy(dtype=np.int64)
+        return cls(dates.to_numpy(), periods, totals, category_labels, category_totals)
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.category_totals.nbytes + sum(a.nbytes for a in self.totals.values())
+
+    def __len__(self):
+        return len(self.dates)
+
+    def position(self, date=None):
+        """
+        Índice de la fecha evaluada: la última fecha, la de un periodo entero
+        o la última fecha no posterior a la dada. None si no hay ninguna
+        """
+        if date is None:
+            idx = len(self.dates) - 1
+        elif isinstance(date, (int, np.integer)):
+            idx = self._period_index.get(int(date), -1)
+        else:
+            idx = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date)), side='right')) - 1
+        return idx if idx >= 0 else None
+
+    def value(self, measure, date=None, offset=0):
+        """
+        Total de una medida en la fecha evaluada (offset=-1 para la anterior)
+        """
+        idx = self.position(date)
+        if idx is None or not 0 <= idx + offset < len(self.dates):
+            return np.float64(0.0)
+        return self.totals[measure][idx + offset]
+
+    def category_value(self, label, date=None, offset=0):
+        """
+        Total de la primera medida para una categoría en la fecha evaluada
+        """
+        idx = self.position(date)
+        row = self._category_index.get(label)
+        if idx is None or row is None or not 0 <= idx + offset < len(self.dates):
+            return np.float64(0.0)
+        return self.category_totals[row, idx + offset]
+
+    def frame(self):
+        """
+        Totales por fecha como DataFrame, listo para gráficos
+        """
+        return pd.DataFrame({'Fecha': self.dates, **self.totals})
+
+    def category_frame(self, category, measure):
+        """
+        Totales de la primera medida por fecha y categoría en formato largo
+        """
+        n_labels, n_dates = self.category_totals.shape
+        return pd.DataFrame({
+            'Fecha': np.tile(self.dates, n_labels),
+            category: np.repeat(self.category_labels, n_dates),
+            measure: self.category_totals.ravel(),
+        })
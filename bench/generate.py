@@ -0,0 +1,159 @@
+"""
+Generador de libros de finanzas sintéticos con la estructura que espera
+utils.load_and_process_data: hoja Transacciones en filas y hojas Presupuesto,
+Activos, Deudas e Inversiones con una columna por mes (cabeceras fecha con
+formato 'mmm-yy') y las filas Títulos / Precio medio / Precio actual.
+
+    python bench/generate.py libro.xlsx --transacciones 100000 --meses 60 --cuentas 50
+
+Excel admite como mucho 1.048.576 filas por hoja: las transacciones que no caben
+se escriben en un CSV de exportación bancaria junto al libro (libro.csv), que
+se carga con csv_ingest
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+
+EXCEL_MAX_ROWS = 1_048_576
+
+GASTOS = ['Vivienda', 'Comida', 'Ocio', 'Transporte', 'Salud', 'Suministros', 'Seguros', 'Ropa']
+INGRESOS = ['Nómina', 'Extras', 'Intereses']
+ENTIDADES = ['BBVA', 'ING', 'Santander', 'CaixaBank', 'Openbank']
+TIPOS_CUENTA = ['Corriente', 'Ahorro', 'Depósito']
+TIPOS_DEUDA = ['Hipoteca', 'Préstamo', 'Tarjeta']
+CATEGORIAS_INVERSION = ['Renta Variable', 'Renta Fija', 'Monetario']
+BLOCK_ROWS = 200_000
+
+
+def transactions_block(rng, months, n, offset=0):
+    """
+    Bloque de n transacciones aleatorias: ~15% ingresos, el resto gastos
+    """
+    month_idx = rng.integers(len(months), size=n)
+    fechas = months.to_numpy()[month_idx] + rng.integers(28, size=n).astype('timedelta64[D]')
+    ingreso = rng.random(n) < 0.15
+    categoria = np.where(ingreso, np.array(INGRESOS)[rng.integers(len(INGRESOS), size=n)],
+                         np.array(GASTOS)[rng.integers(len(GASTOS), size=n)])
+    importe = np.where(ingreso, rng.uniform(500, 3000, n), -rng.lognormal(3.5, 1.0, n)).round(2)
+    return pd.DataFrame({
+        'Fecha': fechas,
+        'Categoria': categoria,
+        'Nombre': [f'mov{i % 500}' for i in range(offset, offset + n)],
+        'Tipo': np.where(ingreso, 'Ingreso', 'Gasto'),
+        'Importe': importe,
+        'Cuenta': np.array(ENTIDADES)[rng.integers(len(ENTIDADES), size=n)],
+    })
+
+
+def _date_header(ws, ids, months):
+    row = list(ids)
+    for month in months:
+        cell = WriteOnlyCell(ws, value=month.to_pydatetime())
+        cell.number_format = 'mmm-yy'
+        row.append(cell)
+    ws.append(row)
+
+
+def _write_csv(path, rng, months, n, offset):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Fecha', 'Categoria', 'Nombre', 'Tipo', 'Importe', 'Cuenta'])
+        for start in range(0, n, BLOCK_ROWS):
+            block = transactions_block(rng, months, min(BLOCK_ROWS, n - start), offset + start)
+            block['Fecha'] = block['Fecha'].dt.strftime('%d/%m/%Y')
+            block['Importe'] = block['Importe'].map(lambda v: f'{v:.2f}'.replace('.', ','))
+            writer.writerows(block.itertuples(index=False))
+
+
+def generate_workbook(path, n_tx=2000, n_months=24, n_accounts=6, n_debts=2, n_investments=5,
+                      start='2020-01-01', extra_sheets=True, seed=0):
+    """
+    Escribe un libro sintético en path. Devuelve la ruta del CSV con las
+    transacciones que no caben en la hoja, o None
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=n_months, freq='MS')
+    wb = openpyxl.Workbook(write_only=True)
+
+    in_sheet = min(n_tx, EXCEL_MAX_ROWS - 1)
+    ws = wb.create_sheet('Transacciones')
+    ws.append(['Fecha', 'Categoria', 'Nombre', 'Tipo', 'Importe', 'Cuenta'])
+    for start_row in range(0, in_sheet, BLOCK_ROWS):
+        block = transactions_block(rng, months, min(BLOCK_ROWS, in_sheet - start_row), start_row)
+        block['Fecha'] = block['Fecha'].dt.to_pydatetime()
+        for row in block.itertuples(index=False):
+            ws.append(list(row))
+
+    ws = wb.create_sheet('Presupuesto')
+    _date_header(ws, ['Cuenta', 'Categoria', 'Tipo'], months)
+    for i, categoria in enumerate(GASTOS):
+        ws.append([ENTIDADES[i % len(ENTIDADES)], categoria, 'Gasto']
+                  + rng.integers(-600, -100, n_months).astype(float).tolist())
+    for categoria in INGRESOS[:1]:
+        ws.append([ENTIDADES[0], categoria, 'Ingreso'] + [2500.0] * n_months)
+
+    ws = wb.create_sheet('Activos')
+    _date_header(ws, ['Nombre', 'Tipo de Cuenta'], months)
+    for i in range(n_accounts):
+        saldo = np.maximum(rng.uniform(1000, 20000) + np.cumsum(rng.normal(100, 800, n_months)), 0).round(2)
+        ws.append([f'{ENTIDADES[i % len(ENTIDADES)]} {i}', TIPOS_CUENTA[i % len(TIPOS_CUENTA)]] + saldo.tolist())
+
+    ws = wb.create_sheet('Deudas')
+    _date_header(ws, ['Nombre', 'Tipo de Deuda'], months)
+    for i in range(n_debts):
+        principal = rng.uniform(5000, 200000)
+        pendiente = np.maximum(principal - principal / max(n_months, 1) * 0.5 * np.arange(n_months), 0).round(2)
+        ws.append([f'Deuda {i}', TIPOS_DEUDA[i % len(TIPOS_DEUDA)]] + pendiente.tolist())
+
+    ws = wb.create_sheet('Inversiones')
+    _date_header(ws, ['Tipo de Activo', 'Nombre', 'Categoría', 'Métrica'], months)
+    for i in range(n_investments):
+        titulos = np.cumsum(rng.integers(0, 3, n_months)) + 1.0
+        precio_medio = 100 + np.cumsum(rng.normal(0, 1, n_months))
+        precio_actual = precio_medio * (1 + rng.normal(0.05, 0.05, n_months))
+        # Como en los libros reales, los ids solo aparecen en la primera fila de cada activo
+        ws.append(['Fondo', f'Fondo {i}', CATEGORIAS_INVERSION[i % len(CATEGORIAS_INVERSION)], 'Títulos']
+                  + titulos.tolist())
+        ws.append([None, None, None, 'Precio medio'] + precio_medio.round(4).tolist())
+        ws.append([None, None, None, 'Precio actual'] + precio_actual.round(4).tolist())
+
+    if extra_sheets:
+        # Hoja que la aplicación no usa, para medir que se ignora
+        ws = wb.create_sheet('Notas')
+        ws.append(['Nota', 'Texto'])
+        for i in range(100):
+            ws.append([i, 'x' * 20])
+
+    wb.save(path)
+
+    csv_path = None
+    if n_tx > in_sheet:
+        csv_path = os.path.splitext(path)[0] + '.csv'
+        _write_csv(csv_path, rng, months, n_tx - in_sheet, in_sheet)
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un libro de finanzas sintético")
+    parser.add_argument('salida', help="Ruta del libro .xlsx")
+    parser.add_argument('--transacciones', type=int, default=2000)
+    parser.add_argument('--meses', type=int, default=24)
+    parser.add_argument('--cuentas', type=int, default=6)
+    parser.add_argument('--deudas', type=int, default=2)
+    parser.add_argument('--inversiones', type=int, default=5)
+    parser.add_argument('--inicio', default='2020-01-01', help="Primer mes")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    csv_path = generate_workbook(args.salida, args.transacciones, args.meses, args.cuentas, args.deudas,
+                                 args.inversiones, args.inicio, seed=args.semilla)
+    print(args.salida + (f" + {csv_path}" if csv_path else ''))
+
+
+if __name__ == '__main__':
+    main()
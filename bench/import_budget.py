@@ -0,0 +1,81 @@
+"""
+Comprobación del tiempo de arranque: importa los módulos de entrada en un proceso
+nuevo y falla (código de salida 1) si superan su presupuesto de tiempo o cargan
+módulos pesados que deberían importarse solo cuando se usan.
+
+    python bench/import_budget.py
+    python bench/import_budget.py --presupuesto-app-ms 80 --repeticiones 5
+
+- app: lo que se importa antes de mostrar el formulario de carga (visuals), sin
+  contar streamlit, que se paga igualmente. No debe cargar pandas, plotly.express...
+- cli: el modo sin interfaz. No debe cargar streamlit, plotly ni altair
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_FORBIDDEN = ['pandas', 'numpy', 'pyarrow', 'plotly.express', 'openpyxl', 'altair', 'streamlit_js_eval']
+CLI_FORBIDDEN = ['streamlit', 'plotly', 'altair']
+
+APP_BUDGET_MS = float(os.environ.get('DASHBOARD_IMPORT_BUDGET_MS', 100))
+CLI_BUDGET_MS = float(os.environ.get('DASHBOARD_CLI_IMPORT_BUDGET_MS', 1500))
+
+# Se ejecuta en un proceso limpio: mide la importación base y la de los módulos propios
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {base!r}:
+    __import__(name)
+base = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+end = time.perf_counter()
+print(json.dumps({{'base_ms': (base - start) * 1000, 'ms': (end - base) * 1000,
+                   'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(modules, base=(), forbidden=(), repeat=3):
+    """
+    Mejor tiempo de importación de modules (tras importar base) entre repeticiones,
+    y módulos prohibidos que quedaron cargados
+    """
+    code = PROBE.format(base=list(base), modules=list(modules), forbidden=list(forbidden))
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(results, key=lambda result: result['ms'])
+    return best['ms'], best['base_ms'], best['loaded']
+
+
+def check(name, modules, base, forbidden, budget_ms, repeat):
+    ms, base_ms, loaded = measure(modules, base, forbidden, repeat)
+    ok = ms <= budget_ms and not loaded
+    base_info = f" (+{base_ms:.0f} ms de {', '.join(base)})" if base else ''
+    print(f"{'OK   ' if ok else 'FALLO'} {name}: {ms:.0f} ms / {budget_ms:.0f} ms{base_info}")
+    if loaded:
+        print(f"      módulos pesados cargados al importar: {', '.join(loaded)}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comprueba el presupuesto de tiempo de importación")
+    parser.add_argument('--presupuesto-app-ms', type=float, default=APP_BUDGET_MS)
+    parser.add_argument('--presupuesto-cli-ms', type=float, default=CLI_BUDGET_MS)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = [
+        check('app', ['visuals'], ['streamlit'], APP_FORBIDDEN, args.presupuesto_app_ms, args.repeticiones),
+        check('cli', ['cli'], [], CLI_FORBIDDEN, args.presupuesto_cli_ms, args.repeticiones),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
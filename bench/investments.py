@@ -0,0 +1,111 @@
+"""
+Benchmark de la hoja Inversiones: process_investments_data (array activo × fecha ×
+métrica) frente al procesado anterior (ffill, melt y pivot_table). Comprueba que
+ambos dan la misma tabla y mide el mejor tiempo de cada uno, y el de calcular
+las rentabilidades TWR y TIR de todos los activos y grupos.
+
+    python bench/investments.py
+    python bench/investments.py --activos 500 --meses 240 --repeticiones 5
+
+La hoja se genera en memoria con la forma que devuelve read_sheet
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+import pandas as pd
+
+from aggregates import to_cents
+from performance import InvestmentPositions
+from utils import (SHEET_COLUMNS, add_period_columns, compact_tables, process_investments_data,
+                   process_transposed_data)
+
+CATEGORIAS = ['Renta Variable', 'Renta Fija', 'Monetario']
+
+
+def investments_sheet(n_assets, n_months, start='2005-01-01', seed=0):
+    """
+    Hoja Inversiones leída: tres filas por activo (Títulos, Precio medio, Precio
+    actual), ids solo en la primera y una columna por mes
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=n_months, freq='MS').to_pydatetime().tolist()
+    titulos = np.cumsum(rng.integers(0, 3, (n_assets, n_months)), axis=1) + 1.0
+    precio_medio = (100 + np.cumsum(rng.normal(0, 1, (n_assets, n_months)), axis=1)).round(4)
+    precio_actual = (precio_medio * (1 + rng.normal(0.05, 0.05, (n_assets, n_months)))).round(4)
+
+    values = np.stack([titulos, precio_medio, precio_actual], axis=1).reshape(n_assets * 3, n_months)
+    first = np.arange(n_assets * 3) % 3 == 0
+    ids = pd.DataFrame({
+        'Tipo de Activo': np.where(first, 'Fondo', None),
+        'Nombre': np.where(first, np.char.add('Fondo ', (np.arange(n_assets * 3) // 3).astype(str)), None),
+        'Categoría': np.where(first, np.array(CATEGORIAS)[(np.arange(n_assets * 3) // 3) % len(CATEGORIAS)], None),
+        'Métrica': np.tile(['Títulos', 'Precio medio', 'Precio actual'], n_assets),
+    }, dtype='str')
+    return pd.concat([ids, pd.DataFrame(values, columns=months)], axis=1)
+
+
+def melt_pivot(df):
+    """
+    Procesado anterior de la hoja, como referencia
+    """
+    inv_df = df.ffill()
+    id_cols = SHEET_COLUMNS['Inversiones']
+    date_cols = [col for col in inv_df.columns if col not in id_cols]
+    available_id_cols = [col for col in id_cols if col in inv_df.columns]
+    inv_df = process_transposed_data(inv_df, date_cols, available_id_cols)
+    inv_df = inv_df.pivot_table(
+        index=["Tipo de Activo", "Nombre", "Categoría", "Fecha"],
+        columns="Métrica",
+        values="Valor",
+        aggfunc="sum",
+        fill_value=0
+    ).reset_index().rename_axis(columns=None)
+    inv_df['Valor Actual'] = to_cents(inv_df['Títulos']*inv_df['Precio actual'])
+    inv_df['Valor Compra'] = to_cents(inv_df['Títulos']*inv_df['Precio medio'])
+    return inv_df
+
+
+def best_time(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df.copy())
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def returns(df):
+    """
+    Tabla de rentabilidades desde la hoja procesada, como la calcula el dashboard
+    """
+    inversiones = compact_tables({'inversiones': add_period_columns(df)})['inversiones']
+    return InvestmentPositions.from_frame(inversiones).returns()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del procesado de la hoja Inversiones")
+    parser.add_argument('--activos', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--meses', type=int, default=240)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'activos':>8} {'meses':>6} {'filas':>8} {'melt+pivot':>11} {'arrays':>9} {'relación':>9} "
+          f"{'TWR+TIR':>9}")
+    for n_assets in args.activos:
+        df = investments_sheet(n_assets, args.meses)
+        old_s, expected = best_time(melt_pivot, df, args.repeticiones)
+        new_s, result = best_time(process_investments_data, df, args.repeticiones)
+        pd.testing.assert_frame_equal(result, expected)
+        returns_s, _ = best_time(returns, result, args.repeticiones)
+        print(f"{n_assets:>8} {args.meses:>6} {len(result):>8} {old_s * 1000:>9.1f}ms {new_s * 1000:>7.1f}ms "
+              f"{old_s / new_s:>8.1f}x {returns_s * 1000:>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
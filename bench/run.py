@@ -0,0 +1,251 @@
+"""
+Benchmark de todo el procesado: lectura del libro, normalización de cada hoja
+(melt de las hojas transpuestas y reordenado de Inversiones en arrays), modelo y vistas,
+cada KPI y cada gráfico create_*. Mide el tiempo y el pico de memoria de cada
+etapa, y la memoria que ocupan las tablas ya cargadas, y guarda los resultados
+en bench/results (no versionado: los tiempos dependen de la máquina) para
+compararlos entre commits.
+
+    python bench/run.py --escenario s m
+    python bench/run.py --comparar bench/results/a.json bench/results/b.json
+
+Los libros se generan una vez y se guardan en bench/.data
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+
+from csv_ingest import aggregate_csv, attach_csv_transactions
+from generate import generate_workbook
+from kpis import chart_data, investment_kpis, saldo_kpis, summary_kpis
+from model import FinanceData
+from utils import assemble_tables, process_sheet, read_file_bytes, read_workbook
+
+DATA_DIR = os.path.join(BENCH_DIR, '.data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# Escenarios: transacciones, meses, cuentas, inversiones
+SCENARIOS = {
+    'xs': dict(n_tx=1_000, n_months=24, n_accounts=10, n_investments=5),
+    's': dict(n_tx=20_000, n_months=60, n_accounts=30, n_investments=10),
+    'm': dict(n_tx=200_000, n_months=120, n_accounts=100, n_investments=20),
+    'l': dict(n_tx=1_000_000, n_months=240, n_accounts=300, n_investments=50),
+    'xl': dict(n_tx=10_000_000, n_months=240, n_accounts=500, n_investments=100),
+}
+
+CHART_BUILDERS = ('create_transactions_charts', 'create_balance_chart', 'create_debt_chart',
+                  'create_investment_chart', 'create_budget_analysis')
+CHART_HEIGHT = 400
+
+
+class StageTimer:
+    """
+    Tiempo de cada etapa y, con trace_memory, el pico de memoria que añade
+    (asignaciones de Python y numpy seguidas por tracemalloc, que debe estar activo)
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - before if self.trace_memory else 0
+        self.stages.append({'etapa': name, 'segundos': round(seconds, 6), 'pico_mb': round(peak / 1024 ** 2, 2)})
+
+
+def scenario_paths(name):
+    """
+    Libro (y CSV si las transacciones no caben en Excel) de un escenario, generándolo si no existe
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'{name}.xlsx')
+    csv_path = os.path.splitext(path)[0] + '.csv'
+    if not os.path.exists(path):
+        print(f"Generando escenario {name}...", file=sys.stderr)
+        csv_path = generate_workbook(path, **SCENARIOS[name])
+    return path, csv_path if csv_path and os.path.exists(csv_path) else None
+
+
+def run_pipeline(path, csv_path=None, charts=True, trace_memory=False):
+    """
+    Ejecuta todas las etapas. Devuelve sus tiempos y los MB de cada tabla cargada
+    """
+    timer = StageTimer(trace_memory)
+
+    with timer.stage('lectura'):
+        raw = read_file_bytes(path)
+        sheets = read_workbook(raw)
+
+    normalized = {}
+    for name, df in sheets.items():
+        stage = {'Transacciones': 'transacciones', 'Inversiones': 'arrays Inversiones'}.get(name, f'melt {name}')
+        with timer.stage(stage):
+            normalized[name] = process_sheet(name, df.copy())
+
+    with timer.stage('ensamblado'):
+        data = FinanceData.from_tables(assemble_tables(normalized), key='bench')
+    tables_mb = {name: round(size / 1024 ** 2, 3) for name, size in data.memory_usage().items()}
+
+    if csv_path:
+        with timer.stage('csv'):
+            cells, _, _ = aggregate_csv(csv_path)
+            data = attach_csv_transactions(data, cells, 'bench-csv', replace_periods=False)
+
+    with timer.stage('cubo'):
+        data.cubo
+    with timer.stage('series'):
+        data.serie_saldos, data.serie_deudas, data.serie_inversiones
+
+    for func in (summary_kpis, saldo_kpis, investment_kpis, chart_data):
+        with timer.stage(func.__name__):
+            func(data)
+
+    if charts:
+        # Los constructores se llaman sin la caché de figuras (__wrapped__)
+        import visuals
+        for name in CHART_BUILDERS:
+            builder = getattr(visuals, name).__wrapped__
+            with timer.stage(name):
+                builder(data, chart_height=CHART_HEIGHT)
+
+    return timer.stages, tables_mb
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_scenario(name, repeat=1, charts=True, trace_memory=True):
+    """
+    Mejor tiempo de cada etapa entre repeticiones. La memoria se mide en una pasada
+    aparte porque tracemalloc ralentiza mucho la lectura y falsearía los tiempos
+    """
+    path, csv_path = scenario_paths(name)
+    runs, tables_mb = [], None
+    for _ in range(repeat):
+        stages, tables_mb = run_pipeline(path, csv_path, charts)
+        runs.append(stages)
+    memory = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            memory = run_pipeline(path, csv_path, charts, trace_memory=True)[0]
+        finally:
+            tracemalloc.stop()
+
+    stages = []
+    for i, stage in enumerate(runs[0]):
+        stages.append({
+            'etapa': stage['etapa'],
+            'segundos': min(run[i]['segundos'] for run in runs),
+            'pico_mb': memory[i]['pico_mb'] if memory else None,
+        })
+    return {
+        'escenario': name,
+        'parametros': SCENARIOS[name],
+        'commit': git_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'repeticiones': repeat,
+        'memoria': trace_memory,
+        'etapas': stages,
+        'tablas_mb': tables_mb,
+        'total_segundos': round(sum(stage['segundos'] for stage in stages), 6),
+    }
+
+
+def save_result(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit'] or 'sin-commit'}-{result['escenario']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def print_result(result):
+    print(f"\nEscenario {result['escenario']} ({result['commit']}) {result['parametros']}")
+    for stage in result['etapas']:
+        memory = f"{stage['pico_mb']:>10.1f} MB" if stage['pico_mb'] is not None else ''
+        print(f"  {stage['etapa']:<28} {stage['segundos']:>10.4f} s {memory}")
+    print(f"  {'total':<28} {result['total_segundos']:>10.4f} s")
+    tables_mb = result.get('tablas_mb') or {}
+    if tables_mb:
+        sizes = ' · '.join(f"{name} {size:.2f}" for name, size in tables_mb.items() if size)
+        print(f"  memoria de tablas: {sum(tables_mb.values()):.2f} MB ({sizes})")
+
+
+def compare(base_path, new_path):
+    """
+    Tabla de etapas de dos resultados con la relación de tiempos nuevo/base
+    """
+    with open(base_path, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+
+    # Etapas renombradas: los resultados antiguos se comparan con su nombre nuevo
+    renamed = {'pivot Inversiones': 'arrays Inversiones'}
+    base_stages = {renamed.get(stage['etapa'], stage['etapa']): stage for stage in base['etapas']}
+    print(f"{'etapa':<28} {base['commit'] or 'base':>10} {new['commit'] or 'nuevo':>10} {'relación':>9} {'pico MB':>17}")
+    for stage in new['etapas']:
+        old = base_stages.get(stage['etapa'])
+        if old is None:
+            print(f"{stage['etapa']:<28} {'-':>10} {stage['segundos']:>10.4f}")
+            continue
+        ratio = stage['segundos'] / old['segundos'] if old['segundos'] else float('inf')
+        memory = f"{old['pico_mb']:>8.1f}→{stage['pico_mb']:<8.1f}" if old['pico_mb'] is not None and stage['pico_mb'] is not None else ''
+        print(f"{stage['etapa']:<28} {old['segundos']:>10.4f} {stage['segundos']:>10.4f} {ratio:>8.2f}x {memory}")
+    print(f"{'total':<28} {base['total_segundos']:>10.4f} {new['total_segundos']:>10.4f}")
+    if base.get('tablas_mb') and new.get('tablas_mb'):
+        print(f"{'memoria de tablas (MB)':<28} {sum(base['tablas_mb'].values()):>10.2f} {sum(new['tablas_mb'].values()):>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del procesado del dashboard")
+    parser.add_argument('--escenario', nargs='+', default=['xs', 's'], choices=list(SCENARIOS))
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--sin-graficos', action='store_true', help="No mide los create_* (no importa streamlit)")
+    parser.add_argument('--sin-memoria', action='store_true', help="Sin la pasada de memoria con tracemalloc")
+    parser.add_argument('--no-guardar', action='store_true')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVO'), help="Compara dos resultados guardados")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        compare(*args.comparar)
+        return
+
+    for name in args.escenario:
+        result = run_scenario(name, args.repeticiones, charts=not args.sin_graficos, trace_memory=not args.sin_memoria)
+        print_result(result)
+        if not args.no_guardar:
+            print(f"  guardado en {os.path.relpath(save_result(result), ROOT_DIR)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark de varias sesiones simultáneas en un mismo servidor: cada sesión (un
+hilo, como en Streamlit) abre un libro y calcula sus KPIs y gráficos. Compara una
+caché por sesión (el comportamiento anterior) con la caché compartida del proceso:
+cuántas veces se procesa cada libro, la tasa de aciertos y la memoria que ocupa la caché.
+
+    python bench/sessions.py
+    python bench/sessions.py --escenario s --sesiones 1 4 16 --libros 2
+
+Los libros son los de bench/run.py (se generan en bench/.data si no existen)
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from cache import LRUCache
+from kpis import all_kpis, chart_data
+from run import scenario_paths
+from utils import load_and_process_data
+
+
+def session(path, cache):
+    data = load_and_process_data(path, cache=cache, use_snapshots=False)
+    all_kpis(data)
+    chart_data(data)
+    cache.remeasure(data)
+
+
+def run_sessions(paths, n_sessions, shared):
+    """
+    n_sessions sesiones simultáneas repartidas entre los libros. Devuelve
+    (segundos, libros procesados, aciertos, MB en caché)
+    """
+    shared_cache = LRUCache()
+    caches = [shared_cache if shared else LRUCache() for _ in range(n_sessions)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_sessions) as pool:
+        list(pool.map(lambda i: session(paths[i % len(paths)], caches[i]), range(n_sessions)))
+    seconds = time.perf_counter() - start
+    unique = {id(cache): cache for cache in caches}.values()
+    builds = sum(cache.misses for cache in unique)
+    hits = sum(cache.hits for cache in unique)
+    mb = sum(cache.current_bytes for cache in unique) / 1024 ** 2
+    return seconds, builds, hits, mb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de sesiones simultáneas con caché compartida")
+    parser.add_argument('--escenario', default='xs')
+    parser.add_argument('--sesiones', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--libros', type=int, default=1, help="Libros distintos entre los que se reparten")
+    args = parser.parse_args(argv)
+
+    path, _ = scenario_paths(args.escenario)
+    # Copias con otro contenido (otra huella) para simular hogares distintos
+    paths = [path]
+    for i in range(1, args.libros):
+        copy_path = os.path.join(os.path.dirname(path), f'{args.escenario}-{i}.xlsx')
+        if not os.path.exists(copy_path):
+            with open(path, 'rb') as src, open(copy_path, 'wb') as dst:
+                dst.write(src.read() + bytes(i))
+        paths.append(copy_path)
+
+    print(f"{'sesiones':>8} {'caché':>11} {'segundos':>9} {'procesados':>10} {'aciertos':>9} {'MB':>8}")
+    for n_sessions in args.sesiones:
+        for shared in (False, True):
+            seconds, builds, hits, mb = run_sessions(paths, n_sessions, shared)
+            print(f"{n_sessions:>8} {'compartida' if shared else 'por sesión':>11} {seconds:>9.2f} "
+                  f"{builds:>10} {hits:>9} {mb:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import from_cents, period_label
+
+# Categorías que entran en la comparación: con presupuesto y movimientos (inner),
+# solo con presupuesto (left) o cualquiera de las dos (outer)
+JOIN_MODES = ('inner', 'left', 'outer')
+
+
+class BudgetMatrix:
+    """
+    Presupuesto y real por mes y Categoria en matrices alineadas periodo × categoría
+    (en euros) sobre la unión de las categorías de presupuesto y transacciones, de
+    modo que una categoría con gasto y sin presupuesto no se pierde. Se guardan las
+    sumas acumuladas por periodo: un mes o un rango cualquiera es una resta, sin
+    volver a cruzar tablas por cada selección
+    """
+
+    def __init__(self, periods, categorias, budget, actual, has_budget, has_actual):
+        self.periods = periods
+        self.categorias = categorias
+        self.budget = budget
+        self.actual = actual
+        self.has_budget = has_budget
+        self.has_actual = has_actual
+        # Con una fila de ceros inicial: el rango [i, j) es cum[j] - cum[i]
+        self.cum_budget = self._cumulative(budget)
+        self.cum_actual = self._cumulative(actual)
+        self.cum_has_budget = self._cumulative(has_budget.astype(np.int64))
+        self.cum_has_actual = self._cumulative(has_actual.astype(np.int64))
+
+    @staticmethod
+    def _cumulative(values):
+        return np.vstack([np.zeros((1, values.shape[1]), dtype=values.dtype), np.cumsum(values, axis=0)])
+
+    @classmethod
+    def from_data(cls, presupuesto, cube):
+        """
+        Matrices a partir de la tabla presupuesto (Valor en céntimos) y del cubo de
+        transacciones (importe neto de todos los Tipos por Categoria). None si no
+        hay ninguno de los dos
+        """
+        has_presupuesto = presupuesto is not None and not presupuesto.empty
+        if not has_presupuesto and cube is None:
+            return None
+
+        budget_periods = presupuesto['Periodo'].to_numpy(dtype=np.int64) if has_presupuesto else np.empty(0, np.int64)
+        budget_codes, budget_labels = (pd.factorize(presupuesto['Categoria'], sort=True, use_na_sentinel=False)
+                                       if has_presupuesto else (np.empty(0, np.int64), []))
+        cube_labels = cube.categorias if cube is not None else []
+        categorias = pd.Index(np.asarray(budget_labels, dtype=object)).append(
+            pd.Index(np.asarray(cube_labels, dtype=object))).unique().sort_values()
+
+        # Las filas del presupuesto no tienen por qué venir ordenadas (p.ej. al unir libros)
+        bounds = [int(budget_periods.min()), int(budget_periods.max())] if has_presupuesto else []
+        if cube is not None:
+            bounds += [int(cube.periods[0]), int(cube.periods[-1])]
+        first, last = min(bounds), max(bounds)
+        periods = np.arange(first, last + 1, dtype=np.int64)
+        shape = (len(periods), len(categorias))
+
+        budget = np.zeros(shape)
+        has_budget = np.zeros(shape, dtype=bool)
+        if has_presupuesto:
+            columns = categorias.get_indexer(pd.Index(np.asarray(budget_labels, dtype=object)))[budget_codes]
+            flat = np.ravel_multi_index((budget_periods - first, columns), shape)
+            size = int(np.prod(shape))
+            budget = from_cents(np.bincount(flat, weights=presupuesto['Valor'].to_numpy(dtype=np.float64),
+                                            minlength=size).reshape(shape))
+            has_budget = (np.bincount(flat, minlength=size) > 0).reshape(shape)
+
+        actual = np.zeros(shape)
+        has_actual = np.zeros(shape, dtype=bool)
+        if cube is not None:
+            rows = slice(int(cube.periods[0]) - first, int(cube.periods[-1]) - first + 1)
+            columns = categorias.get_indexer(pd.Index(cube.categorias))
+            actual[rows, columns] = cube.importe.sum(axis=1)
+            has_actual[rows, columns] = cube.count.sum(axis=1) > 0
+
+        return cls(periods, np.asarray(categorias, dtype=object), budget, actual, has_budget, has_actual)
+
+    @property
+    def nbytes(self):
+        arrays = (self.periods, self.budget, self.actual, self.has_budget, self.has_actual,
+                  self.cum_budget, self.cum_actual, self.cum_has_budget, self.cum_has_actual)
+        return sum(a.nbytes for a in arrays)
+
+    def bounds(self, period_from=None, period_to=None):
+        """
+        Posiciones [lo, hi) del rango de periodos (extremos incluidos, None = sin límite)
+        """
+        first = int(self.periods[0])
+        lo = 0 if period_from is None else int(np.clip(int(period_from) - first, 0, len(self.periods)))
+        hi = len(self.periods) if period_to is None else int(np.clip(int(period_to) - first + 1, 0, len(self.periods)))
+        return lo, max(lo, hi)
+
+    def variance(self):
+        """
+        Desviación (real - presupuesto) de cada mes y categoría, y su acumulado en
+        el año natural (se reinicia cada enero)
+        """
+        deviation = self.actual - self.budget
+        cumulative = self.cum_actual[1:] - self.cum_budget[1:]
+        # Acumulado antes del enero de cada periodo: periodo = año * 12 + mes
+        year_start = np.clip(self.periods - (self.periods - 1) % 12 - int(self.periods[0]), 0, None)
+        year_to_date = cumulative - (self.cum_actual - self.cum_budget)[year_start]
+        return deviation, year_to_date
+
+    def frame(self, period_from=None, period_to=None, how='inner'):
+        """
+        Presupuesto, real y desviación por Categoria en el rango de periodos, con el
+        acumulado del año hasta el último mes del rango. how elige las categorías
+        (ver JOIN_MODES)
+        """
+        if how not in JOIN_MODES:
+            raise ValueError(f"Modo de cruce desconocido: {how}")
+        lo, hi = self.bounds(period_from, period_to)
+        with_budget = self.cum_has_budget[hi] - self.cum_has_budget[lo] > 0
+        with_actual = self.cum_has_actual[hi] - self.cum_has_actual[lo] > 0
+        keep = {'inner': with_budget & with_actual, 'left': with_budget, 'outer': with_budget | with_actual}[how]
+
+        budget = (self.cum_budget[hi] - self.cum_budget[lo])[keep]
+        actual = (self.cum_actual[hi] - self.cum_actual[lo])[keep]
+        if hi > lo:
+            # Año natural del último mes del rango
+            end = hi - 1
+            year_lo = max(end - (int(self.periods[end]) - 1) % 12, 0)
+            budget_ytd = (self.cum_budget[hi] - self.cum_budget[year_lo])[keep]
+            actual_ytd = (self.cum_actual[hi] - self.cum_actual[year_lo])[keep]
+        else:
+            budget_ytd = actual_ytd = np.zeros(int(keep.sum()))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent = np.where(budget != 0, (actual - budget) * 100 / np.abs(budget), np.nan)
+        return pd.DataFrame({
+            'Categoria': self.categorias[keep],
+            'Presupuesto': budget,
+            'Real': actual,
+            'Desviación': actual - budget,
+            'Desviación %': percent,
+            'Presupuesto acumulado': budget_ytd,
+            'Real acumulado': actual_ytd,
+            'Desviación acumulada': actual_ytd - budget_ytd,
+        })
+
+    def monthly_frame(self, how='outer'):
+        """
+        Presupuesto, real, desviación y desviación acumulada en el año de cada mes y
+        categoría en formato largo, para exportar la historia completa
+        """
+        if how not in JOIN_MODES:
+            raise ValueError(f"Modo de cruce desconocido: {how}")
+        keep = {'inner': self.has_budget & self.has_actual, 'left': self.has_budget,
+                'outer': self.has_budget | self.has_actual}[how]
+        deviation, year_to_date = self.variance()
+        p_idx, c_idx = np.nonzero(keep)
+        periods = self.periods[p_idx]
+        return pd.DataFrame({
+            'Periodo': periods,
+            'Mes_Año': [period_label(p) for p in periods],
+            'Categoria': self.categorias[c_idx],
+            'Presupuesto': self.budget[p_idx, c_idx],
+            'Real': self.actual[p_idx, c_idx],
+            'Desviación': deviation[p_idx, c_idx],
+            'Desviación acumulada': year_to_date[p_idx, c_idx],
+        })
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Presupuesto de memoria por defecto para la caché de libros procesados (MB)
+DEFAULT_CACHE_MB = int(os.environ.get('DASHBOARD_CACHE_MB', 512))
+# Presupuesto global de la caché compartida por todas las sesiones del proceso (MB)
+SHARED_CACHE_MB = int(os.environ.get('DASHBOARD_SHARED_CACHE_MB', DEFAULT_CACHE_MB))
+# Fracción máxima del presupuesto que puede ocupar una entrada: un libro enorme
+# no expulsa de golpe los datos del resto de usuarios
+MAX_ENTRY_FRACTION = float(os.environ.get('DASHBOARD_CACHE_MAX_ENTRY', 0.5))
+
+
+def hash_bytes(raw, version=''):
+    """
+    Calcula la huella sha256 del contenido de un fichero junto a una versión
+    """
+    digest = hashlib.sha256()
+    digest.update(str(version).encode())
+    digest.update(b'\0')
+    digest.update(raw)
+    return digest.hexdigest()
+
+
+def estimate_size(obj):
+    """
+    Estima en bytes la memoria ocupada por un objeto (DataFrames, dicts, listas...)
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    return sys.getsizeof(obj)
+
+
+def key_kind(key):
+    """
+    Tipo de entrada para las estadísticas: el primer elemento de las claves tupla
+    ('filtros', 'figura'...) o 'datos' para las huellas de libros y CSV
+    """
+    return key[0] if isinstance(key, tuple) and key and isinstance(key[0], str) else 'datos'
+
+
+class LRUCache:
+    """
+    Caché en memoria con expulsión LRU limitada por un presupuesto de bytes.
+    Es segura entre hilos (cada sesión de Streamlit es un hilo), así que una misma
+    instancia puede compartirse entre sesiones. Los valores se comparten tal cual y
+    deben tratarse como de solo lectura
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 ** 2, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes if max_entry_bytes is None else max_entry_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._kinds = {}
+        self._lock = threading.RLock()
+        # Cálculos en curso por clave: el resto de hilos espera en lugar de repetirlos
+        self._pending = {}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, key, hit):
+        counts = self._kinds.setdefault(key_kind(key), [0, 0])
+        if hit:
+            self.hits += 1
+            counts[0] += 1
+        else:
+            self.misses += 1
+            counts[1] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self._count(key, False)
+                return default
+            self._entries.move_to_end(key)
+            self._count(key, True)
+            return self._entries[key][0]
+
+    def put(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Un objeto mayor que el máximo por entrada no se guarda
+            if size > self.max_entry_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+        return value
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.current_bytes -= old_size
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute, size=None):
+        """
+        Valor de la clave o, si no está, el resultado de compute(), que se guarda.
+        Si otro hilo ya lo está calculando se espera a su resultado: varios usuarios
+        que abren el mismo libro a la vez lo procesan una sola vez
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self._count(key, True)
+                    return self._entries[key][0]
+                event = self._pending.get(key)
+                owner = event is None
+                if owner:
+                    event = self._pending[key] = threading.Event()
+                    self._count(key, False)
+            if owner:
+                break
+            # Si el otro hilo falla o no guarda el valor, se vuelve a intentar
+            event.wait()
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value, size)
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+
+    def remeasure(self, value):
+        """
+        Vuelve a medir las entradas que guardan este objeto, p.ej. un FinanceData
+        cuyas vistas derivadas se han calculado después de guardarlo
+        """
+        with self._lock:
+            keys = [key for key, (entry, _) in self._entries.items() if entry is value]
+        if not keys:
+            return
+        size = estimate_size(value)
+        with self._lock:
+            for key in keys:
+                if key not in self._entries:
+                    continue
+                old_size = self._entries[key][1]
+                if size > self.max_entry_bytes:
+                    del self._entries[key]
+                    self.current_bytes -= old_size
+                    self.evictions += 1
+                else:
+                    self._entries[key] = (value, size)
+                    self.current_bytes += size - old_size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entradas': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.hits,
+                'fallos': self.misses,
+                'tasa_aciertos': self.hits / lookups if lookups else 0.0,
+                'expulsiones': self.evictions,
+                'por_tipo': {kind: {'aciertos': hits, 'fallos': misses} for kind, (hits, misses) in self._kinds.items()},
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    Caché única del proceso, compartida por todas las sesiones: los datos se guardan
+    por huella del contenido, así que varios usuarios con el mismo libro comparten
+    un único objeto y la memoria total queda limitada por SHARED_CACHE_MB
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                max_bytes = SHARED_CACHE_MB * 1024 ** 2
+                _shared_cache = LRUCache(max_bytes, max_entry_bytes=int(max_bytes * MAX_ENTRY_FRACTION))
+    return _shared_cache
@@ -0,0 +1,92 @@
+"""
+Cálculo de KPIs y agregados sin interfaz, p.ej. desde cron o una API:
+
+    python cli.py finanzas.xlsx -o kpis.json
+    python cli.py 2024.xlsx 2025.xlsx --csv banco.csv --fecha 2025-06-30
+
+No importa streamlit, plotly ni altair, por lo que arranca rápido
+"""
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from csv_ingest import attach_csv_transactions, load_csv_transactions
+from kpis import all_kpis, chart_data
+from model import FinanceData
+from utils import load_and_process_data
+from workbooks import MERGE_MEMBERS, MERGE_PERIODS, load_workbooks
+
+
+def to_json_value(value):
+    """
+    Convierte escalares numpy y fechas a tipos JSON; inf y nan pasan a null
+    """
+    if isinstance(value, dict):
+        return {key: to_json_value(item) for key, item in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso'))
+    if isinstance(value, (np.integer, int)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    return value
+
+
+def load_data(workbooks, csv_files=(), mode=MERGE_PERIODS, use_snapshots=True):
+    if len(workbooks) > 1:
+        data = load_workbooks(workbooks, mode=mode, use_snapshots=use_snapshots)
+    elif workbooks:
+        data = load_and_process_data(workbooks[0], use_snapshots=use_snapshots)
+    else:
+        data = FinanceData()
+
+    if csv_files:
+        key, cells, _ = load_csv_transactions(list(csv_files))
+        data = attach_csv_transactions(data, cells, key, replace_periods=mode == MERGE_PERIODS)
+    return data
+
+
+def build_report(data, date=None):
+    return to_json_value({
+        'kpis': all_kpis(data, date),
+        'graficos': chart_data(data),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcula los KPIs del dashboard de finanzas y los escribe en JSON")
+    parser.add_argument('libros', nargs='*', help="Libros Excel (.xlsx)")
+    parser.add_argument('--csv', nargs='+', default=[], help="Exportaciones bancarias CSV/TSV de transacciones")
+    parser.add_argument('--modo', choices=[MERGE_PERIODS, MERGE_MEMBERS], default=MERGE_PERIODS,
+                        help="Los ficheros son de distintos periodos o de distintas personas")
+    parser.add_argument('--fecha', help="Fecha evaluada para saldos e inversiones (por defecto la última)")
+    parser.add_argument('--sin-instantaneas', action='store_true', help="No leer ni guardar instantáneas en disco")
+    parser.add_argument('-o', '--salida', help="Fichero JSON de salida (por defecto la salida estándar)")
+    args = parser.parse_args(argv)
+
+    if not args.libros and not args.csv:
+        parser.error("indica al menos un libro o un CSV")
+
+    data = load_data(args.libros, args.csv, args.modo, use_snapshots=not args.sin_instantaneas)
+    if not data:
+        print("No se han encontrado datos en los ficheros", file=sys.stderr)
+        return 1
+
+    report = build_report(data, pd.Timestamp(args.fecha) if args.fecha else None)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
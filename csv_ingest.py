@@ -0,0 +1,175 @@
+import hashlib
+import os
+from dataclasses import replace
+
+import pandas as pd
+
+from aggregates import TransactionsCube, combine_aggregates
+from profiling import span
+from utils import PARSER_VERSION, SHEET_COLUMNS, normalize_transactions
+
+# Filas por trozo: la memoria máxima depende de este valor, no del tamaño del fichero
+CSV_CHUNK_ROWS = int(os.environ.get('DASHBOARD_CSV_CHUNK_ROWS', 200_000))
+
+CSV_COLUMNS = SHEET_COLUMNS['Transacciones']
+DEFAULT_CATEGORY = 'Sin categoría'
+HASH_BLOCK = 1024 * 1024
+
+
+def _open(source):
+    """
+    Fichero binario a partir de una ruta o un fichero subido (rebobinado)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    source.seek(0)
+    return source
+
+
+def csv_key(source, **options):
+    """
+    Huella del fichero leída por bloques, sin cargarlo entero en memoria, junto a
+    las opciones de lectura que cambian el resultado (separador, fechas...)
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(sorted((k, v) for k, v in options.items() if k != 'chunk_rows')).encode())
+    f = _open(source)
+    try:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    finally:
+        if f is not source:
+            f.close()
+        else:
+            source.seek(0)
+    return f"csv-{PARSER_VERSION}-{digest.hexdigest()}"
+
+
+def sniff_format(source, encoding='utf-8'):
+    """
+    Separador y separador decimal a partir de la cabecera. Las exportaciones con ';'
+    (habituales en bancos españoles) usan coma decimal
+    """
+    name = str(getattr(source, 'name', source)).lower()
+    if name.endswith('.tsv'):
+        return '\t', '.'
+    f = _open(source)
+    try:
+        header = f.readline().decode(encoding, errors='replace')
+    finally:
+        if f is not source:
+            f.close()
+        else:
+            source.seek(0)
+    sep = max([';', '\t', ','], key=header.count)
+    return sep, ',' if sep == ';' else '.'
+
+
+def parse_dates(values, dayfirst=True):
+    """
+    Fechas de un CSV: las ISO (2024-01-05) se leen siempre como año-mes-día y
+    dayfirst solo se aplica al resto (05/01/2024)
+    """
+    dates = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    pending = dates.isna() & values.notna()
+    if pending.any():
+        dates[pending] = pd.to_datetime(values[pending], dayfirst=dayfirst, errors='coerce')
+    return dates
+
+
+def normalize_chunk(chunk, decimal='.', dayfirst=True):
+    """
+    Misma conversión y limpieza que la hoja Transacciones, con Tipo y Categoria
+    por defecto para exportaciones que no los traen
+    """
+    if not pd.api.types.is_numeric_dtype(chunk['Importe']):
+        # Importes con símbolo de moneda u otros restos que read_csv no ha convertido
+        importe = chunk['Importe'].astype('str').str.replace(r'[^\d,.\-]', '', regex=True)
+        if decimal == ',':
+            importe = importe.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        else:
+            importe = importe.str.replace(',', '', regex=False)
+        chunk['Importe'] = importe
+    chunk['Fecha'] = parse_dates(chunk['Fecha'], dayfirst=dayfirst)
+    chunk = normalize_transactions(chunk)
+    if 'Tipo' not in chunk.columns:
+        chunk['Tipo'] = chunk['Importe'].gt(0).map({True: 'Ingreso', False: 'Gasto'})
+    if 'Categoria' not in chunk.columns:
+        chunk['Categoria'] = DEFAULT_CATEGORY
+    else:
+        chunk['Categoria'] = chunk['Categoria'].fillna(DEFAULT_CATEGORY)
+    return chunk
+
+
+def aggregate_csv(source, chunk_rows=CSV_CHUNK_ROWS, sep=None, decimal=None, encoding='utf-8', dayfirst=True):
+    """
+    Lee un CSV/TSV de transacciones por trozos de chunk_rows filas y acumula cada trozo
+    en las celdas mensuales (Periodo, Tipo, Categoria). Las filas no se conservan,
+    así que la memoria no crece con el tamaño del fichero.
+    Devuelve (celdas agregadas, filas leídas, filas válidas)
+    """
+    sniffed_sep, sniffed_decimal = sniff_format(source, encoding)
+    sep = sep or sniffed_sep
+    decimal = decimal or sniffed_decimal
+
+    f = _open(source)
+    try:
+        reader = pd.read_csv(
+            f, sep=sep, decimal=decimal, thousands='.' if decimal == ',' else None,
+            encoding=encoding, chunksize=chunk_rows,
+            usecols=lambda col: col.strip() in CSV_COLUMNS,
+            dtype={'Categoria': 'str', 'Tipo': 'str', 'Nombre': 'str', 'Cuenta': 'str'},
+        )
+        cells, rows_read, rows_valid = None, 0, 0
+        for chunk in reader:
+            chunk.columns = [col.strip() for col in chunk.columns]
+            missing = {'Fecha', 'Importe'} - set(chunk.columns)
+            if missing:
+                raise ValueError(f"Faltan columnas en el CSV: {', '.join(sorted(missing))}")
+            rows_read += len(chunk)
+            chunk = normalize_chunk(chunk, decimal=decimal, dayfirst=dayfirst)
+            rows_valid += len(chunk)
+            if not chunk.empty:
+                cells = combine_aggregates([cells, TransactionsCube.aggregate(chunk)])
+    finally:
+        if f is not source:
+            f.close()
+
+    if cells is None:
+        cells = combine_aggregates([])
+    return cells, rows_read, rows_valid
+
+
+def load_csv_transactions(sources, cache=None, **options):
+    """
+    Agrega uno o varios CSV de movimientos (p.ej. uno por cuenta bancaria), que se suman.
+    Devuelve (clave, celdas agregadas, informe por fichero)
+    """
+    keys = [csv_key(source, **options) for source in sources]
+    key = hashlib.sha256(''.join(sorted(keys)).encode()).hexdigest()
+
+    def build():
+        parts, report = [], {}
+        for source in sources:
+            with span('agregar CSV'):
+                cells, rows_read, rows_valid = aggregate_csv(source, **options)
+            parts.append(cells)
+            report[os.path.basename(str(getattr(source, 'name', source)))] = f'{rows_valid:,}/{rows_read:,} filas'
+        return combine_aggregates(parts), report
+
+    cells, report = build() if cache is None else cache.get_or_compute(key, build)
+    return key, cells, report
+
+
+def attach_csv_transactions(data, cells, key, replace_periods=True):
+    """
+    Añade transacciones agregadas de CSV a unos datos cargados. Con replace_periods,
+    los meses presentes en el CSV sustituyen a los de la hoja Transacciones (son los
+    mismos movimientos); si no, se suman
+    """
+    transacciones = data.transacciones
+    if replace_periods and not transacciones.empty and not cells.empty:
+        transacciones = transacciones[~transacciones['Periodo'].isin(cells['Periodo'].unique())]
+    merged = combine_aggregates([data.transacciones_agregadas, cells])
+    return replace(data, transacciones=transacciones, transacciones_agregadas=merged,
+                   key=hashlib.sha256(f'{data.key}-{key}-{replace_periods}'.encode()).hexdigest())
@@ -0,0 +1,243 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AGGREGATE_MEASURES, TransactionsCube
+
+# Dimensiones de transacciones por las que se puede filtrar
+DIMENSIONS = ('Tipo', 'Categoria', 'Cuenta', 'Nombre')
+
+
+@dataclass(frozen=True)
+class Filters:
+    """
+    Filtros del dashboard. Un rango de periodos (enteros año*12+mes, extremos
+    incluidos, None = sin límite) y, por dimensión, las etiquetas permitidas
+    (vacío = todas)
+    """
+    period_from: int = None
+    period_to: int = None
+    tipos: tuple = ()
+    categorias: tuple = ()
+    cuentas: tuple = ()
+    nombres: tuple = ()
+
+    def selections(self):
+        return {'Tipo': self.tipos, 'Categoria': self.categorias, 'Cuenta': self.cuentas, 'Nombre': self.nombres}
+
+    def __bool__(self):
+        return self.period_from is not None or self.period_to is not None or any(self.selections().values())
+
+    def key(self):
+        """
+        Clave estable para las cachés de datos y figuras filtrados
+        """
+        parts = [str(self.period_from), str(self.period_to)]
+        parts += [','.join(sorted(map(str, values))) for values in self.selections().values()]
+        return '|'.join(parts)
+
+
+class TransactionsIndex:
+    """
+    Índice de transacciones para filtrar sin recorrer la tabla. Las filas se ordenan
+    por periodo, así que un rango de fechas es un slice (dos searchsorted). Para cada
+    dimensión se guardan los códigos de cada fila y las posiciones agrupadas por
+    código con sus offsets (formato CSR): filtrar por etiquetas es reunir sus tramos.
+    Las celdas ya agregadas (CSV) entran como filas con peso, sin Cuenta ni Nombre
+    """
+
+    def __init__(self, periods, weights, codes, labels):
+        self.periods = periods
+        self.weights = weights
+        self.codes = codes
+        self.labels = labels
+        self.groups = {}
+        self.offsets = {}
+        for dim, dim_codes in codes.items():
+            # argsort estable: dentro de cada código las posiciones siguen ordenadas por periodo
+            groups = np.argsort(dim_codes, kind='stable')
+            self.groups[dim] = groups
+            self.offsets[dim] = np.searchsorted(dim_codes[groups], np.arange(len(labels[dim]) + 1))
+        self._label_codes = {dim: {label: i for i, label in enumerate(dim_labels)}
+                             for dim, dim_labels in labels.items()}
+
+    @classmethod
+    def from_data(cls, transacciones, agregadas=None):
+        frames = []
+        if transacciones is not None and not transacciones.empty:
+            # Importes en céntimos, como en las tablas; el cubo los pasa a euros
+            importe = transacciones['Importe'].to_numpy(dtype=np.float64)
+            rows = pd.DataFrame({
+                'Periodo': transacciones['Periodo'].to_numpy(dtype=np.int64),
+                'ingresos': np.where(importe > 0, importe, 0.0),
+                'gastos': np.where(importe < 0, -importe, 0.0),
+                'importe': importe,
+                'count': 1,
+            })
+            for dim in DIMENSIONS:
+                rows[dim] = transacciones[dim].array if dim in transacciones.columns else ''
+            frames.append(rows)
+        if agregadas is not None and not agregadas.empty:
+            frames.append(agregadas.assign(Cuenta=None, Nombre=None))
+        if not frames:
+            return None
+
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        order = np.argsort(df['Periodo'].to_numpy(dtype=np.int64), kind='stable')
+        periods = df['Periodo'].to_numpy(dtype=np.int64)[order]
+        weights = {measure: df[measure].to_numpy(dtype=np.float64)[order] for measure in AGGREGATE_MEASURES}
+
+        codes, labels = {}, {}
+        for dim in DIMENSIONS:
+            # Se codifica en el orden original y se reordenan los códigos. Las categóricas ya
+            # traen sus códigos; el resto (p.ej. mezcladas con celdas CSV) va más rápido como str
+            values = df[dim]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('str')
+            dim_codes, dim_labels = pd.factorize(values, sort=True, use_na_sentinel=False)
+            codes[dim] = dim_codes.astype(np.int32)[order]
+            labels[dim] = np.asarray(dim_labels, dtype=object)
+        return cls(periods, weights, codes, labels)
+
+    @property
+    def nbytes(self):
+        arrays = [self.periods, *self.weights.values(), *self.codes.values(),
+                  *self.groups.values(), *self.offsets.values()]
+        return sum(a.nbytes for a in arrays)
+
+    def __len__(self):
+        return len(self.periods)
+
+    def options(self, dim):
+        """
+        Etiquetas seleccionables de una dimensión (sin vacíos)
+        """
+        return [label for label in self.labels[dim] if not pd.isna(label) and label != '']
+
+    def period_bounds(self, period_from=None, period_to=None):
+        lo = 0 if period_from is None else int(np.searchsorted(self.periods, period_from, side='left'))
+        hi = len(self.periods) if period_to is None else int(np.searchsorted(self.periods, period_to, side='right'))
+        return lo, max(lo, hi)
+
+    def _gather(self, dim, selected, lo, hi):
+        """
+        Posiciones (ordenadas) de las filas con alguna de las etiquetas y dentro de [lo, hi)
+        """
+        groups, offsets = self.groups[dim], self.offsets[dim]
+        parts = []
+        for code in selected:
+            segment = groups[offsets[code]:offsets[code + 1]]
+            start, end = np.searchsorted(segment, [lo, hi])
+            parts.append(segment[start:end])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate(parts)
+        positions.sort()
+        return positions
+
+    def select(self, filters):
+        """
+        Filas que cumplen los filtros: un slice si solo hay rango de fechas,
+        o un array de posiciones reunido desde la dimensión más selectiva
+        """
+        lo, hi = self.period_bounds(filters.period_from, filters.period_to)
+        selected = {}
+        for dim, values in filters.selections().items():
+            if values:
+                lookup = self._label_codes[dim]
+                selected[dim] = [lookup[value] for value in values if value in lookup]
+        if not selected:
+            return slice(lo, hi)
+
+        # Se reúne la dimensión con menos filas y el resto se comprueba solo sobre ellas
+        def size(dim):
+            offsets = self.offsets[dim]
+            return sum(offsets[code + 1] - offsets[code] for code in selected[dim])
+
+        driver = min(selected, key=size)
+        positions = self._gather(driver, selected[driver], lo, hi)
+        for dim, dim_codes in selected.items():
+            if dim == driver or len(positions) == 0:
+                continue
+            allowed = np.zeros(len(self.labels[dim]), dtype=bool)
+            allowed[dim_codes] = True
+            positions = positions[allowed[self.codes[dim][positions]]]
+        return positions
+
+    def cube(self, filters):
+        """
+        Cubo mensual de las filas filtradas, o None si no queda ninguna
+        """
+        rows = self.select(filters)
+        periods = self.periods[rows]
+        if len(periods) == 0:
+            return None
+        weights = {measure: values[rows] for measure, values in self.weights.items()}
+        return TransactionsCube.from_codes(periods, self.codes['Tipo'][rows], self.labels['Tipo'],
+                                           self.codes['Categoria'][rows], self.labels['Categoria'], weights)
+
+
+def _filter_periods(df, filters, columns=None):
+    """
+    Filas de una tabla de fechas (pocas filas: meses × cuentas) dentro del rango
+    de periodos y, para las columnas dadas, de las etiquetas seleccionadas
+    """
+    if df.empty or not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if filters.period_from is not None:
+        mask &= df['Periodo'].to_numpy() >= filters.period_from
+    if filters.period_to is not None:
+        mask &= df['Periodo'].to_numpy() <= filters.period_to
+    for column, values in (columns or {}).items():
+        if values and column in df.columns:
+            mask &= df[column].isin(values).to_numpy()
+    return df if mask.all() else df[mask]
+
+
+def _unapplied(selections, applied):
+    """
+    Dimensiones con selección que una tabla no puede filtrar
+    """
+    return tuple(dim for dim, values in selections.items() if values and dim not in applied)
+
+
+def apply_filters(data, filters):
+    """
+    FinanceData con los filtros aplicados. Las transacciones se filtran con el índice
+    y llegan como cubo ya calculado; el rango de fechas recorta también saldos,
+    deudas, inversiones y presupuesto, que además se filtra por Tipo, Categoria y Cuenta.
+    Los saldos se filtran por Cuenta con su Nombre (el de la cuenta en la hoja Activos)
+    si alguna de las cuentas elegidas está en ella. Las dimensiones que una tabla no
+    tiene quedan en filtros_no_aplicados para que los paneles lo indiquen
+    """
+    if not filters:
+        return data
+
+    cube = data.indice.cube(filters) if data.indice is not None else None
+    selections = filters.selections()
+    saldos_columns = {}
+    if selections['Cuenta'] and 'Nombre' in data.saldos.columns:
+        if data.saldos['Nombre'].isin(selections['Cuenta']).any():
+            saldos_columns['Nombre'] = selections['Cuenta']
+    unapplied = {
+        'saldos': _unapplied(selections, {'Cuenta'} if saldos_columns else set()),
+        'deudas': _unapplied(selections, set()),
+        'inversiones': _unapplied(selections, set()),
+    }
+    return replace(
+        data,
+        transacciones=pd.DataFrame(),
+        transacciones_agregadas=pd.DataFrame(),
+        presupuesto=_filter_periods(data.presupuesto, filters, {
+            'Tipo': selections['Tipo'], 'Categoria': selections['Categoria'], 'Cuenta': selections['Cuenta'],
+        }),
+        saldos=_filter_periods(data.saldos, filters, saldos_columns),
+        deudas=_filter_periods(data.deudas, filters),
+        inversiones=_filter_periods(data.inversiones, filters),
+        cubo_precalculado=cube,
+        filtros_no_aplicados={table: dims for table, dims in unapplied.items() if dims},
+        key=f'{data.key}|{filters.key()}',
+        clave_libro=data.widget_key,
+    )
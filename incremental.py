@@ -0,0 +1,394 @@
+import hashlib
+import hmac
+import os
+import pickle
+import time
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+
+try:
+    # API interna de openpyxl (probada con la 3.1): si cambia o desaparece, las
+    # hojas se procesan completas en lugar de solo las filas añadidas
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    WorkSheetParser = None
+
+from model import FinanceData
+from profiling import span
+from store import SNAPSHOT_DIR, load_snapshot, save_snapshot
+from utils import (PARSER_VERSION, SHEET_COLUMNS, TRANSPOSED_SHEETS, assemble_tables,
+                   process_sheet, read_file_bytes, read_sheet, rows_to_frame, select_columns, workbook_key)
+
+STATE_DIR = os.environ.get('DASHBOARD_STATE_DIR', os.path.join(os.path.dirname(SNAPSHOT_DIR), 'incremental'))
+# Días sin uso tras los que se borra un estado (p.ej. de usuarios que ya no vuelven)
+STATE_MAX_AGE_DAYS = float(os.environ.get('DASHBOARD_STATE_MAX_AGE_DAYS', 30))
+STATE_SECRET_FILE = '.secret'
+
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+
+
+def _digest(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+@dataclass
+class SheetState:
+    """
+    Estado normalizado de una hoja y lo necesario para detectar cambios en ella
+    """
+    digest: str
+    table: pd.DataFrame
+    # Hojas transpuestas: hoja leída en ancho, para comprobar las fechas ya procesadas,
+    # y marca de agua (última fecha de columna procesada)
+    raw: pd.DataFrame = None
+    watermark: pd.Timestamp = None
+    # Transacciones: cabecera, columnas leídas y final de las filas ya procesadas
+    header: tuple = None
+    keep: list = None
+    data_end: int = 0
+    prefix_digest: str = ''
+
+
+@dataclass
+class IncrementalState:
+    """
+    Estado de la última carga de un libro: hojas y prefijo de cadenas compartidas
+    """
+    sheets: dict = field(default_factory=dict)
+    sst_len: int = 0
+    sst_digest: str = ''
+    parser_version: int = PARSER_VERSION
+    # Ventanas móviles de la carga (rolling.RollingWindows): la siguiente solo añade los meses nuevos
+    ventanas: object = None
+    # Usuario y fichero a los que pertenece: se comprueba al leerlo
+    owner: tuple = None
+
+
+def _shared_strings_body(sst):
+    """
+    Entradas <si> de las cadenas compartidas, sin la cabecera <sst count=...>
+    que cambia cada vez que se añade una cadena
+    """
+    start = sst.find(b'<si')
+    return sst[start:sst.rfind(b'</sst>')] if start >= 0 else b''
+
+
+def _sheet_data_bounds(xml):
+    start = xml.find(b'<sheetData')
+    end = xml.rfind(b'</sheetData>')
+    return start, end
+
+
+def _header_dates(columns):
+    """
+    Fecha de cada cabecera de columna (NaT si no es una fecha)
+    """
+    return [pd.Timestamp(col) if isinstance(col, datetime)
+            else pd.to_datetime(col, format='%b-%y', errors='coerce')
+            for col in columns]
+
+
+def _max_header_date(columns):
+    dates = [date for date in _header_dates(columns) if not pd.isna(date)]
+    return max(dates) if dates else None
+
+
+def _sheet_xml(archive, workbook, name):
+    """
+    XML de una hoja dentro del libro, o None si openpyxl no expone su ruta (API interna)
+    """
+    try:
+        return archive.read(workbook[name]._worksheet_path)
+    except (AttributeError, KeyError):
+        return None
+
+
+def _full_sheet(workbook, name, xml):
+    # Sin XML no se pueden detectar cambios: la próxima carga también será completa
+    digest = _digest(xml) if xml is not None else None
+    raw = read_sheet(workbook, name)
+    if name in TRANSPOSED_SHEETS:
+        sheet = SheetState(digest=digest, table=process_sheet(name, raw.copy()), raw=raw,
+                           watermark=_max_header_date(raw.columns))
+    else:
+        sheet = SheetState(digest=digest, table=process_sheet(name, raw))
+    if name == 'Transacciones' and xml is not None:
+        start, end = _sheet_data_bounds(xml)
+        header = next(workbook[name].iter_rows(max_row=1, values_only=True), ())
+        sheet.header = tuple(header)
+        sheet.keep = select_columns(name, header)
+        sheet.data_end = end - start
+        sheet.prefix_digest = _digest(xml[start:end])
+    return sheet
+
+
+def _append_transactions(workbook, previous, xml):
+    """
+    Si las filas ya procesadas no han cambiado, parsea solo las añadidas al final.
+    Devuelve None si hay que reprocesar la hoja completa
+    """
+    if WorkSheetParser is None or previous.header is None:
+        return None
+    start, end = _sheet_data_bounds(xml)
+    old_end = start + previous.data_end
+    if start < 0 or old_end > end or _digest(xml[start:old_end]) != previous.prefix_digest:
+        return None
+
+    # Documento mínimo con la cabecera original (espacios de nombres) y solo las filas nuevas
+    tail = xml[:start] + b'<sheetData>' + xml[old_end:end] + b'</sheetData></worksheet>'
+    try:
+        parser = WorkSheetParser(BytesIO(tail), workbook.shared_strings, data_only=True,
+                                 epoch=workbook.epoch, date_formats=workbook._date_formats,
+                                 timedelta_formats=workbook._timedelta_formats)
+        parsed = list(parser.parse())
+    except (AttributeError, TypeError, KeyError, ValueError, SyntaxError):
+        # API interna de openpyxl distinta de la esperada: se reprocesa la hoja completa
+        return None
+    width = len(previous.header)
+    rows = []
+    for _, cells in parsed:
+        row = [None] * width
+        for cell in cells:
+            if cell['column'] <= width:
+                row[cell['column'] - 1] = cell['value']
+        rows.append(row)
+
+    names = [previous.header[i] for i in previous.keep]
+    new_rows = process_sheet('Transacciones', rows_to_frame(rows, previous.keep, names))
+    table = previous.table if new_rows is None else pd.concat([previous.table, new_rows], ignore_index=True)
+
+    sheet = SheetState(digest=_digest(xml), table=table, header=previous.header, keep=previous.keep,
+                       data_end=end - start, prefix_digest=_digest(xml[start:end]))
+    return sheet, 0 if new_rows is None else len(new_rows)
+
+
+def _append_dates(workbook, name, previous, xml):
+    """
+    Hojas transpuestas: si las columnas hasta la marca de agua no han cambiado,
+    normaliza solo las columnas de fecha posteriores. None si hay que reprocesar
+    """
+    if previous.raw is None or previous.watermark is None:
+        return None
+
+    raw = read_sheet(workbook, name)
+    id_cols = [col for col in raw.columns if col in SHEET_COLUMNS[name]]
+    date_cols = [col for col in raw.columns if col not in id_cols]
+    new_cols = [col for col, date in zip(date_cols, _header_dates(date_cols)) if date > previous.watermark]
+    old_cols = [col for col in raw.columns if col not in new_cols]
+
+    if old_cols != list(previous.raw.columns) or not raw[old_cols].equals(previous.raw):
+        return None
+
+    sheet = SheetState(digest=_digest(xml), table=previous.table, raw=raw,
+                       watermark=_max_header_date(raw.columns))
+    if new_cols:
+        new_table = process_sheet(name, raw[id_cols + new_cols].copy())
+        if new_table is not None:
+            sheet.table = pd.concat([previous.table, new_table], ignore_index=True)
+    return sheet, len(new_cols)
+
+
+def refresh_workbook(raw, state=None):
+    """
+    Normaliza un libro reutilizando el estado de la carga anterior:
+    las hojas sin cambios se reutilizan, en Transacciones se procesan solo
+    las filas añadidas y en las hojas transpuestas solo las fechas nuevas.
+    Devuelve (tablas, nuevo estado, informe por hoja)
+    """
+    archive = zipfile.ZipFile(BytesIO(raw))
+    workbook = openpyxl.load_workbook(BytesIO(raw), read_only=True, data_only=True)
+    try:
+        sst = archive.read(SHARED_STRINGS) if SHARED_STRINGS in archive.namelist() else b''
+        sst = _shared_strings_body(sst)
+        # Si cambian las cadenas compartidas ya conocidas, los índices de las hojas no son fiables
+        if state is not None and (state.parser_version != PARSER_VERSION
+                                  or _digest(sst[:state.sst_len]) != state.sst_digest):
+            state = None
+        previous = state.sheets if state is not None else {}
+
+        sheets, report = {}, {}
+        for name in SHEET_COLUMNS:
+            if name not in workbook.sheetnames:
+                continue
+            xml = _sheet_xml(archive, workbook, name)
+            old = previous.get(name) if xml is not None else None
+
+            if old is not None and old.digest == _digest(xml):
+                sheets[name], report[name] = old, 'sin cambios'
+                continue
+
+            with span(f'procesar {name}') as record:
+                result = None
+                if old is not None and name == 'Transacciones':
+                    result = _append_transactions(workbook, old, xml)
+                    if result:
+                        report[name] = f'incremental (+{result[1]} filas)'
+                elif old is not None and name in TRANSPOSED_SHEETS:
+                    result = _append_dates(workbook, name, old, xml)
+                    if result:
+                        report[name] = f'incremental (+{result[1]} fechas)'
+
+                if result is None:
+                    sheets[name], report[name] = _full_sheet(workbook, name, xml), 'completa'
+                else:
+                    sheets[name] = result[0]
+                if record is not None:
+                    record['atributos'] = {'modo': report[name]}
+    finally:
+        workbook.close()
+
+    tables = {name: sheet.table for name, sheet in sheets.items()}
+    new_state = IncrementalState(
+        sheets=sheets,
+        sst_len=len(sst),
+        sst_digest=_digest(sst),
+    )
+    return assemble_tables(tables), new_state, report
+
+
+def _state_path(name, owner=''):
+    key = f'{owner}\0{name}'.encode()
+    # La versión del parser va en el nombre: los estados de otras versiones se
+    # reconocen sin abrirlos
+    return os.path.join(STATE_DIR, f"v{PARSER_VERSION}-{_digest(key)}.pkl")
+
+
+def _state_secret():
+    """
+    Clave para firmar los estados (DASHBOARD_STATE_SECRET o una generada y guardada
+    en STATE_DIR): solo se deserializan ficheros escritos por el propio dashboard
+    """
+    secret = os.environ.get('DASHBOARD_STATE_SECRET')
+    if secret:
+        return secret.encode()
+    path = os.path.join(STATE_DIR, STATE_SECRET_FILE)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Otro hilo o proceso la acaba de crear
+            with open(path, 'rb') as f:
+                return f.read()
+        with os.fdopen(fd, 'wb') as f:
+            secret = os.urandom(32)
+            f.write(secret)
+        return secret
+
+
+def _signature(payload):
+    return hmac.new(_state_secret(), payload, hashlib.sha256).digest()
+
+
+def load_state(name, owner=''):
+    """
+    Estado incremental guardado en disco para un fichero de un usuario (owner, p.ej.
+    el usuario autenticado o su clave de perfil). Se descarta si la firma no es válida o pertenece a otro usuario o fichero
+    """
+    try:
+        with open(_state_path(name, owner), 'rb') as f:
+            signature, payload = f.read(32), f.read()
+        if not hmac.compare_digest(signature, _signature(payload)):
+            return None
+        state = pickle.loads(payload)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if not isinstance(state, IncrementalState) or state.owner != (str(owner), str(name)):
+        return None
+    return state if state.parser_version == PARSER_VERSION else None
+
+
+def save_state(name, state, owner=''):
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        state.owner = (str(owner), str(name))
+        payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        signature = _signature(payload)
+        tmp_path = _state_path(name, owner) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(signature + payload)
+        os.replace(tmp_path, _state_path(name, owner))
+    except OSError:
+        pass
+
+
+def purge_states(parser_version=PARSER_VERSION, max_age_days=STATE_MAX_AGE_DAYS):
+    """
+    Borra los estados de otra versión del parser o que no se han usado en
+    max_age_days días
+    """
+    if not os.path.isdir(STATE_DIR):
+        return 0
+    limit = time.time() - max_age_days * 86400
+    prefix = f"v{parser_version}-"
+    removed = 0
+    for file_name in os.listdir(STATE_DIR):
+        path = os.path.join(STATE_DIR, file_name)
+        if not file_name.endswith(('.pkl', '.tmp')):
+            continue
+        try:
+            if not file_name.startswith(prefix) or os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def load_incremental(uploaded_file, cache=None, owner='', use_snapshots=True):
+    """
+    Carga un libro en modo incremental a partir del último estado guardado por el
+    mismo usuario (owner) para un fichero con el mismo nombre: dos usuarios con un
+    "finanzas.xlsx" no comparten estado. Con owner None (usuario sin identidad
+    estable) no se lee ni se guarda estado y el libro se procesa completo. Un libro
+    con instantánea en disco se lee de ella sin tocar el Excel, y lo procesado se
+    guarda como instantánea. Devuelve (datos, informe por hoja o None si vino de caché o
+    de una instantánea)
+    """
+    raw = read_file_bytes(uploaded_file)
+    key = workbook_key(raw)
+    name = getattr(uploaded_file, 'name', uploaded_file)
+    reports = []
+
+    def build():
+        if use_snapshots:
+            with span('cargar instantánea'):
+                tables = load_snapshot(key, PARSER_VERSION)
+            if tables is not None:
+                # El estado guardado sigue siendo válido: las cargas incrementales
+                # comparan con lo que procesaron, no con la última versión vista
+                return FinanceData.from_tables(tables, key=key)
+
+        with span('cargar estado incremental'):
+            state = load_state(name, owner) if owner is not None else None
+        previous_windows = getattr(state, 'ventanas', None)
+        tables, state, report = refresh_workbook(raw, state)
+
+        data = FinanceData.from_tables(tables, key=key, ventanas_previas=previous_windows)
+        state.ventanas = data.ventanas
+        if owner is not None:
+            with span('guardar estado incremental'):
+                save_state(name, state, owner)
+        if use_snapshots and tables:
+            with span('guardar instantánea'):
+                save_snapshot(key, tables, PARSER_VERSION)
+        reports.append(report)
+        return data
+
+    data = build() if cache is None else cache.get_or_compute(key, build)
+    if not reports and owner is not None and not os.path.exists(_state_path(name, owner)):
+        # Libro servido de la caché o de una instantánea y sin estado de este usuario:
+        # se genera una vez para que su próxima carga sea incremental
+        with span('guardar estado incremental'):
+            _, state, _ = refresh_workbook(raw)
+            state.ventanas = data.ventanas
+            save_state(name, state, owner)
+    return data, reports[0] if reports else None
@@ -0,0 +1,162 @@
+import numpy as np
+
+from aggregates import period_label
+
+
+def _growth(actual, previous):
+    """
+    Variación porcentual; inf/nan si el valor anterior es cero, como los escalares numpy
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (actual - previous) * 100 / previous
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerator * 100 / denominator
+
+
+def summary_kpis(data, period=None):
+    """
+    Ingresos, gastos, balance y ahorro de un mes (por defecto el último) frente
+    al anterior. None si no hay transacciones
+    """
+    cube = data.cubo
+    if cube is None:
+        return None
+
+    last_period = data.last_period if period is None else int(period)
+    ingresos_total = cube.ingresos_total(last_period)
+    ingresos_prev = cube.ingresos_total(last_period - 1)
+    gastos_total = cube.gastos_total(last_period)
+    gastos_prev = cube.gastos_total(last_period - 1)
+
+    porcentaje_ahorro = _ratio(ingresos_total - gastos_total, ingresos_total)
+    porcentaje_ahorro_prev = _ratio(ingresos_prev - gastos_prev, ingresos_prev)
+    balance_neto = ingresos_total - gastos_total
+    balance_neto_prev = ingresos_prev - gastos_prev
+
+    return {
+        'periodo': last_period,
+        'fecha': period_label(last_period),
+        'ingresos': ingresos_total,
+        'ingresos_variacion': _growth(ingresos_total, ingresos_prev),
+        'gastos': gastos_total,
+        'gastos_variacion': _growth(gastos_total, gastos_prev),
+        'balance_neto': balance_neto,
+        'balance_neto_variacion': _growth(balance_neto, balance_neto_prev),
+        'porcentaje_ahorro': porcentaje_ahorro,
+        'porcentaje_ahorro_variacion': porcentaje_ahorro - porcentaje_ahorro_prev,
+    }
+
+
+def saldo_kpis(data, date=None):
+    """
+    Patrimonio, deuda y endeudamiento en la fecha evaluada frente a la anterior.
+    None si no hay saldos
+    """
+    saldos = data.serie_saldos
+    if saldos is None:
+        return None
+
+    saldo_actual = saldos.value('Valor', date)
+    saldo_pm = saldos.value('Valor', date, offset=-1)
+
+    deudas = data.serie_deudas
+    deuda_actual = deudas.value('Valor', date) if deudas else np.float64(0)
+    deuda_pm = deudas.value('Valor', date, offset=-1) if deudas else np.float64(0)
+
+    porc_deuda_actual = round(_ratio(deuda_actual, saldo_actual), 2)
+    porc_deuda_pm = round(_ratio(deuda_pm, saldo_pm), 2)
+
+    return {
+        'patrimonio': saldo_actual,
+        'patrimonio_variacion': _growth(saldo_actual, saldo_pm),
+        'deuda': deuda_actual,
+        'deuda_variacion': _growth(deuda_actual, deuda_pm),
+        'endeudamiento': porc_deuda_actual,
+        'endeudamiento_variacion': porc_deuda_actual - porc_deuda_pm,
+    }
+
+
+def investment_kpis(data, date=None):
+    """
+    Valor de la cartera, rentabilidad sobre el precio de compra, rentabilidades
+    TWR y TIR anuales de la cartera y peso de la renta variable. None si no hay inversiones
+    """
+    inv = data.serie_inversiones
+    if inv is None:
+        return None
+
+    inversiones_actual = inv.value('Valor Actual', date)
+    inversiones_lm = inv.value('Valor Actual', date, offset=-1)
+    inversiones_compra = inv.value('Valor Compra', date)
+    prc_renta_variable = _ratio(inv.category_value('Renta Variable', date), inversiones_actual)
+    prc_renta_variable_lm = _ratio(inv.category_value('Renta Variable', date, offset=-1), inversiones_lm)
+    returns = investment_returns(data, date)
+    cartera = returns.iloc[-1] if returns is not None else {}
+
+    return {
+        'inversion_actual': inversiones_actual,
+        'rentabilidad': _growth(inversiones_actual, inversiones_compra),
+        'twr': cartera.get('TWR', np.nan),
+        'twr_anual': cartera.get('TWR anual', np.nan),
+        'tir_anual': cartera.get('TIR anual', np.nan),
+        'renta_variable': prc_renta_variable,
+        'renta_variable_variacion': prc_renta_variable - prc_renta_variable_lm,
+    }
+
+
+def rolling_kpis(data, period=None):
+    """
+    Ingresos, gastos y ahorro acumulados en ventanas móviles (3, 6 y 12 meses) y
+    crecimiento del patrimonio, con sus variaciones interanuales, en un mes (por
+    defecto el último). None si no hay transacciones ni saldos
+    """
+    windows = data.ventanas
+    if windows is None:
+        return None
+    return windows.values(period)
+
+
+def investment_returns(data, date=None):
+    """
+    Rentabilidades TWR y TIR de cada activo, Categoría, Tipo de Activo y de la
+    cartera (última fila) en la fecha evaluada. None si no hay inversiones
+    """
+    positions = data.posiciones_inversion
+    if positions is None:
+        return None
+    return positions.returns(date)
+
+
+def all_kpis(data, date=None):
+    return {
+        'resumen': summary_kpis(data),
+        'ventanas': rolling_kpis(data),
+        'saldos': saldo_kpis(data, date),
+        'inversiones': investment_kpis(data, date),
+    }
+
+
+def chart_data(data):
+    """
+    Tablas listas para dibujar los gráficos del dashboard, sin depender de plotly
+    """
+    charts = {}
+    if data.cubo is not None:
+        charts['ingresos_gastos'] = data.resumen_mensual
+        charts['gastos_por_categoria'] = data.gastos_por_categoria
+        charts['presupuesto_vs_real'] = data.presupuesto_vs_real
+    if data.matriz_presupuesto is not None and not data.presupuesto.empty:
+        charts['presupuesto_mensual'] = data.matriz_presupuesto.monthly_frame()
+    if data.ventanas is not None:
+        charts['ventanas'] = data.ventanas.frame()
+    if data.serie_saldos is not None:
+        charts['saldos'] = data.serie_saldos.category_frame('Tipo de Cuenta', 'Valor')
+    if data.serie_deudas is not None:
+        charts['deudas'] = data.serie_deudas.category_frame('Tipo de Deuda', 'Valor')
+    if data.serie_inversiones is not None:
+        charts['inversiones'] = data.serie_inversiones.frame()
+        charts['rentabilidades'] = investment_returns(data)
+    return charts
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Umbrales del modo de nivel de detalle, configurables por variables de entorno
+LOD_TOP_N = int(os.environ.get('DASHBOARD_LOD_TOP_N', 8))
+LOD_WEBGL_POINTS = int(os.environ.get('DASHBOARD_LOD_WEBGL_POINTS', 1500))
+LOD_DETAIL_MONTHS = int(os.environ.get('DASHBOARD_LOD_DETAIL_MONTHS', 36))
+LOD_COARSE_FREQ = os.environ.get('DASHBOARD_LOD_COARSE_FREQ', 'Q')
+
+OTHERS_LABEL = 'Otros'
+
+
+def group_long_tail(df, top_n=LOD_TOP_N, series_col='Nombre', value_col='Valor'):
+    """
+    Conserva las top_n series con mayor valor absoluto en la última fecha
+    y suma el resto en una serie 'Otros'
+    """
+    names = df[series_col].unique()
+    if len(names) <= top_n + 1:
+        return df
+
+    last = df[df['Fecha'] == df['Fecha'].max()]
+    ranking = last.groupby(series_col, observed=True)[value_col].sum().abs().sort_values(ascending=False)
+    # Las series sin valor en la última fecha se ordenan después del resto
+    ranked = list(ranking.index) + [n for n in names if n not in ranking.index]
+    top = set(ranked[:top_n])
+
+    is_top = df[series_col].isin(top)
+    others = (
+        df[~is_top]
+        .groupby('Fecha', as_index=False)[value_col]
+        .sum()
+        .assign(**{series_col: OTHERS_LABEL})
+    )
+    return pd.concat([df.loc[is_top, ['Fecha', series_col, value_col]], others], ignore_index=True)
+
+
+def coarsen_history(df, detail_months=LOD_DETAIL_MONTHS, freq=LOD_COARSE_FREQ,
+                    series_col='Nombre', value_col='Valor'):
+    """
+    Mantiene el detalle mensual de los últimos detail_months meses y reduce
+    el histórico anterior a un punto por serie y periodo 'freq' (el último valor,
+    ya que saldos y deudas son stocks, no flujos)
+    """
+    cutoff = df['Fecha'].max() - pd.DateOffset(months=detail_months)
+    old = df['Fecha'] <= cutoff
+    if not old.any():
+        return df
+
+    old_df = df[old]
+    bucket = old_df['Fecha'].dt.to_period(freq)
+    # Todas las series comparten la misma fecha representativa por tramo
+    bucket_date = old_df.groupby(bucket)['Fecha'].transform('max')
+    # Se ordena por la fecha original (orden estable) antes de sustituirla, para
+    # que last() tome el último mes de cada tramo y no uno cualquiera
+    coarse = (
+        old_df.sort_values('Fecha', kind='stable')
+        .assign(Fecha=bucket_date)
+        .groupby([series_col, 'Fecha'], as_index=False, observed=True)[value_col]
+        .last()
+    )
+    recent = df.loc[~old, ['Fecha', series_col, value_col]]
+    return pd.concat([coarse, recent], ignore_index=True)
+
+
+def reduce_series(df, series_col='Nombre', value_col='Valor', top_n=LOD_TOP_N,
+                  detail_months=LOD_DETAIL_MONTHS, webgl_points=LOD_WEBGL_POINTS):
+    """
+    Aplica el nivel de detalle automático a una tabla larga Fecha × serie.
+    Devuelve la tabla reducida y un informe de la reducción
+    """
+    points_in = len(df)
+    series_in = df[series_col].nunique()
+
+    reduced = group_long_tail(df, top_n, series_col, value_col)
+    if len(reduced) > webgl_points:
+        reduced = coarsen_history(reduced, detail_months, series_col=series_col, value_col=value_col)
+    reduced = reduced.sort_values(['Fecha', series_col]).reset_index(drop=True)
+
+    report = {
+        'series_in': int(series_in),
+        'series_out': int(reduced[series_col].nunique()),
+        'points_in': int(points_in),
+        'points_out': int(len(reduced)),
+        'webgl': bool(len(reduced) > webgl_points),
+    }
+    report['reduced'] = report['points_out'] < points_in or report['series_out'] < series_in
+    return reduced, report
+
+
+def stack_series(df, series_col='Nombre', value_col='Valor'):
+    """
+    Acumula las series por fecha para dibujar áreas apiladas con trazas WebGL,
+    que no soportan stackgroup. Devuelve (fechas, nombres, valores, acumulados)
+    """
+    wide = df.pivot_table(index='Fecha', columns=series_col, values=value_col,
+                          aggfunc='sum', fill_value=0, observed=True).sort_index()
+    values = wide.to_numpy(dtype=np.float64)
+    return wide.index, list(wide.columns), values, np.cumsum(values, axis=1)
+
+
+def describe_reduction(report):
+    return (
+        f"Vista reducida: {report['series_in']}→{report['series_out']} series, "
+        f"{report['points_in']:,}→{report['points_out']:,} puntos"
+        + (" (WebGL)" if report['webgl'] else "")
+    )
@@ -0,0 +1,215 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CENTS, DateSeries, TransactionsCube, combine_aggregates, period_label
+from budget import BudgetMatrix
+from cache import estimate_size
+from filters import TransactionsIndex
+from performance import InvestmentPositions
+from rolling import RollingWindows
+from profiling import timed
+
+TABLES = ('transacciones', 'presupuesto', 'saldos', 'deudas', 'inversiones')
+
+
+@dataclass(frozen=True, eq=False)
+class FinanceData:
+    """
+    Datos normalizados de un libro de finanzas, de solo lectura.
+    Las vistas derivadas se calculan en el primer acceso y se memorizan,
+    por lo que cada una se calcula como mucho una vez por libro cargado.
+    Las tablas no deben modificarse: se comparten entre reruns y cachés
+    """
+    transacciones: pd.DataFrame = field(default_factory=pd.DataFrame)
+    presupuesto: pd.DataFrame = field(default_factory=pd.DataFrame)
+    saldos: pd.DataFrame = field(default_factory=pd.DataFrame)
+    deudas: pd.DataFrame = field(default_factory=pd.DataFrame)
+    inversiones: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Transacciones ya agregadas por (Periodo, Tipo, Categoria), p.ej. de CSV grandes
+    # que no se guardan fila a fila. Se suman a las de la tabla transacciones
+    transacciones_agregadas: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Cubo ya calculado, p.ej. por el índice de filtros; tiene prioridad sobre las tablas
+    cubo_precalculado: TransactionsCube = None
+    # Ventanas móviles de una carga anterior del mismo libro: solo se añaden los meses nuevos
+    ventanas_previas: RollingWindows = None
+    # Tabla -> dimensiones filtradas que no tiene (p.ej. las deudas no tienen Cuenta),
+    # para que los paneles indiquen que esos filtros no se les aplican
+    filtros_no_aplicados: dict = field(default_factory=dict)
+    key: str = ''
+    # Huella del libro sin filtros (vacía si no está filtrado)
+    clave_libro: str = ''
+
+    @property
+    def widget_key(self):
+        """
+        Sufijo de las claves de los controles de los paneles: la del libro sin filtros,
+        para que cambiar un filtro no reinicie la fecha ni las selecciones de cada panel
+        """
+        return self.clave_libro or self.key
+
+    @classmethod
+    def from_tables(cls, tables, key='', **fields):
+        return cls(key=key, **{name: tables[name] for name in TABLES if name in tables}, **fields)
+
+    def tables(self):
+        """
+        Tablas no vacías por nombre, p.ej. para guardarlas en disco
+        """
+        return {name: getattr(self, name) for name in TABLES if not getattr(self, name).empty}
+
+    def __bool__(self):
+        return (any(not getattr(self, name).empty for name in TABLES) or not self.transacciones_agregadas.empty
+                or self.cubo_precalculado is not None)
+
+    @property
+    def nbytes(self):
+        derived = sum(estimate_size(v) for k, v in self.__dict__.items() if k not in TABLES and k != 'key')
+        return sum(estimate_size(getattr(self, name)) for name in TABLES) + derived
+
+    def memory_usage(self):
+        """
+        Bytes de cada tabla, incluidas las etiquetas de texto (memory_usage deep)
+        """
+        return {name: int(getattr(self, name).memory_usage(deep=True).sum()) for name in TABLES}
+
+    # Agregados base
+
+    @cached_property
+    @timed('cubo')
+    def cubo(self):
+        if self.cubo_precalculado is not None:
+            return self.cubo_precalculado
+        if self.transacciones_agregadas.empty:
+            if self.transacciones.empty:
+                return None
+            return TransactionsCube.from_transactions(self.transacciones)
+        cells = [self.transacciones_agregadas]
+        if not self.transacciones.empty:
+            cells.append(TransactionsCube.aggregate(self.transacciones))
+        return TransactionsCube.from_aggregates(combine_aggregates(cells))
+
+    @cached_property
+    @timed('indice')
+    def indice(self):
+        """
+        Índice de transacciones para los filtros (ver filters.TransactionsIndex)
+        """
+        return TransactionsIndex.from_data(self.transacciones, self.transacciones_agregadas)
+
+    @cached_property
+    @timed('serie_saldos')
+    def serie_saldos(self):
+        if self.saldos.empty:
+            return None
+        return DateSeries.from_frame(self.saldos, ['Valor'], category='Tipo de Cuenta')
+
+    @cached_property
+    @timed('serie_deudas')
+    def serie_deudas(self):
+        if self.deudas.empty:
+            return None
+        return DateSeries.from_frame(self.deudas, ['Valor'], category='Tipo de Deuda')
+
+    @cached_property
+    @timed('serie_inversiones')
+    def serie_inversiones(self):
+        if self.inversiones.empty:
+            return None
+        return DateSeries.from_frame(self.inversiones, ['Valor Actual', 'Valor Compra'], category='Categoría')
+
+    @cached_property
+    @timed('posiciones_inversion')
+    def posiciones_inversion(self):
+        """
+        Matrices de valor y aportaciones por activo y fecha para las rentabilidades
+        TWR y TIR (ver performance.InvestmentPositions)
+        """
+        if self.inversiones.empty:
+            return None
+        return InvestmentPositions.from_frame(self.inversiones)
+
+    @cached_property
+    @timed('ventanas')
+    def ventanas(self):
+        """
+        Acumuladores de ventanas móviles de ingresos, gastos y patrimonio por mes
+        (ver rolling.RollingWindows). None si no hay transacciones ni saldos
+        """
+        cube, saldos = self.cubo, self.serie_saldos
+        if cube is None and saldos is None:
+            return None
+        bounds = []
+        if cube is not None:
+            bounds += [cube.periods[0], cube.periods[-1]]
+        if saldos is not None:
+            bounds += [saldos.periods[0], saldos.periods[-1]]
+        first, last = int(min(bounds)), int(max(bounds))
+        ingresos = np.zeros(last - first + 1, dtype=np.int64)
+        gastos = np.zeros(last - first + 1, dtype=np.int64)
+        if cube is not None:
+            offset = int(cube.periods[0]) - first
+            ingresos[offset:offset + len(cube.periods)] = np.round(cube.ingresos.sum(axis=(1, 2)) * CENTS)
+            gastos[offset:offset + len(cube.periods)] = np.round(cube.gastos.sum(axis=(1, 2)) * CENTS)
+        patrimonio = [None] * (last - first + 1)
+        if saldos is not None:
+            # Si hay varias fechas en un mes, queda la última
+            for period, total in zip(saldos.periods, saldos.totals['Valor']):
+                patrimonio[int(period) - first] = int(round(total * CENTS))
+
+        windows = self.ventanas_previas.copy() if self.ventanas_previas is not None else RollingWindows()
+        windows.sync(list(range(first, last + 1)), ingresos.tolist(), gastos.tolist(), patrimonio)
+        return windows
+
+    # Vistas derivadas de transacciones
+
+    @cached_property
+    def last_period(self):
+        return self.cubo.last_period if self.cubo is not None else None
+
+    @cached_property
+    @timed('resumen_mensual')
+    def resumen_mensual(self):
+        """
+        Importe absoluto por periodo y Tipo, con su etiqueta 'Mes_Año'
+        """
+        summary = self.cubo.by_period_tipo()
+        summary['Importe'] = summary['Importe'].abs()
+        summary['Mes_Año'] = summary['Periodo'].map(period_label)
+        return summary
+
+    @cached_property
+    @timed('gastos_por_categoria')
+    def gastos_por_categoria(self):
+        """
+        Gastos por Categoria del último mes con gastos
+        """
+        gasto_period = self.cubo.last_period_for_tipo('Gasto')
+        if gasto_period is None:
+            return self.cubo.gastos_by_categoria(self.last_period)
+        gastos = self.cubo.by_categoria(gasto_period, tipo='Gasto')
+        gastos['Importe'] = gastos['Importe'].abs()
+        return gastos
+
+    @cached_property
+    @timed('matriz_presupuesto')
+    def matriz_presupuesto(self):
+        """
+        Presupuesto y real de todos los meses y categorías (ver budget.BudgetMatrix).
+        None si no hay presupuesto ni transacciones
+        """
+        if self.presupuesto.empty and self.cubo is None:
+            return None
+        return BudgetMatrix.from_data(self.presupuesto, self.cubo)
+
+    @cached_property
+    @timed('presupuesto_vs_real')
+    def presupuesto_vs_real(self):
+        """
+        Presupuesto frente a importe real por Categoria del último mes
+        """
+        if self.cubo is None or self.presupuesto.empty:
+            return pd.DataFrame(columns=['Categoria', 'Presupuesto', 'Real'])
+        return self.matriz_presupuesto.frame(self.last_period, self.last_period)
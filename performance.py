@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import from_cents
+
+ASSET_KEYS = ['Tipo de Activo', 'Nombre', 'Categoría']
+
+# Por debajo de este capital (en euros) un mes no cuenta para la TWR
+MIN_CAPITAL = 0.005
+# La TIR se busca como x = log(1 + r) dentro de estos límites (r de -99.99% a ~22000x)
+XIRR_BOUNDS = (-10.0, 10.0)
+XIRR_TOL = 1e-10
+XIRR_NEWTON_ITER = 50
+XIRR_BISECT_ITER = 80
+
+
+def xirr(cash_flows, years):
+    """
+    TIR anual de cada fila de cash_flows (entidades × flujos) con los flujos en los
+    instantes years, comunes a todas las filas. Newton vectorizado sobre todas las
+    filas a la vez y bisección para las que no convergen. NaN si los flujos de una
+    fila no cambian de signo
+    """
+    cash_flows = np.asarray(cash_flows, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+    n_rows = cash_flows.shape[0]
+    result = np.full(n_rows, np.nan)
+
+    # Solo tiene solución si hay flujos de los dos signos
+    solvable = (cash_flows > 0).any(axis=1) & (cash_flows < 0).any(axis=1)
+    if not solvable.any():
+        return result
+    flows = cash_flows[solvable]
+    flows = flows / np.abs(flows).max(axis=1, keepdims=True)
+
+    def npv(x):
+        discount = np.exp(-x[:, None] * years[None, :])
+        return (flows * discount).sum(axis=1), (-years[None, :] * flows * discount).sum(axis=1)
+
+    lo, hi = XIRR_BOUNDS
+    x = np.full(len(flows), np.log1p(0.1))
+    converged = np.zeros(len(flows), dtype=bool)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(XIRR_NEWTON_ITER):
+            value, slope = npv(x)
+            step = np.where(slope != 0, value / slope, 0.0)
+            x_new = np.clip(x - step, lo, hi)
+            # Quedarse en un límite del intervalo no es una raíz: lo resuelve la bisección
+            done = (np.abs(x_new - x) < XIRR_TOL) & (np.abs(value) < XIRR_TOL ** 0.5)
+            x = np.where(converged, x, x_new)
+            converged |= done & np.isfinite(x)
+            if converged.all():
+                break
+
+        # Bisección para las filas restantes, si hay cambio de signo en el intervalo
+        pending = ~converged | ~np.isfinite(npv(x)[0])
+        if pending.any():
+            a = np.full(pending.sum(), lo)
+            b = np.full(pending.sum(), hi)
+            rows = flows[pending]
+            f_a = (rows * np.exp(-a[:, None] * years)).sum(axis=1)
+            f_b = (rows * np.exp(-b[:, None] * years)).sum(axis=1)
+            bracketed = np.sign(f_a) != np.sign(f_b)
+            for _ in range(XIRR_BISECT_ITER):
+                mid = (a + b) / 2
+                f_mid = (rows * np.exp(-mid[:, None] * years)).sum(axis=1)
+                left = np.sign(f_mid) == np.sign(f_a)
+                a, f_a = np.where(left, mid, a), np.where(left, f_mid, f_a)
+                b = np.where(left, b, mid)
+            x[pending] = np.where(bracketed, (a + b) / 2, np.nan)
+
+    result[solvable] = np.expm1(x)
+    return result
+
+
+class InvestmentPositions:
+    """
+    Valor actual, coste (Títulos × Precio medio) y aportaciones netas de cada
+    entidad por mes, en matrices entidad × fecha: cada activo y, sumados, cada
+    Categoría, cada Tipo de Activo y la cartera. Las rentabilidades de todas las
+    entidades se calculan a la vez sobre las matrices, sin bucles por activo.
+    Los flujos de un mes se suponen al inicio del mes y los valores, al final
+    """
+
+    def __init__(self, entities, dates, periods, values, costs, flows):
+        self.entities = entities
+        self.dates = dates
+        self.periods = periods
+        self.values = values
+        self.costs = costs
+        self.flows = flows
+
+    @classmethod
+    def from_frame(cls, inversiones):
+        """
+        Matrices a partir de la tabla inversiones (una fila por activo y fecha con posición)
+        """
+        groups = inversiones.groupby(ASSET_KEYS, sort=True, observed=True)
+        asset_codes = groups.ngroup().to_numpy()
+        assets = groups.size().index.to_frame(index=False)
+        date_codes, dates = pd.factorize(inversiones['Fecha'], sort=True)
+        shape = (len(assets), len(dates))
+
+        def matrix(column, add=True):
+            out = np.zeros(shape)
+            values = inversiones[column].to_numpy(dtype=np.float64)
+            if add:
+                # Varias filas del mismo activo y fecha (p.ej. al unir los libros de
+                # varias personas) se suman, como en serie_inversiones
+                np.add.at(out, (asset_codes, date_codes), values)
+            else:
+                out[asset_codes, date_codes] = values
+            return out
+
+        values = from_cents(matrix('Valor Actual'))
+        costs = from_cents(matrix('Valor Compra'))
+        titles = matrix('Títulos')
+        price = matrix('Precio actual', add=False)
+
+        # Aportación de cada mes: las compras por lo que sube el coste (Títulos × Precio
+        # medio); las ventas, que no cambian el precio medio, por lo cobrado a Precio
+        # actual (el del mes anterior si la posición se cierra y ya no tiene precio)
+        previous = np.zeros(shape[0])[:, None]
+        sold = np.diff(titles, axis=1, prepend=previous)
+        sale_price = np.where(price > 0, price, np.hstack([previous, price[:, :-1]]))
+        flows = np.where(sold < 0, sold * sale_price, np.diff(costs, axis=1, prepend=previous))
+
+        # Grupos: matriz de pertenencia activo → grupo, las sumas son un producto
+        blocks = [assets.assign(Nivel='Activo')[['Nivel', 'Nombre']]]
+        membership = [np.eye(len(assets))]
+        for level in ('Categoría', 'Tipo de Activo'):
+            codes, labels = pd.factorize(assets[level], sort=True)
+            blocks.append(pd.DataFrame({'Nivel': level, 'Nombre': np.asarray(labels, dtype=object)}))
+            membership.append(np.eye(len(labels))[codes].T)
+        blocks.append(pd.DataFrame({'Nivel': ['Cartera'], 'Nombre': ['Cartera']}))
+        membership.append(np.ones((1, len(assets))))
+        membership = np.vstack(membership)
+
+        entities = pd.concat(blocks, ignore_index=True).astype({'Nombre': 'object'})
+        dates = pd.DatetimeIndex(dates)
+        periods = (dates.year * 12 + dates.month).to_numpy(dtype=np.int64)
+        return cls(entities, dates.to_numpy(), periods,
+                   membership @ values, membership @ costs, membership @ flows)
+
+    @property
+    def nbytes(self):
+        arrays = (self.dates, self.periods, self.values, self.costs, self.flows)
+        return sum(a.nbytes for a in arrays) + int(self.entities.memory_usage(deep=True).sum())
+
+    def position(self, date=None):
+        """
+        Índice de la fecha evaluada (última, la de un periodo entero o la última
+        no posterior a la fecha dada), o None si no hay ninguna
+        """
+        if date is None:
+            idx = len(self.dates) - 1
+        elif isinstance(date, (int, np.integer)):
+            idx = int(np.searchsorted(self.periods, int(date), side='right')) - 1
+        else:
+            idx = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date)), side='right')) - 1
+        return idx if idx >= 0 else None
+
+    def monthly_growth(self, end=None):
+        """
+        Factores de crecimiento mensuales V_t / (V_t-1 + aportación_t) hasta la posición
+        end, y máscara de los meses con capital (en los demás el factor es 1)
+        """
+        end = len(self.dates) - 1 if end is None else end
+        values = self.values[:, :end + 1]
+        capital = np.hstack([np.zeros((len(values), 1)), values[:, :-1]]) + self.flows[:, :end + 1]
+        active = capital > MIN_CAPITAL
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(active, values / capital, 1.0)
+        return growth, active
+
+    def time_weighted(self, end):
+        """
+        TWR acumulada y anualizada hasta la posición end: se encadenan los
+        rendimientos mensuales, que no dependen de cuánto dinero se aporta ni de cuándo
+        """
+        growth, active = self.monthly_growth(end)
+        cumulative = np.prod(growth, axis=1) - 1
+        years = active.sum(axis=1) / 12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            annual = np.where(years > 0, np.power(1 + cumulative, 1 / years) - 1, np.nan)
+        return cumulative, annual
+
+    def money_weighted(self, end):
+        """
+        TIR anual (XIRR) hasta la posición end: cada aportación sale del inversor
+        al inicio de su mes y el valor en end vuelve al final de ese mes
+        """
+        periods = self.periods[:end + 1]
+        years = np.append(periods - 1, periods[-1]) / 12.0
+        years -= years[0]
+        cash_flows = np.hstack([-self.flows[:, :end + 1], self.values[:, end:end + 1]])
+        return xirr(cash_flows, years)
+
+    def returns(self, date=None):
+        """
+        Tabla de rentabilidades en la fecha evaluada: valor, coste, TWR y TIR
+        (en %) de cada activo, Categoría, Tipo de Activo y de la cartera
+        """
+        end = self.position(date)
+        if end is None:
+            return None
+        twr, twr_annual = self.time_weighted(end)
+        table = self.entities.copy()
+        table['Valor Actual'] = self.values[:, end]
+        table['Valor Compra'] = self.costs[:, end]
+        table['Aportado'] = self.flows[:, :end + 1].sum(axis=1)
+        table['TWR'] = twr * 100
+        table['TWR anual'] = twr_annual * 100
+        table['TIR anual'] = self.money_weighted(end) * 100
+        return table
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+# Si se define, cada ejecución añade sus tramos a este fichero en formato JSON Lines
+TRACE_FILE = os.environ.get('DASHBOARD_TRACE_FILE', '')
+
+_recorder = ContextVar('dashboard_recorder', default=None)
+_NULL_SPAN = nullcontext()
+
+
+class Recorder:
+    """
+    Tramos cronometrados de una ejecución del script (un rerun de Streamlit,
+    una llamada al CLI...). Cada tramo guarda nombre, inicio, duración y profundidad
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or f'{time.time():.6f}'
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    @contextmanager
+    def span(self, name, **attrs):
+        record = {'nombre': name, 'profundidad': self._depth, 'inicio_ms': 0.0, 'ms': 0.0,
+                  'hilo': threading.get_ident()}
+        if attrs:
+            record['atributos'] = attrs
+        # Se añade al empezar para que la lista quede en orden de inicio
+        self.spans.append(record)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            self._depth -= 1
+            record['inicio_ms'] = (start - self.origin) * 1000
+            record['ms'] = (end - start) * 1000
+
+    def total_ms(self):
+        return sum(span['ms'] for span in self.spans if span['profundidad'] == 0)
+
+    def write_jsonl(self, path):
+        """
+        Añade los tramos al fichero, una línea JSON por tramo
+        """
+        with open(path, 'a', encoding='utf-8') as f:
+            for span in self.spans:
+                f.write(json.dumps({'ejecucion': self.run_id, **span}, ensure_ascii=False, default=str) + '\n')
+
+    def chrome_trace(self):
+        """
+        Tramos en el formato de eventos de Chrome (chrome://tracing, Perfetto)
+        """
+        events = [{
+            'name': span['nombre'], 'ph': 'X', 'pid': 1, 'tid': span['hilo'],
+            'ts': span['inicio_ms'] * 1000, 'dur': span['ms'] * 1000,
+            'args': span.get('atributos', {}),
+        } for span in self.spans]
+        return json.dumps({'traceEvents': events}, default=str)
+
+
+def start_recording(enabled=True, run_id=None):
+    """
+    Activa la medición para el contexto actual y devuelve el Recorder, o None si no
+    está activada ni hay fichero de traza. Sin Recorder, span y timed no hacen nada
+    """
+    recorder = Recorder(run_id) if enabled or TRACE_FILE else None
+    _recorder.set(recorder)
+    return recorder
+
+
+def stop_recording():
+    """
+    Desactiva la medición y, si hay fichero de traza, vuelca en él los tramos
+    """
+    recorder = _recorder.get()
+    _recorder.set(None)
+    if recorder is not None and TRACE_FILE:
+        try:
+            recorder.write_jsonl(TRACE_FILE)
+        except OSError:
+            pass
+    return recorder
+
+
+def span(name, **attrs):
+    """
+    Tramo cronometrado: with span('lectura'): ... Sin medición activa devuelve
+    un contexto vacío compartido, por lo que el coste es una consulta a un ContextVar
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NULL_SPAN
+    return recorder.span(name, **attrs)
+
+
+def timed(name=None):
+    """
+    Decorador que mide cada llamada a la función como un tramo
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,193 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Trayectorias simuladas por bloque: la memoria es bloque × meses, no trayectorias × meses
+PROJECTION_CHUNK_PATHS = int(os.environ.get('DASHBOARD_PROJECTION_CHUNK_PATHS', 4096))
+# Intervalos del histograma de cada mes con el que se estiman los percentiles
+PROJECTION_BINS = int(os.environ.get('DASHBOARD_PROJECTION_BINS', 2048))
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Historia usada para estimar ahorro, rentabilidad y amortización de la deuda
+HISTORY_MONTHS = 36
+# Rentabilidad y volatilidad anuales si no hay historia de inversiones suficiente
+DEFAULT_RETURN = 0.05
+DEFAULT_VOLATILITY = 0.15
+
+
+@dataclass(frozen=True)
+class Assumptions:
+    """
+    Hipótesis de la proyección. Importes en euros al mes y tasas anuales.
+    La parte invertida del ahorro rinde con un paseo lognormal; el resto queda en
+    liquidez al tipo cash_rate; la deuda se amortiza debt_payment al mes
+    """
+    years: int = 30
+    paths: int = 20_000
+    seed: int = 0
+    initial_investments: float = 0.0
+    initial_cash: float = 0.0
+    initial_debt: float = 0.0
+    monthly_income: float = 0.0
+    savings_rate: float = 0.0
+    savings_volatility: float = 0.0
+    invested_share: float = 0.5
+    expected_return: float = DEFAULT_RETURN
+    volatility: float = DEFAULT_VOLATILITY
+    cash_rate: float = 0.0
+    debt_payment: float = 0.0
+
+    @property
+    def months(self):
+        return int(self.years) * 12
+
+    def key(self):
+        """
+        Clave estable para cachear el resultado
+        """
+        return '|'.join(f'{value}' for value in self.__dict__.values())
+
+
+def _last(series, measure):
+    return float(series.value(measure)) if series is not None else 0.0
+
+
+def assumptions_from_data(data, **overrides):
+    """
+    Hipótesis estimadas con la historia: posición de partida en la última fecha,
+    ingresos y ahorro medios de los últimos meses, rentabilidad y volatilidad de la
+    cartera (rendimientos mensuales ponderados por tiempo) y amortización media de la deuda
+    """
+    investments = _last(data.serie_inversiones, 'Valor Actual')
+    # Los saldos incluyen el total de inversiones como una cuenta más
+    cash = _last(data.serie_saldos, 'Valor') - investments
+    debt = _last(data.serie_deudas, 'Valor')
+
+    params = {'initial_investments': investments, 'initial_cash': cash, 'initial_debt': debt}
+    cube = data.cubo
+    if cube is not None:
+        ingresos = cube.ingresos.sum(axis=(1, 2))[-HISTORY_MONTHS:]
+        ahorro = ingresos - cube.gastos.sum(axis=(1, 2))[-HISTORY_MONTHS:]
+        income = float(ingresos.mean())
+        params['monthly_income'] = income
+        params['savings_rate'] = float(ahorro.sum() / ingresos.sum()) if ingresos.sum() > 0 else 0.0
+        params['savings_volatility'] = float(ahorro.std())
+
+    positions = data.posiciones_inversion
+    if positions is not None:
+        growth, active = positions.monthly_growth()
+        log_returns = np.log(growth[-1][active[-1]][-HISTORY_MONTHS:])
+        if len(log_returns) >= 6:
+            params['expected_return'] = float(np.expm1(12 * log_returns.mean()))
+            params['volatility'] = float(log_returns.std() * np.sqrt(12))
+
+    deudas = data.serie_deudas
+    if deudas is not None and len(deudas) > 1:
+        history = deudas.totals['Valor'][-(HISTORY_MONTHS + 1):]
+        params['debt_payment'] = max(float(-np.diff(history).mean()), 0.0)
+
+    params.update(overrides)
+    return Assumptions(**params)
+
+
+def _histogram_percentiles(counts, lo, width, percentiles):
+    """
+    Percentiles por mes a partir de histogramas (meses × intervalos) con
+    interpolación lineal dentro del intervalo
+    """
+    total = counts.sum(axis=1)
+    cumulative = np.cumsum(counts, axis=1)
+    result = {}
+    for q in percentiles:
+        target = total * q / 100
+        # Primer intervalo cuyo acumulado alcanza el objetivo
+        idx = np.argmax(cumulative >= target[:, None], axis=1)
+        before = np.where(idx > 0, cumulative[np.arange(len(idx)), idx - 1], 0)
+        inside = counts[np.arange(len(idx)), idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(inside > 0, (target - before) / inside, 0.5)
+        result[q] = lo + (idx + fraction) * width
+    return result
+
+
+class Projection:
+    """
+    Simulación de Monte Carlo del patrimonio neto mes a mes. Las trayectorias se
+    generan por bloques con un generador con semilla, y de cada bloque solo se
+    acumula un histograma por mes, así que la memoria no depende del número de
+    trayectorias. Los percentiles salen de esos histogramas
+    """
+
+    def __init__(self, assumptions, chunk_paths=PROJECTION_CHUNK_PATHS, bins=PROJECTION_BINS):
+        self.assumptions = assumptions
+        self.chunk_paths = chunk_paths
+        self.bins = bins
+
+    def simulate_chunk(self, rng, n_paths):
+        """
+        Patrimonio neto (trayectorias × meses) de un bloque. Con los factores de
+        crecimiento acumulados G, el valor con aportaciones c es G_t (V_0 + Σ c_s / G_s):
+        un cumprod y un cumsum, sin bucle por mes
+        """
+        a = self.assumptions
+        months = a.months
+        mu = np.log1p(a.expected_return) / 12
+        sigma = a.volatility / np.sqrt(12)
+        growth = np.cumprod(np.exp(rng.normal(mu - sigma ** 2 / 2, sigma, (n_paths, months))), axis=1)
+        savings = rng.normal(a.monthly_income * a.savings_rate, a.savings_volatility, (n_paths, months))
+
+        investments = growth * (a.initial_investments + np.cumsum(a.invested_share * savings / growth, axis=1))
+        cash_growth = (1 + a.cash_rate) ** (np.arange(1, months + 1) / 12)
+        cash = cash_growth * (a.initial_cash + np.cumsum((1 - a.invested_share) * savings / cash_growth, axis=1))
+        debt = np.maximum(a.initial_debt - a.debt_payment * np.arange(1, months + 1), 0.0)
+        return investments + cash - debt
+
+    def run(self):
+        """
+        Percentiles del patrimonio neto por mes (dict percentil → array de meses)
+        y proporción de trayectorias con patrimonio negativo al final
+        """
+        a = self.assumptions
+        rng = np.random.default_rng(a.seed)
+        counts = np.zeros((a.months, self.bins), dtype=np.int64)
+        rows = np.arange(a.months)[None, :]
+        lo = width = None
+        negative = 0
+        done = 0
+        while done < a.paths:
+            n_paths = min(self.chunk_paths, a.paths - done)
+            net_worth = self.simulate_chunk(rng, n_paths)
+            if lo is None:
+                # El primer bloque fija el rango de cada mes, con margen; lo que
+                # quede fuera cae en los intervalos de los extremos
+                low, high = net_worth.min(axis=0), net_worth.max(axis=0)
+                margin = np.maximum((high - low) * 0.5, 1.0)
+                lo = low - margin
+                width = (high + margin - lo) / self.bins
+            idx = np.clip(((net_worth - lo) / width).astype(np.int64), 0, self.bins - 1)
+            counts += np.bincount((rows * self.bins + idx).ravel(),
+                                  minlength=a.months * self.bins).reshape(a.months, self.bins)
+            negative += int((net_worth[:, -1] < 0).sum())
+            done += n_paths
+
+        return _histogram_percentiles(counts, lo, width, PERCENTILES), negative / max(a.paths, 1)
+
+
+def project(data, assumptions=None, start=None):
+    """
+    Proyección del patrimonio neto desde la última fecha con datos, con las hipótesis
+    dadas o las estimadas de la historia. Devuelve (tabla de percentiles por mes,
+    proporción de trayectorias con patrimonio negativo al final)
+    """
+    assumptions = assumptions or assumptions_from_data(data)
+    percentiles, negative = Projection(assumptions).run()
+    if start is None:
+        dates = [series.dates[-1] for series in (data.serie_saldos, data.serie_inversiones, data.serie_deudas)
+                 if series is not None]
+        start = max(dates) if dates else pd.Timestamp.today()
+    start = pd.Timestamp(start).to_period('M').to_timestamp()
+    dates = pd.date_range(start, periods=assumptions.months + 1, freq='MS')[1:]
+    table = pd.DataFrame({'Fecha': dates, **{f'p{q}': values for q, values in percentiles.items()}})
+    return table, negative
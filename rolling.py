@@ -0,0 +1,153 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CENTS, period_label
+
+# Ventanas móviles en meses, configurables (p.ej. DASHBOARD_ROLLING_WINDOWS=3,6,12)
+WINDOWS = tuple(int(w) for w in os.environ.get('DASHBOARD_ROLLING_WINDOWS', '3,6,12').split(','))
+YEAR = 12
+
+
+def _growth(actual, previous):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (actual - previous) * 100 / previous
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerator * 100 / denominator
+
+
+class RollingWindows:
+    """
+    Acumuladores de ventanas móviles sobre los totales mensuales. Se guardan las
+    sumas acumuladas de ingresos y gastos en céntimos enteros (sin deriva de
+    redondeo), así que la suma de cualquier ventana que termina en un mes es una
+    resta, y añadir un mes es añadir un elemento: O(1) por mes y ventana, sin
+    volver a agregar ventanas. El patrimonio es un stock: se guarda su valor por mes
+    """
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(windows)
+        self.periods = []
+        self.ingresos = []
+        self.gastos = []
+        self.patrimonio = []
+        # Sumas acumuladas con un cero inicial: la suma de los meses [i, j) es cum[j] - cum[i]
+        self.cum_ingresos = [0]
+        self.cum_gastos = [0]
+
+    def __len__(self):
+        return len(self.periods)
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    @property
+    def nbytes(self):
+        lists = (self.periods, self.ingresos, self.gastos, self.patrimonio, self.cum_ingresos, self.cum_gastos)
+        # Listas de enteros de Python: el array de punteros más ~32 bytes por entero
+        return sum(sys.getsizeof(values) + 32 * len(values) for values in lists)
+
+    def push(self, period, ingresos, gastos, patrimonio=None):
+        """
+        Añade el mes siguiente (importes en céntimos; patrimonio None si no hay saldo)
+        """
+        if self.periods and period != self.periods[-1] + 1:
+            raise ValueError(f"Se esperaba el periodo {self.periods[-1] + 1} y llegó {period}")
+        self.periods.append(int(period))
+        self.ingresos.append(int(ingresos))
+        self.gastos.append(int(gastos))
+        self.patrimonio.append(patrimonio)
+        self.cum_ingresos.append(self.cum_ingresos[-1] + int(ingresos))
+        self.cum_gastos.append(self.cum_gastos[-1] + int(gastos))
+
+    def truncate(self, size):
+        """
+        Descarta los meses a partir de la posición size
+        """
+        del self.periods[size:], self.ingresos[size:], self.gastos[size:], self.patrimonio[size:]
+        del self.cum_ingresos[size + 1:], self.cum_gastos[size + 1:]
+
+    def sync(self, periods, ingresos, gastos, patrimonio):
+        """
+        Pone los acumuladores al día con la historia mensual completa. Se conserva el
+        tramo inicial que no ha cambiado y solo se añaden los meses nuevos o cambiados,
+        de modo que ampliar la historia en un mes cuesta un push. Devuelve cuántos
+        meses se han añadido
+        """
+        n = min(len(self.periods), len(periods))
+        same = 0
+        if n:
+            old = (np.asarray(self.periods[:n]), np.asarray(self.ingresos[:n]), np.asarray(self.gastos[:n]),
+                   np.array(self.patrimonio[:n], dtype=object))
+            new = (np.asarray(periods[:n]), np.asarray(ingresos[:n]), np.asarray(gastos[:n]),
+                   np.array(patrimonio[:n], dtype=object))
+            equal = np.logical_and.reduce([a == b for a, b in zip(old, new)])
+            same = n if equal.all() else int(np.argmin(equal))
+        self.truncate(same)
+        for i in range(same, len(periods)):
+            self.push(periods[i], ingresos[i], gastos[i], patrimonio[i])
+        return len(periods) - same
+
+    def window_sum(self, cum, end, window):
+        """
+        Suma de la ventana de window meses que termina en la posición end (incluida), en
+        euros. NaN si la historia no cubre la ventana completa
+        """
+        start = end + 1 - window
+        if start < 0:
+            return np.float64(np.nan)
+        return np.float64(cum[end + 1] - cum[start]) / CENTS
+
+    def position(self, period=None):
+        """
+        Posición de un periodo (por defecto el último), o None si no está
+        """
+        if not self.periods:
+            return None
+        if period is None:
+            return len(self.periods) - 1
+        idx = int(period) - self.periods[0]
+        return idx if 0 <= idx < len(self.periods) else None
+
+    def _net_worth(self, idx):
+        value = self.patrimonio[idx] if 0 <= idx < len(self.patrimonio) else None
+        return np.float64(np.nan) if value is None else np.float64(value) / CENTS
+
+    def values(self, period=None):
+        """
+        Métricas móviles en un mes. Por ventana: ingresos y gastos acumulados y tasa de
+        ahorro, con su variación interanual (frente a la misma ventana un año antes), y
+        crecimiento del patrimonio en la ventana. None si el periodo no está
+        """
+        idx = self.position(period)
+        if idx is None:
+            return None
+        result = {'periodo': self.periods[idx]}
+        for window in self.windows:
+            ingresos, ingresos_prev = (self.window_sum(self.cum_ingresos, i, window) for i in (idx, idx - YEAR))
+            gastos, gastos_prev = (self.window_sum(self.cum_gastos, i, window) for i in (idx, idx - YEAR))
+            ahorro = _ratio(ingresos - gastos, ingresos)
+            result[f'ingresos_{window}m'] = ingresos
+            result[f'ingresos_{window}m_interanual'] = _growth(ingresos, ingresos_prev)
+            result[f'gastos_{window}m'] = gastos
+            result[f'gastos_{window}m_interanual'] = _growth(gastos, gastos_prev)
+            result[f'ahorro_{window}m'] = ahorro
+            result[f'ahorro_{window}m_interanual'] = ahorro - _ratio(ingresos_prev - gastos_prev, ingresos_prev)
+            result[f'patrimonio_{window}m'] = _growth(self._net_worth(idx), self._net_worth(idx - window))
+        result['patrimonio_interanual'] = _growth(self._net_worth(idx), self._net_worth(idx - YEAR))
+        return result
+
+    def frame(self):
+        """
+        Todas las métricas por mes, para gráficos (medias móviles) y exportación
+        """
+        rows = [self.values(period) for period in self.periods]
+        df = pd.DataFrame(rows, columns=list(rows[0]) if rows else ['periodo'])
+        df.insert(1, 'Mes_Año', df['periodo'].map(period_label))
+        return df.rename(columns={'periodo': 'Periodo'})
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Incrementar cuando cambie el formato en disco de las instantáneas
+STORE_VERSION = 1
+
+SNAPSHOT_DIR = os.environ.get(
+    'DASHBOARD_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'snapshots')
+)
+
+META_FILE = 'meta.json'
+
+
+def _snapshot_path(key, base_dir=None):
+    return os.path.join(base_dir or SNAPSHOT_DIR, key)
+
+
+def save_snapshot(key, tables, parser_version, base_dir=None):
+    """
+    Guarda las tablas normalizadas en formato columnar (Arrow/Feather sin comprimir)
+    para poder leerlas después mediante memory-map
+    """
+    path = _snapshot_path(key, base_dir)
+    if os.path.isdir(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Se escribe en un directorio temporal y se renombra para que sea atómico
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(path))
+    try:
+        for name, df in tables.items():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            feather.write_feather(table, os.path.join(tmp_dir, f'{name}.arrow'),
+                                  compression='uncompressed')
+        meta = {
+            'store_version': STORE_VERSION,
+            'parser_version': parser_version,
+            'tables': list(tables),
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_dir, path)
+    except OSError:
+        # Otro proceso pudo adelantarse, o el disco no es escribible
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return path
+
+
+def load_snapshot(key, parser_version, base_dir=None):
+    """
+    Lee una instantánea si existe y es compatible con la versión actual.
+    Devuelve None si no existe o ha quedado obsoleta (en ese caso se borra)
+    """
+    path = _snapshot_path(key, base_dir)
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('store_version') != STORE_VERSION or meta.get('parser_version') != parser_version:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        tables = {}
+        for name in meta['tables']:
+            table = feather.read_table(os.path.join(path, f'{name}.arrow'), memory_map=True)
+            tables[name] = table.to_pandas()
+        return tables
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+
+def purge_snapshots(parser_version, base_dir=None):
+    """
+    Elimina las instantáneas generadas con otra versión del parser o del formato
+    """
+    base_dir = base_dir or SNAPSHOT_DIR
+    if not os.path.isdir(base_dir):
+        return 0
+
+    removed = 0
+    for key in os.listdir(base_dir):
+        if key.startswith('.tmp-'):
+            continue
+        path = os.path.join(base_dir, key)
+        meta_path = os.path.join(path, META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stale = meta.get('store_version') != STORE_VERSION or meta.get('parser_version') != parser_version
+        except (OSError, ValueError):
+            stale = True
+        if stale:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
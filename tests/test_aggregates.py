@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import TransactionsCube, combine_aggregates
+
+
+@pytest.fixture
+def transacciones():
+    rng = np.random.default_rng(1)
+    n = 2000
+    return pd.DataFrame({
+        # Meses con huecos: el cubo cubre el rango completo
+        'Periodo': rng.choice([24289, 24290, 24293, 24300], n),
+        'Tipo': pd.Categorical(rng.choice(['Gasto', 'Ingreso', 'Transferencia'], n)),
+        'Categoria': pd.Categorical(rng.choice(['Comida', 'Ocio', 'Salario', 'Casa', 'Otros'], n)),
+        'Importe': rng.integers(-50_000, 50_000, n),
+    })
+
+
+def _expected(df):
+    importe = df['Importe']
+    return df.astype({'Tipo': object, 'Categoria': object}).assign(
+        ingresos=importe.where(importe > 0, 0) / 100,
+        gastos=(-importe).where(importe < 0, 0) / 100,
+        importe=importe / 100,
+        count=1,
+    ).groupby(['Periodo', 'Tipo', 'Categoria'])[['ingresos', 'gastos', 'importe', 'count']].sum()
+
+
+def _cells(cube):
+    p, t, c = np.nonzero(cube.count)
+    return pd.DataFrame({
+        'ingresos': cube.ingresos[p, t, c], 'gastos': cube.gastos[p, t, c],
+        'importe': cube.importe[p, t, c], 'count': cube.count[p, t, c],
+    }, index=pd.MultiIndex.from_arrays([cube.periods[p], cube.tipos[t], cube.categorias[c]],
+                                       names=['Periodo', 'Tipo', 'Categoria']))
+
+
+def test_cube_matches_groupby(transacciones):
+    cube = TransactionsCube.from_transactions(transacciones)
+    assert list(cube.periods) == list(range(24289, 24301))
+    pd.testing.assert_frame_equal(_cells(cube).sort_index(), _expected(transacciones).sort_index())
+
+
+def test_cube_from_aggregates_matches_transactions(transacciones):
+    # Dos trozos agregados por separado dan el mismo cubo que todas las filas
+    chunks = [TransactionsCube.aggregate(part) for part in (transacciones[:700], transacciones[700:])]
+    cube = TransactionsCube.from_aggregates(combine_aggregates(chunks))
+    direct = TransactionsCube.from_transactions(transacciones)
+    for measure in ('ingresos', 'gastos', 'importe', 'count'):
+        np.testing.assert_allclose(getattr(cube, measure), getattr(direct, measure))
+
+
+def test_period_totals(transacciones):
+    cube = TransactionsCube.from_transactions(transacciones)
+    month = transacciones[transacciones['Periodo'] == 24290]['Importe']
+    assert cube.ingresos_total(24290) == pytest.approx(month[month > 0].sum() / 100)
+    assert cube.gastos_total(24290) == pytest.approx(-month[month < 0].sum() / 100)
+    assert cube.ingresos_total(24291) == 0
+    assert cube.ingresos_total(20000) == 0
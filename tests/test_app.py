@@ -0,0 +1,22 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+CSV = (b"Fecha;Concepto;Importe;Categoria\n"
+       b"03/01/2024;Supermercado;-45,20;Comida\n"
+       b"15/01/2024;Nomina;1.850,00;Salario\n"
+       b"02/02/2024;Cine;-12,50;Ocio\n")
+
+
+def test_csv_only_upload_with_incremental_toggle():
+    at = AppTest.from_file(APP, default_timeout=120).run()
+    # La actualización incremental queda activada por defecto
+    assert at.sidebar.toggle[0].value
+    csv_uploader = next(u for u in at.sidebar.get('file_uploader') if 'CSV' in u.label)
+    csv_uploader.set_value(('movimientos.csv', CSV, 'text/csv'))
+    at.run()
+    assert not at.exception
+    assert not at.error
+    assert any('cargado' in s.value for s in at.sidebar.success)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import TransactionsCube
+from budget import BudgetMatrix
+
+
+def _presupuesto(periods, categorias, valores):
+    return pd.DataFrame({'Periodo': periods, 'Categoria': categorias, 'Valor': valores})
+
+
+def test_unsorted_budget_rows():
+    presupuesto = _presupuesto([24290, 24289, 24291, 24289], ['Ocio', 'Comida', 'Comida', 'Ocio'],
+                               [-1000, -2000, -3000, -4000])
+    matrix = BudgetMatrix.from_data(presupuesto, None)
+    assert list(matrix.periods) == [24289, 24290, 24291]
+    frame = matrix.frame(how='outer').set_index('Categoria')
+    assert frame.loc['Comida', 'Presupuesto'] == -50.0
+    assert frame.loc['Ocio', 'Presupuesto'] == -50.0
+
+
+def test_outer_join_keeps_categories_without_budget():
+    presupuesto = _presupuesto([24289], ['Comida'], [-10000])
+    transacciones = pd.DataFrame({'Periodo': [24289, 24289], 'Tipo': ['Gasto', 'Gasto'],
+                                  'Categoria': ['Comida', 'Ocio'], 'Importe': [-12000, -3000]})
+    matrix = BudgetMatrix.from_data(presupuesto, TransactionsCube.from_transactions(transacciones))
+    assert list(matrix.frame(how='inner')['Categoria']) == ['Comida']
+    outer = matrix.frame(how='outer').set_index('Categoria')
+    np.testing.assert_allclose(outer['Desviación'], [-20.0, -30.0])
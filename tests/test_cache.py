@@ -0,0 +1,53 @@
+import threading
+import time
+
+import numpy as np
+
+from cache import LRUCache, hash_bytes
+
+
+def test_hash_depends_on_content_and_version():
+    assert hash_bytes(b'libro') == hash_bytes(b'libro')
+    assert hash_bytes(b'libro') != hash_bytes(b'libro2')
+    assert hash_bytes(b'libro', 1) != hash_bytes(b'libro', 2)
+
+
+def test_evicts_least_recently_used_within_budget():
+    cache = LRUCache(max_bytes=3000)
+    for key in 'abc':
+        cache.put(key, np.zeros(125))  # 1000 bytes
+    cache.get('a')
+    cache.put('d', np.zeros(125))
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    assert cache.current_bytes == 3000
+    assert cache.stats()['expulsiones'] == 1
+
+
+def test_entry_over_max_entry_bytes_is_not_stored():
+    cache = LRUCache(max_bytes=10_000, max_entry_bytes=1000)
+    value = np.zeros(1000)
+    assert cache.put('grande', value) is value
+    assert 'grande' not in cache
+    assert cache.current_bytes == 0
+
+
+def test_get_or_compute_runs_once_for_concurrent_callers():
+    cache = LRUCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return np.ones(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('libro', compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.misses == 1 and cache.hits == 7
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+import cli
+import store
+from bench.generate import generate_workbook
+
+
+@pytest.fixture(scope='module')
+def workbooks(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('libros')
+    paths = [tmp / 'a.xlsx', tmp / 'b.xlsx']
+    for seed, path in enumerate(paths):
+        generate_workbook(str(path), n_tx=200, n_months=6, n_accounts=2, n_investments=2, seed=seed)
+    return [str(path) for path in paths]
+
+
+@pytest.mark.parametrize('flags, snapshots', [([], 1), (['--sin-instantaneas'], 0)])
+def test_several_workbooks_honour_snapshot_flag(workbooks, tmp_path, monkeypatch, flags, snapshots):
+    monkeypatch.setattr(store, 'SNAPSHOT_DIR', str(tmp_path / 'instantaneas'))
+    out = tmp_path / 'kpis.json'
+    assert cli.main([*workbooks, *flags, '-o', str(out)]) == 0
+    assert len(list((tmp_path / 'instantaneas').glob('*'))) == snapshots
+    report = json.loads(out.read_text())
+    # La segunda carga sale de la instantánea (si la hay) con el mismo resultado
+    assert cli.main([*workbooks, *flags, '-o', str(out)]) == 0
+    assert json.loads(out.read_text()) == report
@@ -0,0 +1,56 @@
+import io
+
+import pandas as pd
+import pytest
+
+from csv_ingest import DEFAULT_CATEGORY, aggregate_csv, csv_key, parse_dates, sniff_format
+
+SEMICOLON = ("Fecha;Concepto;Importe;Categoria\n"
+             "03/01/2024;Supermercado;-1.045,20;Comida\n"
+             "15/01/2024;Nomina;1.850,00;Salario\n"
+             "02/02/2024;Cine;-12,50;\n"
+             "fecha mala;Cine;-1,00;Ocio\n")
+COMMA = ("Fecha,Importe,Categoria,Tipo\n"
+         "2024-01-03,-1045.20,Comida,Gasto\n"
+         "2024-01-15,1850.00,Salario,Ingreso\n"
+         "2024-02-02,-12.50,,Gasto\n")
+
+
+def _upload(text, name):
+    f = io.BytesIO(text.encode())
+    f.name = name
+    return f
+
+
+@pytest.mark.parametrize('text, name, expected', [
+    (SEMICOLON, 'banco.csv', (';', ',')),
+    (COMMA, 'banco.csv', (',', '.')),
+    (COMMA.replace(',', '\t'), 'banco.tsv', ('\t', '.')),
+])
+def test_sniff_format(text, name, expected):
+    assert sniff_format(_upload(text, name)) == expected
+
+
+@pytest.mark.parametrize('text', [SEMICOLON, COMMA])
+def test_dialects_give_the_same_cells(text):
+    # Trozos de una fila: el resultado no depende del tamaño del trozo
+    cells, rows_read, rows_valid = aggregate_csv(_upload(text, 'banco.csv'), chunk_rows=1)
+    cells = cells.set_index(['Periodo', 'Categoria'])
+    assert rows_valid == 3
+    assert cells.loc[(24289, 'Comida'), 'gastos'] == 104520
+    assert cells.loc[(24289, 'Salario'), 'ingresos'] == 185000
+    assert cells.loc[(24290, DEFAULT_CATEGORY), 'importe'] == -1250
+    assert set(cells['Tipo']) == {'Gasto', 'Ingreso'}
+
+
+def test_parse_dates_reads_iso_before_dayfirst():
+    values = pd.Series(['2024-01-05', '05/01/2024', None, 'no es fecha'])
+    dates = parse_dates(values, dayfirst=True)
+    assert list(dates[:2]) == [pd.Timestamp('2024-01-05')] * 2
+    assert dates[2:].isna().all()
+
+
+def test_csv_key_depends_on_read_options():
+    source = _upload(COMMA, 'banco.csv')
+    assert csv_key(source) == csv_key(source, chunk_rows=10)
+    assert csv_key(source) != csv_key(source, dayfirst=False)
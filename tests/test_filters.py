@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import TransactionsCube
+from filters import Filters, TransactionsIndex
+
+
+@pytest.fixture(scope='module')
+def transacciones():
+    rng = np.random.default_rng(2)
+    n = 3000
+    categorias = ['Comida', 'Ocio', 'Salario', 'Casa']
+    return pd.DataFrame({
+        'Periodo': rng.integers(24289, 24313, n),
+        'Tipo': pd.Categorical(rng.choice(['Gasto', 'Ingreso'], n)),
+        # Categorías sin filas en el diccionario, como las compartidas entre tablas
+        'Categoria': pd.Categorical(rng.choice(categorias, n), categories=categorias + ['Sin uso']),
+        'Cuenta': pd.Categorical(rng.choice(['ING', 'BBVA', 'Efectivo'], n)),
+        'Nombre': pd.Categorical(rng.choice([f'Comercio {i}' for i in range(40)], n)),
+        'Importe': rng.integers(-20_000, 20_000, n),
+    })
+
+
+FILTERS = [
+    Filters(),
+    Filters(period_from=24295, period_to=24300),
+    Filters(categorias=('Ocio',)),
+    Filters(categorias=('Ocio', 'Casa'), cuentas=('ING',)),
+    Filters(period_from=24300, tipos=('Gasto',), nombres=('Comercio 3', 'Comercio 7', 'Comercio 39')),
+    Filters(period_to=24290, categorias=('Sin uso',)),
+    Filters(categorias=('No existe',)),
+]
+
+
+def _naive_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    if filters.period_from is not None:
+        mask &= df['Periodo'] >= filters.period_from
+    if filters.period_to is not None:
+        mask &= df['Periodo'] <= filters.period_to
+    for dim, values in filters.selections().items():
+        if values:
+            mask &= df[dim].isin(values)
+    return np.asarray(mask)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_select_matches_boolean_mask(transacciones, filters):
+    index = TransactionsIndex.from_data(transacciones)
+    # El índice guarda las filas ordenadas por periodo (orden estable)
+    order = np.argsort(transacciones['Periodo'].to_numpy(), kind='stable')
+    selected = np.sort(order[index.select(filters)])
+    np.testing.assert_array_equal(selected, np.flatnonzero(_naive_mask(transacciones, filters)))
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filtered_cube_matches_cube_of_filtered_rows(transacciones, filters):
+    mask = _naive_mask(transacciones, filters)
+    cube = TransactionsIndex.from_data(transacciones).cube(filters)
+    if not mask.any():
+        assert cube is None
+        return
+    expected = TransactionsCube.from_transactions(transacciones[mask])
+    for period in expected.periods:
+        assert cube.ingresos_total(period) == pytest.approx(expected.ingresos_total(period))
+        assert cube.gastos_total(period) == pytest.approx(expected.gastos_total(period))
@@ -0,0 +1,17 @@
+import pytest
+
+from bench.import_budget import APP_FORBIDDEN, CLI_FORBIDDEN, measure
+
+# Solo se comprueban los módulos cargados: los tiempos dependen de la máquina y
+# se vigilan con bench/import_budget.py
+
+
+@pytest.mark.parametrize('module', ['cli', 'utils'])
+def test_headless_modules_skip_ui_libraries(module):
+    _, _, loaded = measure([module], forbidden=CLI_FORBIDDEN, repeat=1)
+    assert loaded == []
+
+
+def test_app_defers_heavy_modules():
+    _, _, loaded = measure(['visuals'], base=['streamlit'], forbidden=APP_FORBIDDEN, repeat=1)
+    assert loaded == []
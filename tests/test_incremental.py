@@ -0,0 +1,103 @@
+import datetime
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import incremental
+import store
+from bench.generate import generate_workbook
+from cache import LRUCache
+from utils import TRANSPOSED_SHEETS, process_workbook
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+@pytest.fixture(scope='module')
+def versions(tmp_path_factory):
+    """
+    Un libro y su versión siguiente: filas añadidas al final de Transacciones
+    (una con categoría nueva) y un mes más en cada hoja transpuesta
+    """
+    tmp = tmp_path_factory.mktemp('libros')
+    v1, v2 = tmp / 'v1.xlsx', tmp / 'v2.xlsx'
+    generate_workbook(str(v1), n_tx=500, n_months=12, n_accounts=3, n_investments=3)
+    wb = openpyxl.load_workbook(v1)
+    ws = wb['Transacciones']
+    for i in range(50):
+        ws.append([datetime.datetime(2021, 1, 1 + i % 28), 'Comida', 'nuevo', 'Gasto', -10.5 - i, 'ING'])
+    ws.append([datetime.datetime(2021, 1, 9), 'Categoría nueva', 'nuevo', 'Gasto', -1, 'ING'])
+    for name in TRANSPOSED_SHEETS:
+        sheet = wb[name]
+        col = sheet.max_column + 1
+        sheet.cell(row=1, column=col, value=datetime.datetime(2021, 1, 1)).number_format = 'mmm-yy'
+        for row in range(2, sheet.max_row + 1):
+            sheet.cell(row=row, column=col, value=sheet.cell(row=row, column=col - 1).value)
+    wb.save(v2)
+    return v1.read_bytes(), v2.read_bytes()
+
+
+def _assert_same_tables(actual, expected):
+    assert set(actual) == set(expected)
+    for name, table in expected.items():
+        keys = [col for col in table.columns if col not in ('Importe', 'Valor')]
+        a = actual[name].sort_values(keys).reset_index(drop=True)
+        b = table.sort_values(keys).reset_index(drop=True)
+        pd.testing.assert_frame_equal(a, b, check_like=True)
+
+
+def test_refresh_matches_full_reprocess(versions):
+    v1, v2 = versions
+    _, state, _ = incremental.refresh_workbook(v1)
+    tables, _, report = incremental.refresh_workbook(v2, state)
+    assert report['Transacciones'] == 'incremental (+51 filas)'
+    assert all(report[name] == 'incremental (+1 fechas)' for name in TRANSPOSED_SHEETS if name in report)
+    _assert_same_tables(tables, process_workbook(v2))
+
+
+def test_refresh_without_openpyxl_internals(versions, monkeypatch):
+    v1, v2 = versions
+    _, state, _ = incremental.refresh_workbook(v1)
+    monkeypatch.setattr(incremental, 'WorkSheetParser', None)
+    tables, _, report = incremental.refresh_workbook(v2, state)
+    assert report['Transacciones'] == 'completa'
+    _assert_same_tables(tables, process_workbook(v2))
+
+
+def _upload(workbook, profile):
+    at = AppTest.from_file(APP, default_timeout=120).run()
+    next(t for t in at.sidebar.text_input if t.label == "Clave de perfil").input(profile)
+    at.sidebar.get('file_uploader')[0].set_value(('finanzas.xlsx', workbook, XLSX))
+    at.run()
+    assert not at.exception
+    return at
+
+
+def test_new_session_reloads_incrementally(versions, tmp_path, monkeypatch):
+    v1, v2 = versions
+    monkeypatch.setattr(incremental, 'STATE_DIR', str(tmp_path / 'estado'))
+    monkeypatch.setattr(store, 'SNAPSHOT_DIR', str(tmp_path / 'instantaneas'))
+    first = _upload(v1, 'hogar')
+    # Otra sesión (otro session_id) con el mes siguiente del mismo archivo
+    second = _upload(v2, 'hogar')
+    assert first.session_state is not second.session_state
+    captions = [c.value for c in second.sidebar.caption]
+    assert any('Transacciones: incremental (+51 filas)' in c for c in captions)
+
+
+def test_cached_workbook_saves_state_for_new_owner(versions, tmp_path, monkeypatch):
+    v1, _ = versions
+    monkeypatch.setattr(incremental, 'STATE_DIR', str(tmp_path))
+    source = tmp_path / 'finanzas.xlsx'
+    source.write_bytes(v1)
+    cache = LRUCache()
+    # Sin identidad estable no se escribe estado
+    incremental.load_incremental(str(source), cache=cache, owner=None, use_snapshots=False)
+    assert not list(tmp_path.glob('*.pkl'))
+    # El libro ya está en caché, pero el nuevo usuario necesita su estado
+    _, report = incremental.load_incremental(str(source), cache=cache, owner='perfil:hogar', use_snapshots=False)
+    assert report is None
+    assert incremental.load_state(str(source), 'perfil:hogar') is not None
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from lod import coarsen_history, stack_series
+
+
+def test_coarsen_history_keeps_last_month_of_each_bucket():
+    fechas = pd.date_range('2015-01-31', periods=96, freq='ME')
+    nombres = ['Cuenta A', 'Cuenta B', 'Cuenta C']
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Fecha': np.repeat(fechas, len(nombres)),
+        'Nombre': np.tile(nombres, len(fechas)),
+        'Valor': rng.integers(0, 100_000, len(fechas) * len(nombres)),
+    }).sample(frac=1, random_state=0)
+
+    coarse = coarsen_history(df, detail_months=36, freq='Q')
+    cutoff = df['Fecha'].max() - pd.DateOffset(months=36)
+    old = df[df['Fecha'] <= cutoff]
+    expected = (old.sort_values('Fecha')
+                .groupby([old['Fecha'].dt.to_period('Q'), 'Nombre'])['Valor'].last())
+    got = coarse[coarse['Fecha'] <= cutoff]
+    got = got.set_index([got['Fecha'].dt.to_period('Q'), 'Nombre'])['Valor']
+    pd.testing.assert_series_equal(got.sort_index(), expected.sort_index(), check_names=False)
+    # El detalle reciente se conserva entero
+    assert (coarse['Fecha'] > cutoff).sum() == (df['Fecha'] > cutoff).sum()
+
+
+def test_stack_series_ignores_unused_categories():
+    # Nombre comparte el diccionario de categorías con otras tablas
+    nombres = pd.Categorical(['Cuenta A', 'Cuenta B'], categories=['Cuenta A', 'Cuenta B', 'Supermercado'])
+    df = pd.DataFrame({'Fecha': pd.to_datetime(['2024-01-31', '2024-01-31']), 'Nombre': nombres, 'Valor': [1, 2]})
+    _, names, values, _ = stack_series(df)
+    assert names == ['Cuenta A', 'Cuenta B']
+    assert values.shape == (1, 2)
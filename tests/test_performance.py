@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import DateSeries
+from performance import InvestmentPositions
+
+
+def test_same_asset_and_date_rows_are_summed():
+    # El mismo fondo en los libros de dos personas: dos filas por fecha
+    fechas = pd.to_datetime(['2024-01-01', '2024-02-01'])
+    rows = []
+    for titulos in (1.0, 2.0):
+        for fecha, precio in zip(fechas, (500.0, 600.0)):
+            rows.append({'Tipo de Activo': 'Fondo', 'Nombre': 'Indexado', 'Categoría': 'Renta Variable',
+                         'Fecha': fecha, 'Títulos': titulos, 'Precio medio': 500.0, 'Precio actual': precio,
+                         'Valor Actual': int(titulos * precio * 100), 'Valor Compra': int(titulos * 500 * 100)})
+    inversiones = pd.DataFrame(rows)
+
+    returns = InvestmentPositions.from_frame(inversiones).returns()
+    serie = DateSeries.from_frame(inversiones, ['Valor Actual', 'Valor Compra'])
+    cartera = returns[returns['Nivel'] == 'Cartera'].iloc[0]
+    assert cartera['Valor Actual'] == 1800.0
+    assert cartera['Valor Actual'] == serie.value('Valor Actual')
+    assert cartera['Aportado'] == 1500.0
+    np.testing.assert_allclose(cartera['TWR'], 20.0)
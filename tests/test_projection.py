@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from projection import PERCENTILES, Assumptions, Projection
+
+ASSUMPTIONS = Assumptions(years=5, paths=6000, seed=7, initial_investments=50_000, initial_cash=10_000,
+                          initial_debt=20_000, monthly_income=3000, savings_rate=0.2, savings_volatility=300,
+                          debt_payment=400)
+
+
+def test_percentiles_match_numpy_on_all_paths():
+    projection = Projection(ASSUMPTIONS, chunk_paths=1000)
+    percentiles, negative = projection.run()
+
+    # Mismas trayectorias (misma semilla y bloques) guardadas enteras
+    rng = np.random.default_rng(ASSUMPTIONS.seed)
+    paths = np.vstack([projection.simulate_chunk(rng, 1000) for _ in range(6)])
+    expected = np.percentile(paths, PERCENTILES, axis=0)
+    spread = expected[-1] - expected[0]
+    for q, values in zip(PERCENTILES, expected):
+        np.testing.assert_array_less(np.abs(percentiles[q] - values), spread * 0.01 + 1e-6)
+    assert negative == pytest.approx((paths[:, -1] < 0).mean())
+
+
+def test_deterministic_paths():
+    a = Assumptions(years=2, paths=500, initial_investments=1000, initial_cash=500, initial_debt=1200,
+                    monthly_income=100, savings_rate=0.5, expected_return=0.0, volatility=0.0,
+                    debt_payment=100)
+    percentiles, negative = Projection(a, chunk_paths=128).run()
+    months = np.arange(1, a.months + 1)
+    expected = 1500 + 50 * months - np.maximum(1200 - 100 * months, 0)
+    for q in PERCENTILES:
+        np.testing.assert_allclose(percentiles[q], expected, atol=0.01)
+    assert negative == 0
+
+
+def test_same_seed_same_result():
+    first, _ = Projection(ASSUMPTIONS).run()
+    second, _ = Projection(ASSUMPTIONS).run()
+    for q in PERCENTILES:
+        np.testing.assert_array_equal(first[q], second[q])
+    ordered = np.vstack([first[q] for q in PERCENTILES])
+    assert (np.diff(ordered, axis=0) >= 0).all()
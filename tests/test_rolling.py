@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling import RollingWindows
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(3)
+    n = 30
+    periods = list(range(24289, 24289 + n))
+    ingresos = rng.integers(100_000, 300_000, n).tolist()
+    gastos = rng.integers(50_000, 250_000, n).tolist()
+    patrimonio = [None, None] + rng.integers(1_000_000, 5_000_000, n - 2).tolist()
+    return periods, ingresos, gastos, patrimonio
+
+
+def test_window_sums_match_pandas_rolling(history):
+    periods, ingresos, gastos, patrimonio = history
+    windows = RollingWindows((3, 6, 12))
+    windows.sync(periods, ingresos, gastos, patrimonio)
+    frame = windows.frame()
+    for window in windows.windows:
+        for column, values in (('ingresos', ingresos), ('gastos', gastos)):
+            expected = pd.Series(values).rolling(window).sum() / 100
+            np.testing.assert_allclose(frame[f'{column}_{window}m'], expected)
+        expected = pd.Series(patrimonio, dtype=float).pct_change(window, fill_method=None) * 100
+        np.testing.assert_allclose(frame[f'patrimonio_{window}m'], expected)
+
+
+def test_incremental_sync_matches_fresh_sync(history):
+    periods, ingresos, gastos, patrimonio = history
+    windows = RollingWindows()
+    assert windows.sync(periods[:24], ingresos[:24], gastos[:24], patrimonio[:24]) == 24
+    # Un mes nuevo cuesta un push; un mes corregido rehace desde él
+    assert windows.sync(periods[:25], ingresos[:25], gastos[:25], patrimonio[:25]) == 1
+    ingresos = ingresos.copy()
+    ingresos[20] += 1
+    assert windows.sync(periods, ingresos, gastos, patrimonio) == len(periods) - 20
+
+    fresh = RollingWindows()
+    fresh.sync(periods, ingresos, gastos, patrimonio)
+    pd.testing.assert_frame_equal(windows.frame(), fresh.frame())
+
+
+def test_push_rejects_gaps():
+    windows = RollingWindows()
+    windows.push(24289, 100, 50)
+    with pytest.raises(ValueError):
+        windows.push(24291, 100, 50)
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from bench.generate import generate_workbook
+from store import load_snapshot, purge_snapshots, save_snapshot
+from utils import PARSER_VERSION, process_workbook
+
+
+@pytest.fixture(scope='module')
+def tables(tmp_path_factory):
+    path = tmp_path_factory.mktemp('libros') / 'finanzas.xlsx'
+    generate_workbook(str(path), n_tx=300, n_months=12, n_accounts=3, n_investments=3)
+    return process_workbook(path.read_bytes())
+
+
+def test_snapshot_round_trip(tables, tmp_path):
+    save_snapshot('libro', tables, PARSER_VERSION, base_dir=str(tmp_path))
+    loaded = load_snapshot('libro', PARSER_VERSION, base_dir=str(tmp_path))
+    assert list(loaded) == list(tables)
+    for name, table in tables.items():
+        # Mismos valores y tipos, incluidas las categorías compartidas
+        pd.testing.assert_frame_equal(loaded[name], table.reset_index(drop=True))
+
+
+def test_snapshot_of_other_parser_version_is_discarded(tables, tmp_path):
+    save_snapshot('libro', tables, PARSER_VERSION, base_dir=str(tmp_path))
+    assert load_snapshot('libro', PARSER_VERSION + 1, base_dir=str(tmp_path)) is None
+    assert not (tmp_path / 'libro').exists()
+
+
+def test_purge_keeps_current_version(tables, tmp_path):
+    save_snapshot('actual', tables, PARSER_VERSION, base_dir=str(tmp_path))
+    save_snapshot('antigua', tables, PARSER_VERSION - 1, base_dir=str(tmp_path))
+    assert purge_snapshots(PARSER_VERSION, base_dir=str(tmp_path)) == 1
+    assert [p.name for p in tmp_path.iterdir()] == ['actual']
@@ -1,17 +1,62 @@
 
-import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import altair as alt
-from plotly.subplots import make_subplots
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import openpyxl
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from aggregates import period_label, to_cents
+from cache import hash_bytes
+from model import FinanceData
+from profiling import span
+from store import load_snapshot, save_snapshot
 
 warnings.filterwarnings('ignore')
 
+# Incrementar cuando cambie la lógica de procesado para invalidar las cachés
+PARSER_VERSION = 4
+
+# Columnas identificadoras que se leen de cada hoja conocida
+SHEET_COLUMNS = {
+    'Transacciones': ['Fecha', 'Categoria', 'Nombre', 'Tipo', 'Importe', 'Cuenta'],
+    'Presupuesto': ['Cuenta', 'Categoria', 'Tipo'],
+    'Activos': ['Nombre', 'Tipo de Cuenta'],
+    'Deudas': ['Nombre', 'Tipo de Deuda'],
+    'Inversiones': ['Tipo de Activo', 'Nombre', 'Categoría', 'Métrica'],
+}
+
+# Hojas con fechas como columnas: además de los ids se leen las columnas de fecha
+TRANSPOSED_SHEETS = ('Presupuesto', 'Activos', 'Deudas', 'Inversiones')
+
+# Dimensiones que se guardan como categóricas. Cada columna tiene un único
+# diccionario de etiquetas (ordenado) compartido por todas las tablas en que aparece
+DIMENSION_COLUMNS = ('Tipo', 'Categoria', 'Cuenta', 'Nombre', 'Tipo de Cuenta', 'Tipo de Deuda',
+                     'Tipo de Activo', 'Categoría', 'Mes_Año')
+
+def period_key(dates):
+    """
+    Convierte una serie de fechas en la clave entera de periodo año*12+mes
+    """
+    return (dates.dt.year * 12 + dates.dt.month).astype('int64')
+
+
+def add_period_columns(df):
+    """
+    Añade la clave entera 'Periodo' y la etiqueta 'Mes_Año' a partir de 'Fecha'.
+    Las etiquetas se generan una vez por periodo distinto, no por fila
+    """
+    if df is None or df.empty or 'Fecha' not in df.columns:
+        return df
+    periods = period_key(df['Fecha'])
+    uniques, inverse = np.unique(periods.to_numpy(), return_inverse=True)
+    labels = np.array([period_label(p) for p in uniques], dtype=object)
+    df['Periodo'] = periods
+    df['Mes_Año'] = pd.Series(labels[inverse], index=df.index, dtype='str')
+    return df
+
+
 def process_transposed_data(df, date_columns, id_columns):
     """
     Convierte datos transpuestos (fechas como columnas) a formato largo
@@ -37,7 +82,7 @@ def process_transposed_data(df, date_columns, id_columns):
     df_melted['Fecha'] = pd.to_datetime(df_melted['Fecha'], format='%b-%y', errors='coerce')
 
     # Filtrar valores no nulos
-    df_melted = df_melted.dropna(subset=['Valor'])
+    df_melted = df_melted.dropna(subset=['Fecha', 'Valor'])
     df_melted = df_melted[df_melted['Valor'] != 0]
 
     return df_melted
@@ -46,85 +91,284 @@ def process_transposed_data(df, date_columns, id_columns):
 def process_investments_data(df):
     """
     Procesa datos de inversiones con estructura compleja (multiheader)
-    Cada fecha tiene subcolumnas: Títulos, Precio medio, Precio actual
+    Cada activo ocupa una fila por métrica (Títulos, Precio medio, Precio actual)
+    con las fechas como columnas, y los ids solo en su primera fila.
+    Las celdas se llevan a un array activo × fecha × métrica con un único bincount
+    y los valores se calculan de una vez sobre él. Mismo resultado que rellenar,
+    hacer melt y pivot_table(sum): una fila por activo y fecha con alguna métrica
+    no nula, ordenadas por activo y fecha
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    id_cols = SHEET_COLUMNS['Inversiones']
+    keys, metric_col = id_cols[:-1], id_cols[-1]
+    date_cols = [col for col in df.columns if col not in id_cols]
+    if not date_cols:
+        return pd.DataFrame()
+
+    # Los huecos heredan el valor de la fila anterior, ids y celdas, como con ffill
+    df = df.ffill()
+    values = df[date_cols]
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in values.dtypes):
+        values = values.apply(pd.to_numeric, errors='coerce')
+    values = values.to_numpy(dtype=np.float64)
+
+    # Códigos de cada eje; -1 para activos, métricas o fechas no válidos
+    groups = df.groupby(keys, sort=True)
+    asset_codes = groups.ngroup().to_numpy()
+    assets = groups.size().index
+    metric_codes, metrics = pd.factorize(df[metric_col], sort=True)
+    dates = pd.to_datetime(pd.Series(date_cols, dtype=object), format='%b-%y', errors='coerce')
+    date_codes, dates = pd.factorize(dates, sort=True)
+
+    shape = (len(assets), len(dates), len(metrics))
+    valid = ((asset_codes >= 0) & (metric_codes >= 0))[:, None] & (date_codes >= 0)[None, :]
+    valid &= ~np.isnan(values) & (values != 0)
+    if not valid.any():
+        return pd.DataFrame()
+    rows, cols = np.nonzero(valid)
+    flat = np.ravel_multi_index((asset_codes[rows], date_codes[cols], metric_codes[rows]), shape)
+    size = int(np.prod(shape))
+    cube = np.bincount(flat, weights=values[rows, cols], minlength=size).reshape(shape)
+    present = np.bincount(flat, minlength=size).reshape(shape).any(axis=2)
+
+    a_idx, d_idx = np.nonzero(present)
+    inv_df = pd.DataFrame({key: assets.get_level_values(key)[a_idx] for key in keys})
+    inv_df['Fecha'] = dates[d_idx]
+    for m, metric in enumerate(metrics):
+        inv_df[metric] = cube[a_idx, d_idx, m]
+
+    # Títulos y precios se quedan como float; los valores resultantes, en céntimos
+    inv_df['Valor Actual'] = to_cents(inv_df['Títulos']*inv_df['Precio actual'])
+    inv_df['Valor Compra'] = to_cents(inv_df['Títulos']*inv_df['Precio medio'])
+    return inv_df
+
+
+def read_file_bytes(source):
+    """
+    Devuelve el contenido binario de un fichero subido, una ruta o un buffer
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def workbook_key(raw):
+    """
+    Clave de caché: huella del contenido del libro más la versión del parser
+    """
+    return hash_bytes(raw, PARSER_VERSION)
+
+
+def is_date_header(value):
+    """
+    Indica si la cabecera de una columna es una fecha (celda fecha o texto '%b-%y')
+    """
+    if isinstance(value, datetime):
+        return True
+    if isinstance(value, str):
+        return not pd.isna(pd.to_datetime(value, format='%b-%y', errors='coerce'))
+    return False
+
+
+def read_sheet(workbook, sheet_name):
+    """
+    Lee en modo streaming una hoja conocida quedándose solo con las columnas necesarias
+    """
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+
+    keep = select_columns(sheet_name, header)
+    return rows_to_frame(rows, keep, [header[i] for i in keep])
+
+
+def select_columns(sheet_name, header):
+    """
+    Posiciones de las columnas que se leen de una hoja: sus ids y, en las hojas
+    transpuestas, las columnas de fecha
     """
+    wanted = SHEET_COLUMNS[sheet_name]
+    return [i for i, name in enumerate(header)
+            if name in wanted or (sheet_name in TRANSPOSED_SHEETS and is_date_header(name))]
 
-def load_and_process_data(uploaded_file):
+
+def rows_to_frame(rows, keep, names):
+    records = []
+    for row in rows:
+        values = tuple(row[i] if i < len(row) else None for i in keep)
+        # Las filas completamente vacías se descartan, igual que read_excel
+        if any(v is not None for v in values):
+            records.append(values)
+
+    return pd.DataFrame.from_records(records, columns=names)
+
+
+def read_workbook(raw):
+    """
+    Abre el libro en modo solo lectura y carga en paralelo únicamente las hojas conocidas
+    """
+    workbook = openpyxl.load_workbook(BytesIO(raw), read_only=True, data_only=True)
+    try:
+        sheets = [name for name in SHEET_COLUMNS if name in workbook.sheetnames]
+        if not sheets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(sheets)) as pool:
+            frames = pool.map(lambda name: read_sheet(workbook, name), sheets)
+            return dict(zip(sheets, frames))
+    finally:
+        workbook.close()
+
+
+def load_and_process_data(uploaded_file, cache=None, use_snapshots=True, on_error=None):
     """
-    Carga y procesa el archivo Excel con todas las hojas
+    Carga y procesa el archivo Excel con todas las hojas.
+    Si se pasa una caché (p.ej. la compartida entre sesiones), los libros ya procesados
+    se sirven desde memoria; si no están, se buscan en las instantáneas en disco antes
+    de parsear el Excel.
+    Los errores se notifican a on_error (y se devuelve None) o, sin él, se propagan
     """
     try:
-        # Leer todas las hojas del Excel
-        excel_data = pd.read_excel(uploaded_file, sheet_name=None, engine='openpyxl')
-
-        data = {}
-
-        # Procesar Transacciones
-        if 'Transacciones' in excel_data:
-            trans_df = excel_data['Transacciones']
-            if not trans_df.empty:
-                trans_df['Fecha'] = pd.to_datetime(trans_df['Fecha'], errors='coerce')
-                trans_df['Mes_Año'] = trans_df['Fecha'].dt.strftime('%b-%Y')
-                trans_df['Importe'] = pd.to_numeric(trans_df['Importe'], errors='coerce')
-                data['transacciones'] = trans_df.dropna(subset=['Fecha', 'Importe'])
-
-        # Procesar Presupuesto
-        if 'Presupuesto' in excel_data:
-            pres_df = excel_data['Presupuesto']
-            if not pres_df.empty:
-                id_cols = ['Cuenta', 'Categoria', 'Tipo']
-                available_id_cols = [col for col in id_cols if col in pres_df.columns]
-                date_cols = [col for col in pres_df.columns if col not in id_cols]
-                data['presupuesto'] = process_transposed_data(pres_df, date_cols, available_id_cols)
-                data['presupuesto']['Mes_Año'] = data['presupuesto']['Fecha'].dt.strftime('%b-%Y')
-
-        # Procesar Saldos
-        if 'Activos' in excel_data:
-            saldos_df = excel_data['Activos']
-
-            if not saldos_df.empty:
-                id_cols = ['Nombre', 'Tipo de Cuenta']
-                available_id_cols = [col for col in id_cols if col in saldos_df.columns]
-                date_cols = [col for col in saldos_df.columns if col not in id_cols]
-                data['saldos'] = process_transposed_data(saldos_df, date_cols, available_id_cols)
-        # Procesar Deudas
-        if 'Deudas' in excel_data:
-            deudas_df = excel_data['Deudas']
-            if not deudas_df.empty:
-                id_cols = ['Nombre', 'Tipo de Deuda']
-                available_id_cols = [col for col in id_cols if col in deudas_df.columns]
-                date_cols = [col for col in deudas_df.columns if col not in id_cols]
-                data['deudas'] = process_transposed_data(deudas_df, date_cols, available_id_cols)
-
-        # Procesar Inversiones
-        if 'Inversiones' in excel_data:
-            inv_df = excel_data['Inversiones']
-            inv_df = inv_df.fillna(method = 'ffill')
-            data['inversiones'] = process_investments_data(inv_df)
-            if not inv_df.empty:
-                id_cols = ['Tipo de Activo', 'Nombre', 'Categoría', 'Métrica']
-                date_cols = [col for col in inv_df.columns if col not in id_cols]
-                available_id_cols = [col for col in id_cols if col in inv_df.columns]
-                data['inversiones'] = process_transposed_data(inv_df, date_cols, available_id_cols)
-                data['inversiones'] = data['inversiones'].pivot_table(
-                    index=["Tipo de Activo", "Nombre", "Categoría", "Fecha"],
-                    columns="Métrica",
-                    values="Valor",
-                    aggfunc="sum",
-                    fill_value=0
-                ).reset_index()
-                data['inversiones']['Valor Actual'] = data['inversiones']['Títulos']*data['inversiones']['Precio actual']
-                data['inversiones']['Valor Compra'] = data['inversiones']['Títulos']*data['inversiones']['Precio medio']
-                inv_un_df = data['inversiones'][['Valor Actual', 'Tipo de Activo', 'Fecha']].rename(columns={'Valor Actual': 'Valor', 'Tipo de Activo': 'Tipo de Cuenta'})
-                inv_un_df = inv_un_df.groupby(['Fecha'], as_index=False)['Valor'].sum()
-
-                inv_un_df['Nombre'] = 'Inversiones'
-                inv_un_df['Tipo de Cuenta'] = 'Inversiones'
-
-                data['saldos'] = pd.concat([data['saldos'], inv_un_df], ignore_index=True)
-
-        return data
+        with span('leer fichero'):
+            raw = read_file_bytes(uploaded_file)
+        with span('huella del libro'):
+            key = workbook_key(raw)
+
+        def build():
+            tables = None
+            if use_snapshots:
+                with span('cargar instantánea'):
+                    tables = load_snapshot(key, PARSER_VERSION)
+            if tables is None:
+                tables = process_workbook(raw)
+                if use_snapshots and tables:
+                    with span('guardar instantánea'):
+                        save_snapshot(key, tables, PARSER_VERSION)
+            return FinanceData.from_tables(tables, key=key)
+
+        # Con caché, si otra sesión está procesando el mismo libro se espera a su resultado
+        return build() if cache is None else cache.get_or_compute(key, build)
 
     except Exception as e:
-        st.error(f"Error al procesar el archivo: {str(e)}")
-        return None
\ No newline at end of file
+        if on_error is None:
+            raise
+        on_error(f"Error al procesar el archivo: {str(e)}")
+        return None
+
+
+def normalize_transactions(df):
+    """
+    Convierte Fecha e Importe (a céntimos), descarta las filas no válidas y añade el periodo
+    """
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df['Importe'] = pd.to_numeric(df['Importe'], errors='coerce')
+    df = df.dropna(subset=['Fecha', 'Importe'])
+    df['Importe'] = to_cents(df['Importe'])
+    return add_period_columns(df)
+
+
+def process_sheet(sheet_name, df):
+    """
+    Normaliza una hoja conocida ya leída. Devuelve None si está vacía
+    """
+    if df is None or df.empty:
+        return None
+
+    # Procesar Transacciones
+    if sheet_name == 'Transacciones':
+        return normalize_transactions(df)
+
+    # Procesar Inversiones
+    if sheet_name == 'Inversiones':
+        return add_period_columns(process_investments_data(df))
+
+    # Procesar Presupuesto, Saldos (hoja Activos) y Deudas
+    id_cols = SHEET_COLUMNS[sheet_name]
+    available_id_cols = [col for col in id_cols if col in df.columns]
+    date_cols = [col for col in df.columns if col not in id_cols]
+    df = process_transposed_data(df, date_cols, available_id_cols)
+    if not df.empty:
+        df['Valor'] = to_cents(pd.to_numeric(df['Valor']))
+    return add_period_columns(df)
+
+
+# Nombre de la tabla normalizada que produce cada hoja
+SHEET_TABLES = {
+    'Transacciones': 'transacciones',
+    'Presupuesto': 'presupuesto',
+    'Activos': 'saldos',
+    'Deudas': 'deudas',
+    'Inversiones': 'inversiones',
+}
+
+
+def assemble_tables(sheet_tables):
+    """
+    Une las hojas normalizadas en las tablas finales. El total de inversiones
+    por fecha se añade a los saldos como una cuenta más
+    """
+    data = {}
+    for sheet_name, df in sheet_tables.items():
+        if df is not None and not df.empty:
+            data[SHEET_TABLES[sheet_name]] = df
+
+    if 'inversiones' in data:
+        inv_un_df = data['inversiones'][['Valor Actual', 'Tipo de Activo', 'Fecha']].rename(columns={'Valor Actual': 'Valor', 'Tipo de Activo': 'Tipo de Cuenta'})
+        inv_un_df = inv_un_df.groupby(['Fecha'], as_index=False)['Valor'].sum()
+
+        inv_un_df['Nombre'] = 'Inversiones'
+        inv_un_df['Tipo de Cuenta'] = 'Inversiones'
+        add_period_columns(inv_un_df)
+
+        data['saldos'] = pd.concat([data.get('saldos'), inv_un_df], ignore_index=True)
+
+    return compact_tables(data)
+
+
+def compact_tables(tables):
+    """
+    Convierte las dimensiones de texto en categóricas con un diccionario por columna
+    común a todas las tablas: cada fila guarda un código entero y los cruces entre
+    tablas (p.ej. Categoria de presupuesto y transacciones) comparten categorías
+    """
+    dtypes = {}
+    for column in DIMENSION_COLUMNS:
+        frames = [df for df in tables.values() if column in df.columns]
+        if frames:
+            labels = pd.unique(np.concatenate([df[column].dropna().to_numpy(dtype=object) for df in frames]))
+            dtypes[column] = pd.CategoricalDtype(sorted(labels, key=str))
+    # astype devuelve tablas nuevas: las de cada hoja (estado incremental, cachés) no se tocan
+    for name, df in tables.items():
+        tables[name] = df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+    return tables
+
+
+def process_workbook_sheets(raw):
+    """
+    Lee y normaliza cada hoja conocida de un libro, sin ensamblar las tablas finales
+    """
+    # Leer solo las hojas y columnas conocidas del Excel
+    with span('leer Excel'):
+        excel_data = read_workbook(raw)
+    sheets = {}
+    for name, df in excel_data.items():
+        with span(f'procesar {name}', filas=len(df)):
+            sheets[name] = process_sheet(name, df)
+    return sheets
+
+
+def process_workbook(raw):
+    """
+    Procesa el contenido binario de un libro Excel con todas las hojas
+    """
+    sheets = process_workbook_sheets(raw)
+    with span('ensamblar tablas'):
+        return assemble_tables(sheets)
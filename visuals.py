@@ -1,20 +1,15 @@
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import altair as alt
-from plotly.subplots import make_subplots
-import numpy as np
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from streamlit_js_eval import streamlit_js_eval
 
-import openpyxl
-import warnings
+import os
+from functools import wraps
 
-from utils import load_and_process_data
+from profiling import start_recording, stop_recording, span, timed
 
+# pandas, plotly, openpyxl y el resto del procesado se importan dentro de las funciones
+# que los usan: la página y el formulario de carga se muestran sin esperar a cargarlos
+
+@timed()
 def load_page_config():
     with open('style.css') as f:
         st.sidebar.markdown(f'<style> {f.read()} </style>', unsafe_allow_html = True)
@@ -25,153 +20,453 @@ def load_page_config():
         layout="wide",
         initial_sidebar_state="expanded")
 
-def load_sidebar():
-    # Sidebar para carga de archivo
-    st.sidebar.header("📁 Cargar Datos")
-    uploaded_file = st.sidebar.file_uploader(
-        "Selecciona tu archivo Excel de finanzas",
-        type=['xlsx', 'xls'],
-        help="El archivo debe contener las hojas: Transacciones, Presupuesto, Saldos, Deudas, Inversiones"
-    )
+def get_data_cache():
+    # Caché del proceso compartida por todas las sesiones (libros procesados, datos
+    # filtrados, proyecciones y figuras), con claves por huella del contenido y un
+    # único presupuesto de memoria: no crece con el número de usuarios
+    from cache import shared_cache
+    return shared_cache()
+
+
+# Marca de "no está en caché": una figura puede ser None (gráfico sin datos)
+_MISSING = object()
+
+
+def cached_figure(chart_id, height_ratio):
+    """
+    Memoriza las figuras de un constructor por (huella del libro, gráfico, altura y
+    argumentos adicionales, p.ej. el rango elegido). El constructor recibe la altura
+    ya calculada en el argumento chart_height
+    """
+    def decorator(builder):
+        @wraps(builder)
+        def wrapper(data, *args):
+            container_height = st.session_state.get("container_height", 800)
+            chart_height = int(container_height * height_ratio)
+            key = ('figura', data.key, chart_id, chart_height, *args)
+            # Las figuras van en la caché compartida con claves ('figura', ...)
+            cache = get_data_cache()
+            with span(builder.__name__) as record:
+                figure = cache.get(key, _MISSING)
+                hit = figure is not _MISSING
+                if not hit:
+                    figure = builder(data, *args, chart_height=chart_height)
+                    cache.put(key, figure, size=_figure_size(figure))
+                if record is not None:
+                    record['atributos'] = {'caché': 'acierto' if hit else 'fallo'}
+            return figure
+        return wrapper
+    return decorator
+
+
+@timed()
+def render_chart(fig):
+    """
+    Muestra una figura y, si se dibujó en modo de nivel de detalle, informa de la reducción
+    """
+    if fig is None:
+        return
+    st.plotly_chart(fig, width='stretch')
+    lod_report = (fig.layout.meta or {}).get('lod') if isinstance(fig.layout.meta, dict) else None
+    if lod_report:
+        from lod import describe_reduction
+        st.caption(describe_reduction(lod_report))
+
+
+def _figure_size(figure):
+    """
+    Bytes aproximados de una figura para el presupuesto de la caché: se miden los
+    arrays de sus trazas y el layout sin volver a serializarla a JSON
+    """
+    from cache import estimate_size
+    figures = figure if isinstance(figure, tuple) else (figure,)
+    # _props son las propiedades asignadas tal cual (arrays numpy, tuplas...), sin copiarlas
+    return sum(estimate_size(part._props or {}) for fig in figures if fig is not None
+               for part in (*fig.data, fig.layout))
+
+
+def debug_enabled():
+    """
+    Panel de depuración oculto: se activa con ?debug=1 en la URL o DASHBOARD_DEBUG=1
+    """
+    return os.environ.get('DASHBOARD_DEBUG') == '1' or st.query_params.get('debug') == '1'
+
+
+def start_profiling():
+    return start_recording(enabled=debug_enabled())
+
+
+def show_debug_panel():
+    """
+    Cierra la medición de la ejecución y, en modo depuración, muestra los tramos en la barra lateral
+    """
+    recorder = stop_recording()
+    if recorder is None or not debug_enabled():
+        return
+    with st.sidebar.expander("⏱️ Tiempos de la ejecución", expanded=False):
+        st.caption(f"Total: {recorder.total_ms():,.1f} ms")
+        rows = [{
+            'Etapa': '\u2003' * record['profundidad'] + record['nombre'],
+            'ms': round(record['ms'], 1),
+            'Detalle': ', '.join(f'{k}={v}' for k, v in record.get('atributos', {}).items()),
+        } for record in recorder.spans]
+        st.dataframe(rows, hide_index=True, width='stretch')
+        st.download_button("Descargar traza (Chrome/Perfetto)", recorder.chrome_trace(),
+                           file_name=f"traza-{recorder.run_id}.json", mime='application/json')
+
+
+def update_cache_sizes(*datasets):
+    """
+    Vuelve a medir en la caché compartida los datos de la ejecución: sus vistas
+    derivadas se calculan después de guardarlos y también cuentan para el presupuesto
+    """
+    cache = get_data_cache()
+    for data in datasets:
+        if data:
+            cache.remeasure(data)
+
+
+@st.fragment
+def screen_height_probe():
+    """
+    Altura de pantalla del navegador. Va en su propio fragmento para que la respuesta
+    del componente vuelva a ejecutar solo el fragmento y no todo el script
+    """
+    from streamlit_js_eval import streamlit_js_eval
     screen_height = streamlit_js_eval(label="screen.height", js_expressions='screen.height')
     if screen_height:
         st.session_state["vh"] = screen_height
 
 
+def state_owner(source, profile=''):
+    """
+    Usuario al que pertenece el estado incremental de un libro, estable entre
+    sesiones: la ruta local basta para los ficheros de disco; para los subidos, el
+    usuario autenticado (st.user) o la clave de perfil escrita en la barra lateral.
+    None si no hay ninguno: sin identidad estable no se guarda estado en disco
+    """
+    if isinstance(source, str):
+        return ''
+    if st.user.get('is_logged_in'):
+        identity = st.user.get('email') or st.user.get('sub')
+        if identity:
+            return f'usuario:{identity}'
+    return f'perfil:{profile}' if profile else None
 
 
-    if uploaded_file is not None:
-        with st.spinner('Procesando archivo...'):
-            data = load_and_process_data(uploaded_file)
+def purge_stale_files():
+    """
+    Limpieza de ficheros en disco que ya no se usan, una vez por proceso
+    """
+    global _files_purged
+    if _files_purged:
+        return
+    _files_purged = True
+    from incremental import purge_states
+    from store import purge_snapshots
+    from utils import PARSER_VERSION
+    # Instantáneas de otras versiones del parser: su clave ya no se volverá a pedir
+    purge_snapshots(PARSER_VERSION)
+    purge_states(PARSER_VERSION)
 
-        if data:
-            st.sidebar.success("✅ Archivo cargado exitosamente!")
-            return data
-        # Button to re-render
 
-def load_summary_kpis(data):
-    if 'transacciones' in data and not data['transacciones'].empty:
+_files_purged = False
 
 
-        trans_df_base = data['transacciones']
+def show_error(message):
+    st.error(message)
 
-        trans_df_base['Mes_Año_dt'] = pd.to_datetime(trans_df_base['Mes_Año'], format='%b-%Y')
 
-        trans_df = trans_df_base[trans_df_base['Mes_Año_dt'] == trans_df_base['Mes_Año_dt'].max()]
-        max_date = trans_df['Mes_Año'].max()
+@timed()
+def load_sidebar():
+    # Sidebar para carga de archivo
+    st.sidebar.header("📁 Cargar Datos")
+    uploaded_files = st.sidebar.file_uploader(
+        "Selecciona tus archivos Excel de finanzas",
+        type=['xlsx', 'xls'],
+        accept_multiple_files=True,
+        help="El archivo debe contener las hojas: Transacciones, Presupuesto, Saldos, Deudas, Inversiones. "
+             "Puedes subir varios (uno por año o por persona) y se unirán"
+    )
+    folder = st.sidebar.text_input("O carpeta local con archivos .xlsx", help="Se cargan todos los .xlsx de la carpeta")
+    csv_files = st.sidebar.file_uploader(
+        "Movimientos bancarios (CSV/TSV)",
+        type=['csv', 'tsv', 'txt'],
+        accept_multiple_files=True,
+        help="Exportaciones con columnas Fecha e Importe (y opcionalmente Categoria y Tipo). "
+             "Se leen por trozos y se agregan por mes, sin límite de filas"
+    )
+    with st.sidebar:
+        screen_height_probe()
+
+    sources = list(uploaded_files or [])
+    if folder:
+        from workbooks import list_folder_workbooks
+        folder_files = list_folder_workbooks(folder)
+        if not folder_files:
+            st.sidebar.warning("No se han encontrado archivos .xlsx en la carpeta")
+        sources += folder_files
+
+    merge_mode = None
+    if len(sources) + len(csv_files or []) > 1:
+        from workbooks import MERGE_MEMBERS, MERGE_PERIODS
+        merge_mode = st.sidebar.radio(
+            "Los archivos corresponden a", [MERGE_PERIODS, MERGE_MEMBERS],
+            format_func=lambda mode: "Distintos periodos" if mode == MERGE_PERIODS else "Distintas personas",
+            help="Periodos: las fechas solapadas se toman del archivo más reciente. Personas: todo se suma"
+        )
+
+    incremental = st.sidebar.toggle(
+        "Actualización incremental", value=True,
+        help="Reutiliza la última carga de un archivo con el mismo nombre y procesa solo las filas y fechas nuevas"
+    )
+    profile = ''
+    if incremental and not st.user.get('is_logged_in'):
+        profile = st.sidebar.text_input(
+            "Clave de perfil", type='password',
+            help="Identifica tus cargas entre sesiones para la actualización incremental de archivos subidos. "
+                 "Sin clave, cada sesión procesa el archivo completo"
+        )
 
-        st.markdown(f"<span style='color:white'>Fecha evaluada: {max_date}</span>", unsafe_allow_html=True)
-        prev_m = trans_df_base['Mes_Año_dt'].max() - relativedelta(months=1)
-        trans_df_prev = trans_df_base[trans_df_base['Mes_Año_dt'] == prev_m]
-        # Métricas principales
-        col1, col2 = st.columns(2)
-        ingresos_total = trans_df[trans_df['Importe'] > 0]['Importe'].sum()
-        ingresos_prev = trans_df_prev[trans_df_prev['Importe'] > 0]['Importe'].sum()
-        growth_ingresos = (ingresos_total - ingresos_prev) * 100/ingresos_prev
+    if sources or csv_files:
+        from csv_ingest import attach_csv_transactions, load_csv_transactions
+        from incremental import load_incremental
+        from model import FinanceData
+        from utils import load_and_process_data
+        from workbooks import MERGE_PERIODS, load_workbooks
+
+        # Aquí y no al abrir la página: no retrasa el formulario de carga
+        purge_stale_files()
+        merge_mode = merge_mode or MERGE_PERIODS
+        cache = get_data_cache()
+        report = None
+        data = None
+        with st.spinner('Procesando archivo...'):
+            if len(sources) > 1:
+                try:
+                    data = load_workbooks(sources, mode=merge_mode, cache=cache)
+                except Exception as e:
+                    st.error(f"Error al procesar los archivos: {str(e)}")
+                    data = None
+            elif sources and incremental:
+                try:
+                    owner = state_owner(sources[0], profile)
+                    data, report = load_incremental(sources[0], cache=cache, owner=owner)
+                except Exception as e:
+                    st.sidebar.warning(f"Carga incremental no disponible, se procesa el archivo completo: {e}")
+                    data = load_and_process_data(sources[0], cache=cache, on_error=show_error)
+            elif sources:
+                data = load_and_process_data(sources[0], cache=cache, on_error=show_error)
+
+        if csv_files:
+            with st.spinner('Agregando movimientos...'):
+                try:
+                    csv_key, cells, csv_report = load_csv_transactions(csv_files, cache=cache)
+                    data = attach_csv_transactions(data or FinanceData(), cells, csv_key,
+                                                   replace_periods=merge_mode == MERGE_PERIODS)
+                    report = {**(report or {}), **csv_report}
+                except Exception as e:
+                    st.error(f"Error al procesar los movimientos: {str(e)}")
 
-        gastos_total = abs(trans_df[trans_df['Importe'] < 0]['Importe'].sum())
-        gastos_prev = abs(trans_df_prev[trans_df_prev['Importe'] < 0]['Importe'].sum())
-        growth_gastos = (gastos_total - gastos_prev) * 100 / gastos_prev
+        if data:
+            st.sidebar.success("✅ Archivo cargado exitosamente!")
+            if report:
+                st.sidebar.caption(" · ".join(f"{sheet}: {status}" for sheet, status in report.items()))
+            stats = cache.stats()
+            st.sidebar.caption(
+                f"Caché compartida: {stats['aciertos']} aciertos · {stats['fallos']} fallos "
+                f"({stats['tasa_aciertos']:.0%}) · {stats['bytes'] / 1024 ** 2:,.1f} "
+                f"de {stats['max_bytes'] / 1024 ** 2:,.0f} MB"
+            )
+            return data
+        # Button to re-render
 
-        porcentaje_ahorro = (ingresos_total - gastos_total) * 100 / ingresos_total
-        porcentaje_ahorro_prev = (ingresos_prev - gastos_prev) * 100 / ingresos_prev
-        growth_ahorro = porcentaje_ahorro - porcentaje_ahorro_prev
+def _data_periods(data):
+    """
+    Periodos con datos en cualquier tabla, para el selector de rango de fechas
+    """
+    periods = set()
+    if data.cubo is not None:
+        periods.update(int(p) for p in data.cubo.periods)
+    for series in (data.serie_saldos, data.serie_deudas, data.serie_inversiones):
+        if series is not None:
+            periods.update(int(p) for p in series.periods)
+    return sorted(periods)
 
-        balance_neto = ingresos_total - gastos_total
-        balance_neto_prev = ingresos_prev - gastos_prev
-        growth_balance = (balance_neto - balance_neto_prev) * 100 / balance_neto_prev
 
+@timed()
+def load_filters(data):
+    """
+    Filtros de la barra lateral (rango de fechas, Tipo, Categoria, Cuenta y Nombre)
+    aplicados a todos los paneles. Devuelve los datos filtrados
+    """
+    from aggregates import period_label
+    from filters import Filters, apply_filters
+
+    periods = _data_periods(data)
+    index = data.indice
+    with st.sidebar.expander("🔎 Filtros", expanded=False):
+        period_from = period_to = None
+        if len(periods) > 1:
+            first, last = st.select_slider("Rango de fechas", options=periods, value=(periods[0], periods[-1]),
+                                           format_func=period_label, key=f'filtro_fechas_{data.widget_key}')
+            period_from = first if first != periods[0] else None
+            period_to = last if last != periods[-1] else None
+
+        selections = {}
+        if index is not None:
+            for dim, label in (('Tipo', "Tipo"), ('Categoria', "Categoría"), ('Cuenta', "Cuenta"), ('Nombre', "Nombre")):
+                options = index.options(dim)
+                if len(options) > 1:
+                    selections[dim] = tuple(st.multiselect(label, options, placeholder="Todas",
+                                                           key=f'filtro_{dim}_{data.widget_key}'))
+
+    filters = Filters(period_from, period_to, selections.get('Tipo', ()), selections.get('Categoria', ()),
+                      selections.get('Cuenta', ()), selections.get('Nombre', ()))
+    if not filters:
+        return data
+
+    # Cada combinación de filtros se calcula una vez: volver a una ya vista es inmediato
+    cache = get_data_cache()
+    key = ('filtros', data.key, filters.key())
+    filtered = cache.get(key)
+    if filtered is None:
+        filtered = apply_filters(data, filters)
+        cache.put(key, filtered)
+    if not filtered:
+        st.sidebar.warning("Ningún dato cumple los filtros")
+    return filtered
+
+
+@timed()
+def load_summary_kpis(data, period=None):
+    from kpis import summary_kpis
+    kpis = summary_kpis(data, period)
+    if kpis is not None:
+        # Métricas principales (la fecha evaluada la muestra el selector del panel)
+        col1, col2 = st.columns(2)
         with col1:
-            st.metric(f"Ingresos Totales", f"€{ingresos_total:,.2f}", str(round(growth_ingresos, 2)) + '%')
+            st.metric(f"Ingresos Totales", f"€{kpis['ingresos']:,.2f}", str(round(kpis['ingresos_variacion'], 2)) + '%')
         with col2:
-            st.metric(f"Gastos Totales", f"€{gastos_total:,.2f}", str(round(growth_gastos, 2)) + '%', 'inverse')
+            st.metric(f"Gastos Totales", f"€{kpis['gastos']:,.2f}", str(round(kpis['gastos_variacion'], 2)) + '%', 'inverse')
         with col1:
-            st.metric(f"Balance Neto", f"€{balance_neto:,.2f}", str(round(growth_balance, 2)) + '%')
+            st.metric(f"Balance Neto", f"€{kpis['balance_neto']:,.2f}", str(round(kpis['balance_neto_variacion'], 2)) + '%')
         with col2:
-            st.metric(f"Porcentaje de ahorro", f"{porcentaje_ahorro:,.2f} %", str(round(growth_ahorro, 2)) + '%')
-
-def load_investment_kpis(data):
-    if 'inversiones' in data and not data['inversiones'].empty:
-        inv_df = data['inversiones']
-        inversiones_actual = inv_df.groupby('Fecha')['Valor Actual'].sum().iloc[-1] if not inv_df.empty else 0
-        inversiones_lm = inv_df.groupby('Fecha')['Valor Actual'].sum().iloc[-2] if not inv_df.empty else 0
-        inversiones_compra = inv_df.groupby('Fecha')['Valor Compra'].sum().iloc[-1] if not inv_df.empty else 0
-        renta_variable = inv_df[inv_df['Categoría'] == 'Renta Variable'].groupby('Fecha')['Valor Actual'].sum().iloc[-1] if not inv_df.empty else 0
-        renta_variable_lm = inv_df[inv_df['Categoría'] == 'Renta Variable'].groupby('Fecha')['Valor Actual'].sum().iloc[-2] if not inv_df.empty else 0
-        prc_renta_variable = renta_variable * 100 / inversiones_actual
-        prc_renta_variable_lm = renta_variable_lm * 100 / inversiones_lm
-        growth_renta_variable = prc_renta_variable - prc_renta_variable_lm
-        rentabilidad = (inversiones_actual - inversiones_compra) * 100 / inversiones_compra
-
-
+            st.metric(f"Porcentaje de ahorro", f"{kpis['porcentaje_ahorro']:,.2f} %",
+                      str(round(kpis['porcentaje_ahorro_variacion'], 2)) + '%')
+
+
+@timed()
+def load_rolling_kpis(data, period=None):
+    import math
+    from kpis import rolling_kpis
+    from rolling import WINDOWS
+
+    kpis = rolling_kpis(data, period)
+    if kpis is None:
+        return
+    window = st.radio("Ventana móvil", WINDOWS, index=len(WINDOWS) - 1, horizontal=True,
+                      format_func=lambda w: f"{w} meses", key=f'ventana_{data.widget_key}')
+
+    def value(number, fmt):
+        # Sin historia suficiente para la ventana no hay valor
+        return '—' if math.isnan(number) else fmt.format(number)
+
+    def change(number, unit='%'):
+        return None if math.isnan(number) else f"{number:,.2f}{unit} interanual"
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(f"Ingresos {window} meses", value(kpis[f'ingresos_{window}m'], '€{:,.2f}'),
+                  change(kpis[f'ingresos_{window}m_interanual']))
+    with col2:
+        st.metric(f"Gastos {window} meses", value(kpis[f'gastos_{window}m'], '€{:,.2f}'),
+                  change(kpis[f'gastos_{window}m_interanual']), 'inverse')
+    with col1:
+        st.metric(f"Ahorro {window} meses", value(kpis[f'ahorro_{window}m'], '{:,.2f} %'),
+                  change(kpis[f'ahorro_{window}m_interanual'], ' pp'))
+    with col2:
+        st.metric(f"Patrimonio {window} meses", value(kpis[f'patrimonio_{window}m'], '{:+,.2f} %'),
+                  change(kpis['patrimonio_interanual']))
+
+@timed()
+def load_investment_kpis(data, date=None):
+    from kpis import investment_kpis, investment_returns
+    kpis = investment_kpis(data, date)
+    if kpis is not None:
         # Métricas principales
         col1, col2 = st.columns(2)
 
-        trans_df_base = data['inversiones']
-        trans_df_base['Mes_Año'] = trans_df_base['Fecha'].dt.strftime('%b-%Y')
-        trans_df_base['Mes_Año_dt'] = pd.to_datetime(trans_df_base['Mes_Año'], format='%b-%Y')
-
-        trans_df = trans_df_base[trans_df_base['Mes_Año_dt'] == trans_df_base['Mes_Año_dt'].max()]
-        max_date = trans_df['Mes_Año'].max()
-
         with col1:
-            st.metric(f"Inversión Actual", f"€{inversiones_actual:,.2f}", str(round(rentabilidad, 2)) + '%')
+            st.metric(f"Inversión Actual", f"€{kpis['inversion_actual']:,.2f}", str(round(kpis['rentabilidad'], 2)) + '%')
         with col2:
-            st.metric(f"Renta variable", f"{prc_renta_variable:,.2f}%", str(round(growth_renta_variable, 2)) + '%')
-
-
-
-def load_saldo_kpis(data):
-    if 'saldos' in data and not data['saldos'].empty:
-        saldos_df = data['saldos']
+            st.metric(f"Renta variable", f"{kpis['renta_variable']:,.2f}%",
+                      str(round(kpis['renta_variable_variacion'], 2)) + '%')
 
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("TWR anual", f"{kpis['twr_anual']:,.2f}%", f"{kpis['twr']:,.2f}% acumulada", 'off',
+                      help="Rentabilidad ponderada por tiempo: no depende de cuándo ni cuánto se aporta")
+        with col2:
+            st.metric("TIR anual", f"{kpis['tir_anual']:,.2f}%",
+                      help="Rentabilidad ponderada por dinero (XIRR) de las aportaciones y el valor actual")
+
+        with st.expander("Rentabilidad por activo"):
+            st.dataframe(investment_returns(data, date), hide_index=True, column_config={
+                'Valor Actual': st.column_config.NumberColumn(format='€%.2f'),
+                'Valor Compra': st.column_config.NumberColumn(format='€%.2f'),
+                'Aportado': st.column_config.NumberColumn(format='€%.2f'),
+                'TWR': st.column_config.NumberColumn(format='%.2f%%'),
+                'TWR anual': st.column_config.NumberColumn(format='%.2f%%'),
+                'TIR anual': st.column_config.NumberColumn(format='%.2f%%'),
+            })
+
+
+@timed()
+def load_saldo_kpis(data, date=None):
+    from kpis import saldo_kpis
+    kpis = saldo_kpis(data, date)
+    if kpis is not None:
         # Métricas principales
         col1, col2, col3 = st.columns(3)
-        saldo_actual = saldos_df.groupby('Fecha')['Valor'].sum().iloc[-1] if not saldos_df.empty else 0
-        saldo_pm = saldos_df.groupby('Fecha')['Valor'].sum().iloc[-2] if not saldos_df.empty else 0
-        growth_saldo = (saldo_actual - saldo_pm) * 100/saldo_pm
-
-        deuda_actual = data['deudas'].groupby('Fecha')['Valor'].sum().iloc[-1] if not data['deudas'].empty else 0
-        deuda_pm = data['deudas'].groupby('Fecha')['Valor'].sum().iloc[-2] if not data['deudas'].empty else 0
-        growth_deuda = (deuda_actual - deuda_pm) * 100 / deuda_pm
-
-        porc_deuda_actual = round(deuda_actual*100/saldo_actual, 2)
-        porc_deuda_pm = round(deuda_pm*100/saldo_pm, 2)
-        growth_porc_deuda = porc_deuda_actual - porc_deuda_pm
-
-        trans_df_base = data['transacciones']
-        trans_df_base['Mes_Año_dt'] = pd.to_datetime(trans_df_base['Mes_Año'], format='%b-%Y')
-        trans_df = trans_df_base[trans_df_base['Mes_Año_dt'] == trans_df_base['Mes_Año_dt'].max()]
-        max_date = trans_df['Mes_Año'].max()
 
         with col1:
-            st.metric(f"Patrimonio", f"€{saldo_actual:,.2f}", str(round(growth_saldo, 2)) + '%')
+            st.metric(f"Patrimonio", f"€{kpis['patrimonio']:,.2f}", str(round(kpis['patrimonio_variacion'], 2)) + '%')
         with col2:
-            st.metric(f"Deuda", f"€{deuda_actual:,.2f}", str(round(growth_deuda, 2)) + '%', 'inverse')
+            st.metric(f"Deuda", f"€{kpis['deuda']:,.2f}", str(round(kpis['deuda_variacion'], 2)) + '%', 'inverse')
         with col3:
-            st.metric(f"Endeudamiento", f"{porc_deuda_actual:,.2f}%", str(round(growth_porc_deuda, 2)) + '%', 'inverse')
+            st.metric(f"Endeudamiento", f"{kpis['endeudamiento']:,.2f}%",
+                      str(round(kpis['endeudamiento_variacion'], 2)) + '%', 'inverse')
 
 
-def create_transactions_charts(df):
+@cached_figure('transacciones', 0.35)
+def create_transactions_charts(data, chart_height):
     """
-    Crea gráficos para el análisis de transacciones
+    Crea gráficos para el análisis de transacciones a partir del cubo mensual
     """
-    if df is None or df.empty:
-        return None, None, None, None
+    import plotly.express as px
 
-    # Agregar columna de mes-año para agrupación
-    df['Mes_Año'] = df['Fecha'].dt.strftime('%b-%Y').astype(str)
+    if data.cubo is None:
+        return None, None
 
-    # Gráfico 1: Ingresos vs Gastos por mes
-    monthly_summary = df.groupby(['Mes_Año', 'Tipo'])['Importe'].sum().reset_index()
-    monthly_summary['Importe'] = monthly_summary['Importe'].abs()
-    monthly_summary['Mes_Año_dt'] = pd.to_datetime(monthly_summary['Mes_Año'], format='%b-%Y')
-    monthly_summary = monthly_summary.sort_values('Mes_Año_dt')
+    # Gráfico 1: Ingresos vs Gastos por mes (ya ordenado por periodo)
+    monthly_summary = data.resumen_mensual
     fig1 = px.bar(monthly_summary, x='Mes_Año', y='Importe', color='Tipo',
                   barmode='group', title = 'Evolución de Ingesos vs Gastos')
 
-    container_height = st.session_state.get("container_height", 800)
-    chart_height = int(container_height * 0.35)
+    # Medias móviles de ingresos y gastos; se muestra la ventana más larga
+    if data.ventanas is not None:
+        import plotly.graph_objects as go
+        rolling = data.ventanas.frame()
+        rolling = rolling[rolling['Periodo'].between(data.cubo.periods[0], data.cubo.periods[-1])]
+        longest = max(data.ventanas.windows)
+        for window in data.ventanas.windows:
+            for measure, label in (('ingresos', 'Ingresos'), ('gastos', 'Gastos')):
+                fig1.add_trace(go.Scatter(
+                    x=rolling['Mes_Año'], y=rolling[f'{measure}_{window}m'] / window, mode='lines',
+                    name=f'{label} media {window}m', visible=True if window == longest else 'legendonly',
+                ))
+
     fig1.update_layout(
         autosize=True,
         plot_bgcolor="#0f172a",  # chart area
@@ -200,12 +495,8 @@ def create_transactions_charts(df):
     fig1.update_yaxes(title=None)
 
     # Gráfico 2: Gastos por categoría
-    gastos_df = df[df['Tipo'] == 'Gasto'] if 'Tipo' in df.columns else df[df['Importe'] < 0]
-    if not gastos_df.empty:
-        gastos_df['Mes_Año_dt'] = pd.to_datetime(gastos_df['Mes_Año'], format='%b-%Y')
-        gastos_f_df = gastos_df[gastos_df['Mes_Año_dt'] == gastos_df['Mes_Año_dt'].max()]
-        max_date = gastos_f_df['Mes_Año'].max()
-        gastos_categoria = gastos_f_df.groupby('Categoria')['Importe'].sum().abs().reset_index()
+    gastos_categoria = data.gastos_por_categoria
+    if not gastos_categoria.empty:
         fig2 = px.bar(gastos_categoria, x='Importe', y='Categoria', orientation='h', title = f'Distribución de gastos')
         fig2.update_layout(
             autosize=True,
@@ -230,17 +521,35 @@ def create_transactions_charts(df):
 
     return fig1, fig2
 
-def create_balance_chart(df):
+@cached_figure('saldos', 0.45)
+def create_balance_chart(data, chart_height):
     """
     Crea gráfico de evolución de saldos
     """
-    if df is None or df.empty:
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from aggregates import from_cents
+    from lod import reduce_series, stack_series
+
+    if data.saldos.empty:
         return None
-    container_height = st.session_state.get("container_height", 800)
-    chart_height = int(container_height * 0.45)
 
-    fig = px.area(df, x='Fecha', y='Valor', color='Nombre', title = 'Distribución del patrimonio',
-                  markers=True)
+    df, lod_report = reduce_series(data.saldos)
+    df['Valor'] = from_cents(df['Valor'])
+    if lod_report['webgl']:
+        # Scattergl no admite stackgroup: se apilan los acumulados a mano
+        dates, names, values, stacked = stack_series(df)
+        fig = go.Figure(layout=dict(title='Distribución del patrimonio'))
+        for i, name in enumerate(names):
+            fig.add_trace(go.Scattergl(
+                x=dates, y=stacked[:, i], customdata=values[:, i], name=str(name), mode='lines',
+                fill='tozeroy' if i == 0 else 'tonexty', hovertemplate='%{customdata:,.2f}'
+            ))
+    else:
+        fig = px.area(df, x='Fecha', y='Valor', color='Nombre', title = 'Distribución del patrimonio',
+                      markers=not lod_report['reduced'])
+    if lod_report['reduced']:
+        fig.update_layout(meta={'lod': lod_report})
     fig.update_layout(
         autosize=True,
         plot_bgcolor="#0f172a",  # chart area
@@ -270,15 +579,28 @@ def create_balance_chart(df):
     return fig
 
 
-def create_debt_chart(df):
+@cached_figure('deudas', 0.45)
+def create_debt_chart(data, chart_height):
     """
     Crea gráfico de evolución de deudas
     """
-    if df is None or df.empty:
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from aggregates import from_cents
+    from lod import reduce_series
+
+    if data.deudas.empty:
         return None
-    container_height = st.session_state.get("container_height", 800)
-    chart_height = int(container_height * 0.45)
-    fig = px.bar(df, x='Fecha', y='Valor', color='Nombre', title = 'Evolución de la deuda')
+    df, lod_report = reduce_series(data.deudas)
+    df['Valor'] = from_cents(df['Valor'])
+    if lod_report['webgl']:
+        fig = go.Figure(layout=dict(title='Evolución de la deuda'))
+        for name, serie in df.groupby('Nombre', sort=False, observed=True):
+            fig.add_trace(go.Scattergl(x=serie['Fecha'], y=serie['Valor'], name=str(name), mode='lines'))
+    else:
+        fig = px.bar(df, x='Fecha', y='Valor', color='Nombre', title = 'Evolución de la deuda')
+    if lod_report['reduced']:
+        fig.update_layout(meta={'lod': lod_report})
     fig.update_layout(
         autosize=True,
         plot_bgcolor="#0f172a",  # chart area
@@ -308,23 +630,21 @@ def create_debt_chart(df):
     return fig
 
 
-def create_investment_chart(df):
+@cached_figure('inversiones', 0.4)
+def create_investment_chart(data, chart_height):
     """
-    Crea gráfico de evolución de inversiones
+    Crea gráfico de evolución de inversiones a partir de la serie de totales por fecha
     """
-    if df is None or df.empty:
+    import plotly.express as px
+
+    series = data.serie_inversiones
+    if series is None:
         return None
 
-    df_grouped = (
-        df.groupby("Fecha")[["Valor Actual", "Valor Compra"]]
-        .sum()
-        .reset_index()
-    )
+    df_grouped = series.frame()
     fig = px.line(df_grouped, x='Fecha', y=['Valor Actual', 'Valor Compra'],
                   markers=True, title='Evolución de las inversiones vs valor de compra')
 
-    container_height = st.session_state.get("container_height", 800)
-    chart_height = int(container_height * 0.4)
     fig.update_layout(
         autosize=True,
         plot_bgcolor="#0f172a",  # chart area
@@ -354,32 +674,30 @@ def create_investment_chart(df):
     return fig
 
 
-def create_budget_analysis(data):
-    trans_df = data['transacciones']
-    presup_df = data['presupuesto']
-    trans_df['Mes_Año_dt'] = pd.to_datetime(trans_df['Mes_Año'], format='%b-%Y')
-    presup_df['Mes_Año_dt'] = pd.to_datetime(presup_df['Mes_Año'], format='%b-%Y')
-    trans_f_df = trans_df[trans_df['Mes_Año_dt'] == trans_df['Mes_Año_dt'].max()]
-    presup_f_df = presup_df[presup_df['Mes_Año_dt'] == trans_df['Mes_Año_dt'].max()]
-    presup = presup_f_df.groupby(['Mes_Año', 'Categoria'])['Valor'].sum().to_frame()
-    presup = presup.rename(columns={"Valor": "Presupuesto"})
-    trans = trans_f_df.groupby(['Mes_Año', 'Categoria'])['Importe'].sum().to_frame()
-    trans = trans.rename(columns={"Importe": "Real"})
-    df = pd.merge(presup, trans, on=['Mes_Año', 'Categoria'])
-
-    max_date = trans_f_df['Mes_Año'].max()
-    # Resumen por categoría
-    budget_summary = (
-        df.groupby("Categoria")[["Presupuesto", "Real"]]
-        .sum()
-        .reset_index()
-    )
+@cached_figure('presupuesto', 0.48)
+def create_budget_analysis(data, period_from=None, period_to=None, how='inner', chart_height=None):
+    """
+    Presupuesto frente a real por categoría en un mes o rango (por defecto el último
+    mes con transacciones), con la desviación del rango y la acumulada en el año
+    """
+    import plotly.express as px
+    from aggregates import period_label
 
+    matrix = data.matriz_presupuesto
+    if matrix is None or data.presupuesto.empty:
+        return None
+    if period_from is None and period_to is None and data.last_period is not None:
+        period_from = period_to = data.last_period
+    budget_summary = matrix.frame(period_from, period_to, how)
+    if budget_summary.empty:
+        return None
 
-    fig1 = px.bar(budget_summary, x=['Presupuesto', 'Real'], y='Categoria', orientation='h', barmode= 'group', title=f'Cumplimiento del presupuesto por categoría')
+    lo, hi = matrix.bounds(period_from, period_to)
+    first, last = (period_label(matrix.periods[i]) for i in (lo, hi - 1))
+    title = f'Cumplimiento del presupuesto por categoría ({first}' + (f' a {last})' if last != first else ')')
+    fig1 = px.bar(budget_summary, x=['Presupuesto', 'Real'], y='Categoria', orientation='h', barmode='group',
+                  title=title, hover_data={'Desviación': ':,.2f', 'Desviación acumulada': ':,.2f'})
 
-    container_height = st.session_state.get("container_height", 800)
-    chart_height = int(container_height * 0.48)
     fig1.update_layout(
         autosize=True,
         plot_bgcolor="#0f172a",  # chart area
@@ -408,4 +726,167 @@ def create_budget_analysis(data):
     fig1.update_xaxes(title=None)
     fig1.update_yaxes(title=None)
 
-    return fig1
\ No newline at end of file
+    return fig1
+
+
+def create_projection_chart(table, chart_height):
+    """
+    Abanico de la proyección: bandas de percentiles 5-95 y 25-75 y la mediana
+    """
+    import plotly.graph_objects as go
+
+    fig = go.Figure(layout=dict(title='Proyección del patrimonio neto'))
+    bands = (('p95', 'p5', 'Percentiles 5-95', 'rgba(56, 189, 248, 0.15)'),
+             ('p75', 'p25', 'Percentiles 25-75', 'rgba(56, 189, 248, 0.35)'))
+    for upper, lower, name, color in bands:
+        fig.add_trace(go.Scatter(x=table['Fecha'], y=table[upper], mode='lines', line=dict(width=0),
+                                 showlegend=False, hoverinfo='skip', legendgroup=name))
+        fig.add_trace(go.Scatter(x=table['Fecha'], y=table[lower], mode='lines', line=dict(width=0),
+                                 fill='tonexty', fillcolor=color, name=name, legendgroup=name))
+    fig.add_trace(go.Scatter(x=table['Fecha'], y=table['p50'], mode='lines', name='Mediana',
+                             line=dict(color='#38bdf8')))
+    fig.update_layout(
+        autosize=True,
+        plot_bgcolor="#0f172a",  # chart area
+        paper_bgcolor="#0f172a",  # outer area
+        font=dict(color="white"),
+        height=chart_height,
+        title=dict(font=dict(color="white"), y=0.82, yanchor="top"),
+        legend=dict(orientation="h", yanchor="top", y=-0.2, xanchor="center", x=0.5, title=None,
+                    font=dict(color="white")),
+    )
+    fig.update_xaxes(title=None)
+    fig.update_yaxes(title=None)
+    return fig
+
+
+@timed()
+def run_projection(data, assumptions):
+    """
+    Simulación cacheada por datos e hipótesis: volver a un valor ya visto de los
+    controles no repite la simulación
+    """
+    from projection import project
+    cache = get_data_cache()
+    key = ('proyeccion', data.key, assumptions.key())
+    result = cache.get(key)
+    if result is None:
+        result = project(data, assumptions)
+        cache.put(key, result)
+    return result
+
+
+# Paneles del dashboard. Cada uno es un fragmento con sus datos como entrada explícita:
+# sus controles vuelven a ejecutar solo ese panel, no el resto de la página
+
+def select_period(periods, key):
+    """
+    Selector del mes evaluado (el más reciente primero). Devuelve el periodo entero
+    """
+    from aggregates import period_label
+    options = sorted({int(p) for p in periods}, reverse=True)
+    return st.selectbox("Fecha evaluada", options, format_func=period_label, key=key)
+
+
+@st.fragment
+def summary_panel(data):
+    if data.cubo is None:
+        return
+    period = select_period(data.cubo.periods, key=f'periodo_resumen_{data.widget_key}')
+    load_summary_kpis(data, period)
+    load_rolling_kpis(data, period)
+
+
+@st.fragment
+def transactions_panel(data):
+    fig1, fig2 = create_transactions_charts(data)
+    render_chart(fig1)
+    render_chart(fig2)
+
+
+def unapplied_filters_note(data, table, label):
+    """
+    Aviso bajo un panel cuando su tabla no tiene alguna de las dimensiones filtradas
+    """
+    dims = data.filtros_no_aplicados.get(table)
+    if dims:
+        names = {'Categoria': "Categoría"}
+        st.caption(f"{label} sin filtrar por {', '.join(names.get(dim, dim) for dim in dims)} "
+                   f"(no aplica a los datos de esta hoja)")
+
+
+@st.fragment
+def balance_panel(data):
+    render_chart(create_balance_chart(data))
+    unapplied_filters_note(data, 'saldos', "Saldos")
+    if data.serie_saldos is not None:
+        period = select_period(data.serie_saldos.periods, key=f'periodo_saldos_{data.widget_key}')
+        load_saldo_kpis(data, period)
+    render_chart(create_debt_chart(data))
+    unapplied_filters_note(data, 'deudas', "Deudas")
+
+
+@st.fragment
+def investments_panel(data):
+    if data.serie_inversiones is not None:
+        period = select_period(data.serie_inversiones.periods, key=f'periodo_inversiones_{data.widget_key}')
+        load_investment_kpis(data, period)
+    render_chart(create_investment_chart(data))
+    unapplied_filters_note(data, 'inversiones', "Inversiones")
+
+
+@st.fragment
+def budget_panel(data):
+    from aggregates import period_label
+
+    matrix = data.matriz_presupuesto
+    if matrix is None or data.presupuesto.empty:
+        return
+    # Todos los meses están ya calculados: cambiar el rango solo resta sumas acumuladas
+    periods = [int(p) for p in matrix.periods]
+    last = data.last_period if data.last_period is not None else periods[-1]
+    period_from = period_to = last
+    if len(periods) > 1:
+        period_from, period_to = st.select_slider("Meses del presupuesto", options=periods, value=(last, last),
+                                                  format_func=period_label, key=f'presupuesto_rango_{data.widget_key}')
+    how = 'outer' if st.toggle("Incluir categorías sin presupuesto", value=False,
+                               key=f'presupuesto_todas_{data.widget_key}') else 'inner'
+    render_chart(create_budget_analysis(data, period_from, period_to, how))
+
+
+@st.fragment
+def projection_panel(data):
+    from dataclasses import replace
+    from projection import assumptions_from_data
+
+    if data.serie_saldos is None and data.cubo is None:
+        return
+    # Solo se simula si se activa: la simulación tarda del orden de un segundo
+    if not st.toggle("🔮 Proyección del patrimonio", key=f'proyeccion_{data.widget_key}'):
+        return
+
+    base = assumptions_from_data(data)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        years = st.slider("Años", 1, 30, base.years, key=f'proyeccion_anos_{data.widget_key}')
+        paths = st.slider("Trayectorias", 1_000, 50_000, base.paths, step=1_000, key=f'proyeccion_tray_{data.widget_key}')
+    with col2:
+        savings_rate = st.slider("Tasa de ahorro (%)", -50.0, 90.0, float(round(base.savings_rate * 100, 1)),
+                                 step=0.5, key=f'proyeccion_ahorro_{data.widget_key}')
+        invested_share = st.slider("Ahorro invertido (%)", 0, 100, int(base.invested_share * 100), step=5,
+                                   key=f'proyeccion_invertido_{data.widget_key}')
+    with col3:
+        expected_return = st.slider("Rentabilidad anual (%)", -10.0, 20.0, float(round(base.expected_return * 100, 1)),
+                                    step=0.5, key=f'proyeccion_rent_{data.widget_key}')
+        volatility = st.slider("Volatilidad anual (%)", 0.0, 50.0, float(round(base.volatility * 100, 1)),
+                               step=0.5, key=f'proyeccion_vol_{data.widget_key}')
+
+    assumptions = replace(base, years=years, paths=paths, savings_rate=savings_rate / 100,
+                          invested_share=invested_share / 100, expected_return=expected_return / 100,
+                          volatility=volatility / 100)
+    table, negative = run_projection(data, assumptions)
+    container_height = st.session_state.get("container_height", 800)
+    render_chart(create_projection_chart(table, int(container_height * 0.45)))
+    final = table.iloc[-1]
+    st.caption(f"En {years} años: mediana €{final['p50']:,.0f} (entre €{final['p5']:,.0f} y €{final['p95']:,.0f} "
+               f"en el 90% de las trayectorias) · {negative:.1%} acaban con patrimonio negativo")
@@ -0,0 +1,136 @@
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cache import hash_bytes
+from model import FinanceData
+from profiling import span
+from store import load_snapshot, save_snapshot
+from utils import PARSER_VERSION, assemble_tables, process_workbook_sheets, read_file_bytes, workbook_key
+
+# Modos de unión: libros de distintos periodos (los solapes son la misma información)
+# o de distintas personas (todo se suma)
+MERGE_PERIODS = 'periodos'
+MERGE_MEMBERS = 'personas'
+
+# Claves que identifican un mismo stock en hojas de fotos mensuales: en modo periodos,
+# si dos libros traen el mismo stock en la misma fecha prevalece el de datos más recientes
+STOCK_KEYS = {
+    'Presupuesto': ['Cuenta', 'Categoria', 'Tipo', 'Fecha'],
+    'Activos': ['Nombre', 'Tipo de Cuenta', 'Fecha'],
+    'Deudas': ['Nombre', 'Tipo de Deuda', 'Fecha'],
+    'Inversiones': ['Tipo de Activo', 'Nombre', 'Categoría', 'Fecha'],
+}
+
+MAX_WORKERS = int(os.environ.get('DASHBOARD_MAX_WORKERS', os.cpu_count() or 1))
+
+_pool = None
+
+
+def get_pool():
+    """
+    Pool de procesos del servidor, creado una sola vez. Se usa 'spawn' porque
+    el proceso de Streamlit tiene hilos y hacer fork con hilos no es seguro
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def list_folder_workbooks(folder):
+    """
+    Libros Excel de una carpeta local, ordenados por nombre
+    """
+    paths = glob.glob(os.path.join(os.path.expanduser(folder), '*.xlsx'))
+    return sorted(path for path in paths if not os.path.basename(path).startswith('~$'))
+
+
+def _merge_transactions(frames):
+    """
+    Une transacciones de varios libros. Una misma fila repetida en varios libros
+    (meses solapados entre libros anuales) se cuenta una vez; las repeticiones
+    dentro de un mismo libro se conservan
+    """
+    frames = [df for df in frames if df is not None and not df.empty]
+    if len(frames) <= 1:
+        return frames[0] if frames else None
+
+    columns = list(dict.fromkeys(col for df in frames for col in df.columns))
+    numbered = [df.assign(_n=df.groupby(list(df.columns), dropna=False, observed=True).cumcount()) for df in frames]
+    merged = pd.concat(numbered, ignore_index=True).drop_duplicates(subset=columns + ['_n'])
+    return merged.drop(columns='_n').reset_index(drop=True)
+
+
+def _merge_stocks(sheet_name, frames):
+    frames = [df for df in frames if df is not None and not df.empty]
+    if len(frames) <= 1:
+        return frames[0] if frames else None
+
+    merged = pd.concat(frames, ignore_index=True)
+    keys = [col for col in STOCK_KEYS[sheet_name] if col in merged.columns]
+    return merged.drop_duplicates(subset=keys, keep='last').reset_index(drop=True)
+
+
+def _concat(frames):
+    frames = [df for df in frames if df is not None and not df.empty]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def merge_sheet_tables(workbooks, mode=MERGE_PERIODS):
+    """
+    Une las hojas normalizadas de varios libros y ensambla las tablas finales
+    """
+    # Los libros con datos más recientes van al final para prevalecer en los solapes
+    def latest_date(sheets):
+        dates = [df['Fecha'].max() for df in sheets.values() if df is not None and not df.empty]
+        return max(dates) if dates else pd.Timestamp.min
+
+    workbooks = sorted(workbooks, key=latest_date)
+
+    merged = {}
+    sheet_names = {name for sheets in workbooks for name in sheets}
+    for name in sorted(sheet_names):
+        frames = [sheets.get(name) for sheets in workbooks]
+        if mode == MERGE_MEMBERS:
+            merged[name] = _concat(frames)
+        elif name == 'Transacciones':
+            merged[name] = _merge_transactions(frames)
+        else:
+            merged[name] = _merge_stocks(name, frames)
+    return assemble_tables(merged)
+
+
+def load_workbooks(sources, mode=MERGE_PERIODS, cache=None, use_snapshots=True):
+    """
+    Carga varios libros (ficheros subidos o rutas) procesando cada uno en un proceso
+    distinto y los une en un único FinanceData. La unión se guarda como instantánea
+    con la huella del conjunto de libros y el modo
+    """
+    raws = [read_file_bytes(source) for source in sources]
+    key = hash_bytes(''.join(sorted(workbook_key(raw) for raw in raws)).encode(), f'{PARSER_VERSION}-{mode}')
+
+    def build():
+        if use_snapshots:
+            with span('cargar instantánea'):
+                tables = load_snapshot(key, PARSER_VERSION)
+            if tables is not None:
+                return FinanceData.from_tables(tables, key=key)
+
+        if len(raws) == 1:
+            workbooks = [process_workbook_sheets(raws[0])]
+        else:
+            with span('procesar libros en paralelo', libros=len(raws)):
+                workbooks = list(get_pool().map(process_workbook_sheets, raws))
+
+        with span('unir libros', modo=mode):
+            tables = merge_sheet_tables(workbooks, mode)
+        if use_snapshots and tables:
+            with span('guardar instantánea'):
+                save_snapshot(key, tables, PARSER_VERSION)
+        return FinanceData.from_tables(tables, key=key)
+
+    return build() if cache is None else cache.get_or_compute(key, build)